@@ -0,0 +1,151 @@
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import current_app, g, request
+
+ACCESS_LOGGER_NAME = 'canteen.access'
+
+
+class JsonFormatter(logging.Formatter):
+    """Render access-log records as one JSON object per line."""
+
+    def format(self, record):
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+        }
+        payload.update(getattr(record, 'access', {}))
+        return json.dumps(payload, default=str)
+
+
+class AccessLog:
+    """Sampled, structured access logging written from a background thread.
+
+    Request handlers only build a small dict and push it onto an in-memory
+    queue; formatting and I/O happen in a ``QueueListener`` thread, so a slow
+    stdout or log file never blocks a worker.  Bodies are only captured when
+    already buffered in memory and are cut to ``ACCESS_LOG_BODY_BYTES``;
+    streamed responses (``send_file``, generators) are never touched.
+    """
+
+    def __init__(self, app=None):
+        self.logger = logging.getLogger(ACCESS_LOGGER_NAME)
+        self.listener = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ACCESS_LOG_ENABLED', True)
+        app.config.setdefault('ACCESS_LOG_SAMPLE_RATE', 1.0)
+        app.config.setdefault('ACCESS_LOG_BODY_BYTES', 0)
+        app.config.setdefault('ACCESS_LOG_SLOW_MS', 500)
+        app.config.setdefault('ACCESS_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('ACCESS_LOG_FILE', None)
+
+        if not app.config['ACCESS_LOG_ENABLED']:
+            return
+
+        if self.listener is None:
+            self._start_listener(app)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['access_log'] = self
+
+    def _start_listener(self, app):
+        if app.config['ACCESS_LOG_FILE']:
+            handler = logging.FileHandler(app.config['ACCESS_LOG_FILE'])
+        else:
+            handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=app.config['ACCESS_LOG_QUEUE_SIZE'])
+        self.logger.handlers = [DroppingQueueHandler(log_queue)]
+        self.logger.setLevel(logging.INFO)
+        # Records must not also reach the root handlers synchronously
+        self.logger.propagate = False
+
+        self.listener = QueueListener(log_queue, handler, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _before_request(self):
+        g.access_log_start = time.perf_counter()
+
+    def _after_request(self, response):
+        start = g.pop('access_log_start', None)
+        if start is None:
+            return response
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        config = current_app.config
+        always = response.status_code >= 500 or duration_ms >= config['ACCESS_LOG_SLOW_MS']
+        if not always and random.random() >= config['ACCESS_LOG_SAMPLE_RATE']:
+            return response
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 3),
+            'request_bytes': request.content_length,
+            'response_bytes': response.content_length,
+            'remote_addr': request.remote_addr,
+        }
+
+        max_body = config['ACCESS_LOG_BODY_BYTES']
+        if max_body:
+            record['request_body'] = _request_body(max_body)
+            record['response_body'] = _response_body(response, max_body)
+
+        self.logger.info('access', extra={'access': record})
+        return response
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def prepare(self, record):
+        # The JSON formatter reads ``record.access`` directly; skip the default
+        # message pre-formatting done by QueueHandler.
+        return record
+
+
+def _request_body(max_body):
+    # Only JSON bodies are captured.  A body the view already read (get_json()
+    # caches it) or one within max_body is taken whole; otherwise at most
+    # max_body bytes are read from what is left of the stream, so an unread
+    # oversized body is never buffered just to be logged.
+    if not request.content_length or not request.is_json:
+        return None
+    cached = getattr(request, '_cached_data', None)
+    if cached is not None or request.content_length <= max_body:
+        body = request.get_data(cache=True)
+    else:
+        body = request.stream.read(max_body)
+    return body[:max_body].decode('utf-8', 'replace')
+
+
+def _response_body(response, max_body):
+    if response.is_streamed or response.direct_passthrough:
+        return None
+    return response.get_data()[:max_body].decode('utf-8', 'replace')
@@ -1,23 +1,50 @@
 import os
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import (Flask, Blueprint, current_app, request, jsonify, send_file, render_template,
+                   stream_with_context)
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
-import qrcode
-from io import BytesIO
-import uuid
-import json
+from flask_migrate import Migrate
+from flask_jwt_extended import (JWTManager, create_access_token, current_user, jwt_required,
+                                verify_jwt_in_request)
+from datetime import datetime, timedelta, timezone
+import hmac
 import logging
+import queue
 import sys
-from sqlalchemy import text
+from sqlalchemy import or_, text
+from sqlalchemy.orm import selectinload
 import time
+from functools import wraps
 
-from models import db, User, MenuItem, MealPlan, Transaction, MealConsumption
+from config import Config
+from models import (db, User, MenuItem, MealPlan, Transaction, MealConsumption, LedgerEntry,
+                    StockReservation)
+from sqlite_tuning import configure_sqlite, engine_options
+from access_log import AccessLog
+from pagination import InvalidCursor, keyset_paginate, page_args
+from menu_cache import MenuCache
+from menu_search import MAX_RESULTS, menu_search
+from eligibility import MEAL_TYPES, active_plan, eligibility
+from forecasting import forecaster
+from qr_tokens import (MealItemLookup, ReplayCache, VerificationError, current_token,
+                       rotate_token, sync_scans, verify_meal)
+from qr_images import ERROR_CORRECTION_LEVELS, QRImageCache, RendererBusy, image_etag
+from scheduler import PeriodicJob
+import commands
+import menu_io
+import exports
+from checkout import CheckoutError, checkout, parse_cart
+from identity import current_user_id, init_jwt, user_cache
+from password_hashing import HasherBusy, PasswordHasher
+import wallet
+import stock
+from user_directory import SearchSuperseded, user_directory
+import stats
+import rollups
+import events
+from metrics import metrics
 
-# Configure logging to show more details
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(sys.stdout)
@@ -25,38 +52,102 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-# Configure CORS to accept requests from your Flutter app
-CORS(app, resources={
-    r"/api/*": {
-        "origins": ["http://localhost:3000", "http://localhost:5000", "http://127.0.0.1:5000"],
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
-        "supports_credentials": True
-    }
-})
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///canteen.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'super-secret-key')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-
-jwt = JWTManager(app)
-db.init_app(app)
-
-@app.before_request
-def log_request_info():
-    logger.debug('Headers: %s', dict(request.headers))
-    logger.debug('Body: %s', request.get_data())
-
-@app.after_request
-def after_request(response):
-    logger.debug('Response: %s', response.get_data())
-    return response
+jwt = JWTManager()
+migrate = Migrate()
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+access_log = AccessLog()
+# Reconciled at startup too: a database upgraded from before the counters
+# existed has an empty stat_counters table until the first run
+stats_job = PeriodicJob('reconcile-stats', 0, stats.reconcile, run_at_start=True)
+events_job = PeriodicJob('poll-events', 0, events.broker.poll)
+rollup_job = PeriodicJob('rollup', 0, rollups.run)
+stock_job = PeriodicJob('release-stock', 0, stock.release_expired)
+api = Blueprint('api', __name__)
+
+def create_app(config=None):
+    """Build the Flask application.
+
+    ``config`` is an optional mapping applied on top of :class:`config.Config`,
+    e.g. ``create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})``.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+    # Configure CORS to accept requests from your Flutter app
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": ["http://localhost:3000", "http://localhost:5000", "http://127.0.0.1:5000"],
+            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization"],
+            "supports_credentials": True
+        }
+    })
+
+    jwt.init_app(app)
+    init_jwt(jwt)
+    user_cache.init_app(app)
+    password_hasher.init_app(app)
+    eligibility.init_app(app)
+    db.init_app(app)
+    # Batch mode lets Alembic alter SQLite tables by copying them
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
+    metrics.init_app(app)
+    access_log.init_app(app)
+    menu_cache.init_app(app)
+    replay_cache.ttl = app.config['QR_TOKEN_TTL_SECONDS']
+    replay_cache.maxsize = app.config['QR_REPLAY_CACHE_SIZE']
+    qr_images.init_app(app)
+    events.broker.init_app(app)
+    with app.app_context():
+        configure_sqlite(app, db.engine)
+        metrics.init_engine(db.engine)
+    user_directory.init_app(app)
+    menu_search.init_app(app)
+    forecaster.init_app(app)
+
+    app.register_blueprint(api)
+    commands.init_app(app)
+    return app
+
+def start_background_jobs(app):
+    """Start the periodic maintenance jobs; only for an app that serves requests.
+
+    Called from ``wsgi.py`` (once per gunicorn worker) and the development
+    server, so CLI commands, scripts and tests that build an app do not
+    leave job threads running.
+    """
+    stats_job.interval = app.config['STATS_RECONCILE_INTERVAL']
+    stats_job.start(app)
+    events_job.interval = app.config['EVENTS_POLL_INTERVAL']
+    events_job.start(app)
+    rollup_job.interval = app.config['ROLLUP_INTERVAL']
+    rollup_job.start(app)
+    stock_job.interval = app.config['STOCK_SWEEP_INTERVAL']
+    stock_job.start(app)
+
+def admin_required(view):
+    """``jwt_required`` plus a check that the caller has the admin role."""
+    @wraps(view)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        # current_user comes from the identity cache, not a query
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
 # Authentication routes
-@app.route('/api/auth/login', methods=['POST'])
+password_hasher = PasswordHasher()
+
+def busy_response():
+    response = jsonify({'message': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+@api.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -64,10 +155,25 @@ def login():
     
     user = User.query.filter_by(username=username).first()
     
-    if not user or not check_password_hash(user.password_hash, password):
+    try:
+        valid = user is not None and password_hasher.verify(user.password_hash, password)
+    except HasherBusy:
+        return busy_response()
+    if valid and password_hasher.needs_rehash(user.password_hash):
+        # Cost parameters changed since this hash was made; upgrade it
+        # now that the plaintext is at hand (no token version bump).  The
+        # upgrade is optional: when the pool is busy, a later login does it.
+        try:
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
+            password_hasher.record_rehash()
+        except HasherBusy:
+            pass
+    password_hasher.record_login(valid)
+    if not valid:
         return jsonify({'message': 'Invalid credentials'}), 401
     
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=user)
     return jsonify({
         'access_token': access_token,
         'user': {
@@ -75,11 +181,13 @@ def login():
             'username': user.username,
             'email': user.email,
             'name': user.name,
-            'role': user.role
+            'full_name': user.name,
+            'role': user.role,
+            'balance': wallet.from_minor(wallet.balance(user.id))
         }
     }), 200
 
-@app.route('/api/auth/register', methods=['POST'])
+@api.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
     
@@ -101,12 +209,15 @@ def register():
         name=name,
         role='user'
     )
-    user.set_password(data['password'])
+    try:
+        user.set_password_hash(password_hasher.hash(data['password']))
+    except HasherBusy:
+        return busy_response()
     
     db.session.add(user)
     db.session.commit()
     
-    access_token = create_access_token(identity=user.id)
+    access_token = create_access_token(identity=user)
     return jsonify({
         'access_token': access_token,
         'user': {
@@ -119,36 +230,137 @@ def register():
     }), 201
 
 # Menu endpoints
-@app.route('/api/menu', methods=['GET'])
+def load_menu():
+    return [item.to_dict() for item in MenuItem.query.all()]
+
+menu_cache = MenuCache(load_menu)
+
+@api.route('/api/menu', methods=['GET'])
 @jwt_required()
 def get_menu():
     try:
-        menu_items = MenuItem.query.all()
-        return jsonify([item.to_dict() for item in menu_items])
+        body, etag = menu_cache.get()
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        # Clients may keep the menu but must revalidate it on every poll
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error fetching menu: {str(e)}")
         return jsonify({'error': 'Failed to fetch menu'}), 500
 
-@app.route('/api/menu', methods=['POST'])
+@api.route('/api/menu/search', methods=['GET'])
+@jwt_required()
+def search_menu():
+    """Ranked full-text search (``q``) or one category of the menu.
+
+    Without ``q`` the response comes from the per-category grouping and
+    carries an ETag, like ``GET /api/menu``.
+    """
+    q = (request.args.get('q') or '').strip()
+    category = request.args.get('category') or None
+    available = request.args.get('available')
+    if available is not None:
+        value = available.strip().lower()
+        if value not in menu_io.TRUE_VALUES | menu_io.FALSE_VALUES:
+            return jsonify({'error': 'available must be true or false'}), 400
+        available = value in menu_io.TRUE_VALUES
+    try:
+        if q:
+            limit = max(1, min(request.args.get('limit', 50, type=int) or 50, MAX_RESULTS))
+            items = menu_search.search(q, category, available, limit)
+            return jsonify({'items': items, 'total': len(items)})
+
+        body, etag = menu_search.category(category, available)
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
+    except Exception as e:
+        logger.error(f"Error searching menu: {str(e)}")
+        return jsonify({'error': 'Failed to search menu'}), 500
+
+@api.route('/api/menu/categories', methods=['GET'])
+@jwt_required()
+def get_menu_categories():
+    try:
+        return jsonify({'categories': menu_search.categories()})
+    except Exception as e:
+        logger.error(f"Error fetching menu categories: {str(e)}")
+        return jsonify({'error': 'Failed to fetch menu categories'}), 500
+
+@api.route('/api/menu', methods=['POST'])
 @jwt_required()
 def add_menu_item():
     try:
         data = request.get_json()
+        item_stock = stock.parse_stock(data.get('stock'))
+        if item_stock is not None and current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
         new_item = MenuItem(
             name=data['name'],
             description=data['description'],
             price=data['price'],
             category=data['category'],
-            is_available=data.get('is_available', True)
+            is_available=data.get('is_available', item_stock != 0),
+            stock=item_stock
         )
         db.session.add(new_item)
         db.session.commit()
+        menu_cache.invalidate()
         return jsonify(new_item.to_dict()), 201
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error adding menu item: {str(e)}")
         return jsonify({'error': 'Failed to add menu item'}), 500
 
-@app.route('/api/menu/<int:item_id>', methods=['PUT'])
+@api.route('/api/menu/bulk', methods=['POST'])
+@admin_required
+def bulk_import_menu():
+    try:
+        rows = menu_io.read_import_rows(request)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    skip_invalid = request.args.get('skip_invalid', 'false').lower() in menu_io.TRUE_VALUES
+    mappings, errors = [], []
+    for index, row in enumerate(rows):
+        mapping, row_errors = menu_io.validate_row(row)
+        if row_errors:
+            errors.append({'row': index, 'errors': row_errors})
+        else:
+            mappings.append(mapping)
+
+    if errors and not skip_invalid:
+        return jsonify({'imported': 0, 'errors': errors}), 422
+
+    try:
+        # One executemany INSERT and a single commit for the whole batch
+        db.session.bulk_insert_mappings(MenuItem, mappings)
+        db.session.commit()
+        menu_cache.invalidate()
+        return jsonify({'imported': len(mappings), 'errors': errors}), 201
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error importing menu items: {str(e)}")
+        return jsonify({'error': 'Failed to import menu items'}), 500
+
+@api.route('/api/menu/export', methods=['GET'])
+@admin_required
+def export_menu():
+    export_format = request.args.get('format', 'csv')
+    if export_format == 'csv':
+        body, mimetype = menu_io.export_csv(menu_io.export_rows()), 'text/csv'
+    elif export_format == 'ndjson':
+        body, mimetype = menu_io.export_ndjson(menu_io.export_rows()), 'application/x-ndjson'
+    else:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    response = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=menu.{export_format}'
+    return response
+
+@api.route('/api/menu/<int:item_id>', methods=['PUT'])
 @jwt_required()
 def update_menu_item(item_id):
     try:
@@ -158,56 +370,406 @@ def update_menu_item(item_id):
         item.description = data.get('description', item.description)
         item.price = data.get('price', item.price)
         item.category = data.get('category', item.category)
+        if 'stock' in data:
+            if current_user.role != 'admin':
+                return jsonify({'error': 'Admin access required'}), 403
+            # Sets the portions left; restocking makes the item available
+            # again and a count of zero sells it out
+            stock.set_stock(item, stock.parse_stock(data['stock']))
         item.is_available = data.get('is_available', item.is_available)
         db.session.commit()
+        menu_cache.invalidate()
         return jsonify(item.to_dict())
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error updating menu item: {str(e)}")
         return jsonify({'error': 'Failed to update menu item'}), 500
 
-@app.route('/api/menu/<int:item_id>', methods=['DELETE'])
+@api.route('/api/menu/<int:item_id>', methods=['DELETE'])
 @jwt_required()
 def delete_menu_item(item_id):
     try:
         item = MenuItem.query.get_or_404(item_id)
         db.session.delete(item)
         db.session.commit()
+        menu_cache.invalidate()
         return '', 204
     except Exception as e:
         logger.error(f"Error deleting menu item: {str(e)}")
         return jsonify({'error': 'Failed to delete menu item'}), 500
 
 # Transaction endpoints
-@app.route('/api/transactions', methods=['GET'])
+# Values sent by the transactions.html filters, mapped to stored column values
+TRANSACTION_TYPE_FILTERS = {
+    'meal': ['meal'],
+    'recharge': ['recharge'],
+    'extra': ['extra', 'extra_item'],
+}
+TRANSACTION_STATUS_FILTERS = {
+    'success': ['success', 'completed'],
+    'pending': ['pending'],
+    'failed': ['failed'],
+}
+
+def transaction_date_bounds(args, now=None):
+    """Translate the ``date_range`` filter into a ``(start, end)`` pair of UTC datetimes."""
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    date_range = args.get('date_range', 'all')
+    if date_range == 'today':
+        return today, None
+    if date_range == 'week':
+        return today - timedelta(days=today.weekday()), None
+    if date_range == 'month':
+        return today.replace(day=1), None
+    if date_range == 'custom':
+        start = args.get('start_date')
+        end = args.get('end_date')
+        return (datetime.fromisoformat(start) if start else None,
+                datetime.fromisoformat(end) if end else None)
+    return None, None
+
+def filtered_transactions_query(user_id, args):
+    query = db.session.query(Transaction, User.name).join(User, Transaction.user_id == User.id)
+    if user_id is not None:
+        query = query.filter(Transaction.user_id == user_id)
+
+    tx_type = args.get('type', 'all')
+    if tx_type != 'all':
+        query = query.filter(Transaction.transaction_type.in_(TRANSACTION_TYPE_FILTERS.get(tx_type, [tx_type])))
+
+    status = args.get('status', 'all')
+    if status != 'all':
+        query = query.filter(Transaction.status.in_(TRANSACTION_STATUS_FILTERS.get(status, [status])))
+
+    start, end = transaction_date_bounds(args)
+    if start is not None:
+        query = query.filter(Transaction.created_at >= start)
+    if end is not None:
+        query = query.filter(Transaction.created_at < end)
+
+    search = (args.get('search') or '').strip()
+    if search:
+        if search.isdigit():
+            query = query.filter(Transaction.id == int(search))
+        else:
+            # Prefix match on the user's username or display name
+            pattern = search.replace('%', r'\%').replace('_', r'\_') + '%'
+            query = query.filter(or_(User.username.like(pattern, escape='\\'),
+                                     User.name.like(pattern, escape='\\')))
+    return query
+
+@api.route('/api/transactions', methods=['GET'])
 @jwt_required()
 def get_transactions():
     try:
-        user_id = get_jwt_identity()
-        transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.created_at.desc()).all()
-        return jsonify([t.to_dict() for t in transactions])
+        # Admins see every transaction, everyone else only their own
+        scope = None if current_user.role == 'admin' else current_user.id
+
+        page, per_page, cursor = page_args(request.args)
+        query = filtered_transactions_query(scope, request.args)
+        rows, pagination = keyset_paginate(query, Transaction.created_at, Transaction.id,
+                                           page, per_page, cursor)
+
+        transactions = []
+        for transaction, user_name in rows:
+            item = transaction.to_dict()
+            item['user_name'] = user_name
+            item['timestamp'] = item['created_at']
+            transactions.append(item)
+        return jsonify({'transactions': transactions, 'pagination': pagination})
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
     except Exception as e:
         logger.error(f"Error fetching transactions: {str(e)}")
         return jsonify({'error': 'Failed to fetch transactions'}), 500
 
-@app.route('/api/transactions/<int:transaction_id>', methods=['GET'])
+@api.route('/api/transactions/<int:transaction_id>', methods=['GET'])
 @jwt_required()
 def get_transaction(transaction_id):
     try:
         transaction = Transaction.query.get_or_404(transaction_id)
-        if transaction.user_id != get_jwt_identity():
+        if transaction.user_id != current_user_id():
             return jsonify({'error': 'Unauthorized'}), 403
         return jsonify(transaction.to_dict())
     except Exception as e:
         logger.error(f"Error fetching transaction: {str(e)}")
         return jsonify({'error': 'Failed to fetch transaction'}), 500
 
+# Checkout
+@api.route('/api/checkout', methods=['POST'])
+@jwt_required()
+def create_checkout():
+    data = request.get_json(silent=True) or {}
+    idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if idempotency_key is not None and not 1 <= len(str(idempotency_key)) <= 100:
+        return jsonify({'error': 'Idempotency key must be 1-100 characters'}), 400
+    try:
+        quantities, expected_prices = parse_cart(data)
+        transaction, replayed = checkout(current_user_id(), quantities, expected_prices,
+                                         idempotency_key and str(idempotency_key))
+        body = transaction.to_dict()
+        body['items'] = [{'menu_item_id': item_id, 'quantity': quantity}
+                         for item_id, quantity in sorted(quantities.items())]
+        response = jsonify(body)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response, 200
+        return response, 201
+    except CheckoutError as e:
+        payload = {'error': e.message}
+        if e.details:
+            payload.update(e.details)
+        return jsonify(payload), e.status_code
+    except Exception as e:
+        logger.error(f"Error during checkout: {str(e)}")
+        return jsonify({'error': 'Checkout failed'}), 500
+
+@api.route('/api/cart/reservation', methods=['PUT'])
+@jwt_required()
+def reserve_cart():
+    """Hold the cart's stock-tracked portions until checkout, replacing any earlier hold."""
+    try:
+        quantities, _ = parse_cart(request.get_json(silent=True) or {})
+        held, expires_at = stock.reserve(current_user_id(), quantities,
+                                         current_app.config['STOCK_RESERVATION_TTL'])
+        db.session.commit()
+        return jsonify({
+            'items': [{'menu_item_id': item_id, 'quantity': quantity}
+                      for item_id, quantity in held.items()],
+            'expires_at': expires_at.isoformat()
+        })
+    except CheckoutError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except stock.OutOfStock as e:
+        db.session.rollback()
+        return jsonify({'error': 'Not enough stock', 'menu_item_ids': e.menu_item_ids,
+                        'remaining': e.remaining}), 409
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error reserving cart: {str(e)}")
+        return jsonify({'error': 'Failed to reserve cart'}), 500
+
+@api.route('/api/cart/reservation', methods=['DELETE'])
+@jwt_required()
+def release_cart():
+    try:
+        stock.release(StockReservation.user_id == current_user_id())
+        db.session.commit()
+        return '', 204
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error releasing cart reservation: {str(e)}")
+        return jsonify({'error': 'Failed to release cart reservation'}), 500
+
+# Meal verification (QR scan at the counter)
+MAX_SCAN_BATCH = 500
+replay_cache = ReplayCache()
+meal_items = MealItemLookup(menu_cache)
+
+@api.route('/api/meal/verify', methods=['POST'])
+@admin_required
+def verify_meal_scan():
+    data = request.get_json(silent=True) or {}
+    qr_uuid = data.get('qr_uuid')
+    meal_type = data.get('meal_type')
+    if not qr_uuid or meal_type not in MEAL_TYPES:
+        return jsonify({'error': 'qr_uuid and a valid meal_type are required'}), 400
+    try:
+        result = verify_meal(qr_uuid, meal_type, replay_cache, meal_items, eligibility,
+                             require_plan=current_app.config['MEAL_PLAN_REQUIRED'])
+        # A redeemed token is never displayed again
+        qr_images.evict(qr_uuid)
+        return jsonify({'status': 'verified', 'meal_type': meal_type, **result}), 200
+    except VerificationError as e:
+        return jsonify({'error': e.message}), e.status_code
+    except Exception as e:
+        logger.error(f"Error verifying meal: {str(e)}")
+        return jsonify({'error': 'Failed to verify meal'}), 500
+
+@api.route('/api/meal/verify/batch', methods=['POST'])
+@admin_required
+def sync_meal_scans():
+    """Reconcile scans a counter captured offline; one result per scan, in order."""
+    data = request.get_json(silent=True) or {}
+    scans = data.get('scans')
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'error': 'scans (a list of scans) is required'}), 400
+    if len(scans) > MAX_SCAN_BATCH:
+        return jsonify({'error': f'At most {MAX_SCAN_BATCH} scans per request'}), 400
+    try:
+        results = sync_scans(scans, replay_cache, meal_items, eligibility,
+                             require_plan=current_app.config['MEAL_PLAN_REQUIRED'])
+        counts = {'verified': 0, 'duplicate': 0, 'rejected': 0}
+        for result in results:
+            counts[result['status']] += 1
+            if result['status'] == 'verified':
+                qr_images.evict(result['qr_uuid'])
+        return jsonify({'results': results, **counts}), 200
+    except Exception as e:
+        logger.error(f"Error syncing offline scans: {str(e)}")
+        return jsonify({'error': 'Failed to sync scans'}), 500
+
+# QR code images
+qr_images = QRImageCache()
+
+def qr_code_response(user_id):
+    box_size = request.args.get('box_size', 10, type=int)
+    error_correction = request.args.get('error_correction', 'M').upper()
+    if not 1 <= box_size <= 20 or error_correction not in ERROR_CORRECTION_LEVELS:
+        return jsonify({'error': 'box_size must be 1-20 and error_correction one of L, M, Q, H'}), 400
+
+    token = current_token(user_id, current_app.config['QR_TOKEN_TTL_SECONDS'])
+    max_age = max(int((token.expires_at - datetime.utcnow()).total_seconds()), 0)
+
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'qr_uuid': token.token,
+            'user_id': user_id,
+            'expires_at': token.expires_at.isoformat(),
+            'expires_in': max_age
+        })
+
+    etag = image_etag(token.token, box_size, error_correction)
+    # Answer revalidation before rendering anything
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        png = qr_images.get(token.token, box_size, error_correction)
+        response = current_app.response_class(png, mimetype='image/png')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={max_age}'
+    return response
+
+@api.route('/api/qrcode', methods=['GET'])
+@jwt_required()
+def get_qr_code():
+    try:
+        return qr_code_response(current_user_id())
+    except RendererBusy:
+        return jsonify({'error': 'QR renderer busy, try again'}), 503
+    except Exception as e:
+        logger.error(f"Error generating QR code: {str(e)}")
+        return jsonify({'error': 'Failed to generate QR code'}), 500
+
+@api.route('/api/qrcode/<int:user_id>', methods=['GET'])
+@jwt_required()
+def get_user_qr_code(user_id):
+    try:
+        if user_id != current_user.id and current_user.role != 'admin':
+            return jsonify({'error': 'Unauthorized'}), 403
+        if user_cache.get(user_id) is None:
+            return jsonify({'error': 'User not found'}), 404
+        return qr_code_response(user_id)
+    except RendererBusy:
+        return jsonify({'error': 'QR renderer busy, try again'}), 503
+    except Exception as e:
+        logger.error(f"Error generating QR code: {str(e)}")
+        return jsonify({'error': 'Failed to generate QR code'}), 500
+
+@api.route('/api/qrcode/regenerate', methods=['POST'])
+@jwt_required()
+def regenerate_qr_code():
+    try:
+        user_id = current_user_id()
+        token, revoked = rotate_token(user_id, current_app.config['QR_TOKEN_TTL_SECONDS'])
+        for old_token in revoked:
+            qr_images.evict(old_token)
+        return jsonify({
+            'qr_uuid': token.token,
+            'user_id': user_id,
+            'expires_at': token.expires_at.isoformat()
+        }), 201
+    except Exception as e:
+        logger.error(f"Error regenerating QR code: {str(e)}")
+        return jsonify({'error': 'Failed to regenerate QR code'}), 500
+
+# Meal history
+@api.route('/api/meals/history', methods=['GET'])
+@jwt_required()
+def get_meal_history():
+    try:
+        page, per_page, cursor = page_args(request.args)
+        # selectinload fetches every menu item on the page in one extra query,
+        # instead of one lazy load per consumption in to_dict()
+        query = (MealConsumption.query
+                 .filter(MealConsumption.user_id == current_user_id())
+                 .options(selectinload(MealConsumption.menu_item)))
+        rows, pagination = keyset_paginate(query, MealConsumption.consumed_at, MealConsumption.id,
+                                           page, per_page, cursor)
+        return jsonify({'meals': [meal.to_dict() for meal in rows], 'pagination': pagination})
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error fetching meal history: {str(e)}")
+        return jsonify({'error': 'Failed to fetch meal history'}), 500
+
+# Wallet
+@api.route('/api/balance', methods=['GET'])
+@jwt_required()
+def get_balance():
+    try:
+        balance_minor = wallet.balance(current_user_id())
+        return jsonify({'balance': wallet.from_minor(balance_minor), 'balance_minor': balance_minor})
+    except Exception as e:
+        logger.error(f"Error fetching balance: {str(e)}")
+        return jsonify({'error': 'Failed to fetch balance'}), 500
+
+@api.route('/api/balance/add', methods=['POST'])
+@admin_required
+def add_balance():
+    """Recharge ``user_id``'s wallet by ``amount`` rupees, paid at the counter (admin)."""
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id')
+    if not isinstance(user_id, int) or isinstance(user_id, bool):
+        return jsonify({'error': 'user_id is required'}), 400
+    if user_cache.get(user_id) is None:
+        return jsonify({'error': 'User not found'}), 404
+    try:
+        if isinstance(data.get('amount'), bool):
+            raise ValueError('amount must be a number')
+        amount_minor = wallet.to_minor(data.get('amount'))
+    except ValueError:
+        return jsonify({'error': 'amount must be a number'}), 400
+    max_minor = wallet.to_minor(current_app.config['WALLET_MAX_RECHARGE'])
+    if not 0 < amount_minor <= max_minor:
+        return jsonify({'error': f"amount must be between 0.01 and {current_app.config['WALLET_MAX_RECHARGE']:g}"}), 400
+    try:
+        transaction, balance_minor = wallet.recharge(user_id, amount_minor)
+        return jsonify({'balance': wallet.from_minor(balance_minor), 'balance_minor': balance_minor,
+                        'transaction': transaction.to_dict()})
+    except wallet.WalletConflict:
+        return jsonify({'error': 'Balance changed concurrently, please retry'}), 409
+    except Exception as e:
+        logger.error(f"Error adding balance: {str(e)}")
+        return jsonify({'error': 'Failed to add balance'}), 500
+
+@api.route('/api/balance/history', methods=['GET'])
+@jwt_required()
+def get_balance_history():
+    """The user's ledger entries, newest first; paginated like ``/api/transactions``."""
+    try:
+        page, per_page, cursor = page_args(request.args)
+        query = LedgerEntry.query.filter(LedgerEntry.user_id == current_user_id())
+        entries, pagination = keyset_paginate(query, LedgerEntry.created_at, LedgerEntry.id,
+                                              page, per_page, cursor)
+        return jsonify({'entries': [entry.to_dict() for entry in entries], 'pagination': pagination})
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error fetching balance history: {str(e)}")
+        return jsonify({'error': 'Failed to fetch balance history'}), 500
+
 # Meal Plan endpoints
-@app.route('/api/meal-plan', methods=['GET'])
+MAX_ELIGIBILITY_BATCH = 1000
+
+@api.route('/api/meal-plan', methods=['GET'])
 @jwt_required()
 def get_meal_plan():
     try:
-        user_id = get_jwt_identity()
-        meal_plan = MealPlan.query.filter_by(user_id=user_id).first()
+        meal_plan = active_plan(current_user_id())
         if not meal_plan:
             return jsonify({'error': 'No meal plan found'}), 404
         return jsonify(meal_plan.to_dict())
@@ -215,17 +777,20 @@ def get_meal_plan():
         logger.error(f"Error fetching meal plan: {str(e)}")
         return jsonify({'error': 'Failed to fetch meal plan'}), 500
 
-@app.route('/api/meal-plan', methods=['POST'])
+@api.route('/api/meal-plan', methods=['POST'])
 @jwt_required()
 def create_meal_plan():
     try:
-        user_id = get_jwt_identity()
+        user_id = current_user_id()
         data = request.get_json()
         meal_plan = MealPlan(
             user_id=user_id,
             plan_type=data['plan_type'],
             start_date=datetime.fromisoformat(data['start_date']),
-            end_date=datetime.fromisoformat(data['end_date'])
+            end_date=datetime.fromisoformat(data['end_date']),
+            breakfast_allowed=bool(data.get('breakfast_allowed', True)),
+            lunch_allowed=bool(data.get('lunch_allowed', True)),
+            dinner_allowed=bool(data.get('dinner_allowed', True))
         )
         db.session.add(meal_plan)
         db.session.commit()
@@ -234,29 +799,32 @@ def create_meal_plan():
         logger.error(f"Error creating meal plan: {str(e)}")
         return jsonify({'error': 'Failed to create meal plan'}), 500
 
-@app.route('/api/meal-plan/<int:plan_id>', methods=['PUT'])
+@api.route('/api/meal-plan/<int:plan_id>', methods=['PUT'])
 @jwt_required()
 def update_meal_plan(plan_id):
     try:
         meal_plan = MealPlan.query.get_or_404(plan_id)
-        if meal_plan.user_id != get_jwt_identity():
+        if meal_plan.user_id != current_user_id():
             return jsonify({'error': 'Unauthorized'}), 403
         data = request.get_json()
         meal_plan.plan_type = data.get('plan_type', meal_plan.plan_type)
         meal_plan.start_date = datetime.fromisoformat(data.get('start_date', meal_plan.start_date.isoformat()))
         meal_plan.end_date = datetime.fromisoformat(data.get('end_date', meal_plan.end_date.isoformat()))
+        for field in ('breakfast_allowed', 'lunch_allowed', 'dinner_allowed'):
+            if field in data:
+                setattr(meal_plan, field, bool(data[field]))
         db.session.commit()
         return jsonify(meal_plan.to_dict())
     except Exception as e:
         logger.error(f"Error updating meal plan: {str(e)}")
         return jsonify({'error': 'Failed to update meal plan'}), 500
 
-@app.route('/api/meal-plan/<int:plan_id>', methods=['DELETE'])
+@api.route('/api/meal-plan/<int:plan_id>', methods=['DELETE'])
 @jwt_required()
 def delete_meal_plan(plan_id):
     try:
         meal_plan = MealPlan.query.get_or_404(plan_id)
-        if meal_plan.user_id != get_jwt_identity():
+        if meal_plan.user_id != current_user_id():
             return jsonify({'error': 'Unauthorized'}), 403
         db.session.delete(meal_plan)
         db.session.commit()
@@ -265,8 +833,282 @@ def delete_meal_plan(plan_id):
         logger.error(f"Error deleting meal plan: {str(e)}")
         return jsonify({'error': 'Failed to delete meal plan'}), 500
 
+@api.route('/api/meal-plans/eligibility', methods=['POST'])
+@admin_required
+def check_meal_plan_eligibility():
+    """Which of ``user_ids`` hold a plan covering ``meal_type`` at ``at`` (default: now)."""
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    meal_type = data.get('meal_type')
+    if (not isinstance(user_ids, list) or not user_ids
+            or not all(isinstance(user_id, int) and not isinstance(user_id, bool)
+                       for user_id in user_ids)
+            or meal_type not in MEAL_TYPES):
+        return jsonify({'error': 'user_ids (a list of ids) and a valid meal_type are required'}), 400
+    if len(user_ids) > MAX_ELIGIBILITY_BATCH:
+        return jsonify({'error': f'At most {MAX_ELIGIBILITY_BATCH} user_ids per request'}), 400
+    try:
+        at = datetime.fromisoformat(data['at']) if data.get('at') else datetime.utcnow()
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'at must be an ISO 8601 timestamp'}), 400
+    try:
+        plans = eligibility.check_many(user_ids, meal_type, at)
+        return jsonify({
+            'meal_type': meal_type,
+            'at': at.isoformat(),
+            'results': [{'user_id': user_id, 'eligible': plan_id is not None, 'meal_plan_id': plan_id}
+                        for user_id, plan_id in plans.items()]
+        })
+    except Exception as e:
+        logger.error(f"Error checking meal plan eligibility: {str(e)}")
+        return jsonify({'error': 'Failed to check eligibility'}), 500
+
+# User directory (admin)
+@api.route('/api/users', methods=['GET'])
+@admin_required
+def list_users():
+    try:
+        users, pagination = user_directory.list_users(request.args, current_user.id)
+        return jsonify({'users': users, 'pagination': pagination})
+    except SearchSuperseded:
+        # The admin typed on; the newer request carries the results
+        return jsonify({'error': 'Superseded by a newer search'}), 409
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error listing users: {str(e)}")
+        return jsonify({'error': 'Failed to list users'}), 500
+
+@api.route('/api/users/<int:user_id>', methods=['GET'])
+@admin_required
+def get_user(user_id):
+    try:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return jsonify({'error': 'User not found'}), 404
+        entry = user_directory.entries([user])[0]
+        entry['meal_plans'] = [plan.to_dict() for plan in
+                               MealPlan.query.filter_by(user_id=user_id)
+                               .order_by(MealPlan.start_date.desc())]
+        return jsonify(entry)
+    except Exception as e:
+        logger.error(f"Error fetching user: {str(e)}")
+        return jsonify({'error': 'Failed to fetch user'}), 500
+
+# Admin statistics
+@api.route('/api/admin/transactions/stats', methods=['GET'])
+@admin_required
+def get_transaction_stats():
+    try:
+        return jsonify(stats.transaction_stats(stats.read_counters()))
+    except Exception as e:
+        logger.error(f"Error fetching transaction stats: {str(e)}")
+        return jsonify({'error': 'Failed to fetch transaction stats'}), 500
+
+@api.route('/api/admin/users/stats', methods=['GET'])
+@admin_required
+def get_user_stats():
+    try:
+        return jsonify(stats.user_stats(stats.read_counters()))
+    except Exception as e:
+        logger.error(f"Error fetching user stats: {str(e)}")
+        return jsonify({'error': 'Failed to fetch user stats'}), 500
+
+# Accounting exports
+@api.route('/api/admin/export/<name>', methods=['GET'])
+@admin_required
+def export_table(name):
+    """Stream ``transactions`` or ``meal-consumptions`` as CSV or NDJSON (``start``, ``end``, ``gzip``)."""
+    if name not in exports.EXPORTS:
+        return jsonify({'error': 'Unknown export'}), 404
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start, end = exports.date_range(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    compress = request.args.get('gzip', 'false').lower() in menu_io.TRUE_VALUES
+
+    filename = name + ''.join(f'-{value}' for value in (request.args.get('start'), request.args.get('end'))
+                              if value)
+    filename += f'.{export_format}'
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    if compress:
+        filename, mimetype = filename + '.gz', 'application/gzip'
+    body = exports.export_stream(name, export_format, start, end, compress)
+    response = current_app.response_class(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+# Reports, served from the daily rollup tables
+@api.route('/api/admin/reports/sales', methods=['GET'])
+@admin_required
+def get_sales_report():
+    """Menu items consumed per day or week: ``start``, ``end``, ``granularity``, ``category``, ``menu_item_id``."""
+    try:
+        start, end = rollups.report_bounds(request.args)
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in rollups.GRANULARITIES:
+            raise ValueError('granularity must be day or week')
+        rows = rollups.item_sales_report(start, end, granularity,
+                                         category=request.args.get('category'),
+                                         menu_item_id=request.args.get('menu_item_id', type=int))
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(),
+                        'granularity': granularity, 'rows': rows,
+                        'updated': rollups.freshness()})
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error building sales report: {str(e)}")
+        return jsonify({'error': 'Failed to build sales report'}), 500
+
+@api.route('/api/admin/reports/transactions', methods=['GET'])
+@admin_required
+def get_transaction_report():
+    """Transaction counts and amounts per day or week: ``start``, ``end``, ``granularity``, ``type``, ``status``."""
+    try:
+        start, end = rollups.report_bounds(request.args)
+        granularity = request.args.get('granularity', 'day')
+        if granularity not in rollups.GRANULARITIES:
+            raise ValueError('granularity must be day or week')
+        rows = rollups.transaction_report(start, end, granularity,
+                                          transaction_type=request.args.get('type'),
+                                          status=request.args.get('status'))
+        return jsonify({'start': start.isoformat(), 'end': end.isoformat(),
+                        'granularity': granularity, 'rows': rows,
+                        'updated': rollups.freshness()})
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error building transaction report: {str(e)}")
+        return jsonify({'error': 'Failed to build transaction report'}), 500
+
+@api.route('/api/admin/forecast', methods=['GET'])
+@admin_required
+def get_forecast():
+    """Predicted quantities per category and item for tomorrow and the next seven days."""
+    try:
+        return jsonify(forecaster.forecast(category=request.args.get('category')))
+    except Exception as e:
+        logger.error(f"Error building forecast: {str(e)}")
+        return jsonify({'error': 'Failed to build forecast'}), 500
+
+@api.route('/api/admin/auth/metrics', methods=['GET'])
+@admin_required
+def get_auth_metrics():
+    return jsonify(password_hasher.metrics())
+
+# Live updates
+@api.route('/api/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    """Server-Sent Events stream of transaction status and menu availability changes.
+
+    For the admin dashboard only: every open stream holds a gunicorn thread,
+    so the few streams a worker can afford are kept for admins, and student
+    apps poll the REST endpoints.  Browsers' ``EventSource`` cannot set
+    headers, so the token may also be passed as ``?jwt=``.  A reconnecting
+    client sends ``Last-Event-ID`` and is first sent what it missed.
+    """
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Admin access required'}), 403
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        resume_from = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Invalid Last-Event-ID'}), 400
+
+    broker = events.broker
+    try:
+        if resume_from is None:
+            resume_from = broker.latest_id()
+        subscription = broker.subscribe(resume_from)
+    except events.TooManySubscribers:
+        db.session.remove()
+        return busy_response()
+    try:
+        backlog, complete = broker.backfill(subscription) if last_event_id else ([], True)
+    except Exception as e:
+        broker.unsubscribe(subscription)
+        logger.error(f"Error reading missed events: {str(e)}")
+        return jsonify({'error': 'Failed to open event stream'}), 500
+    finally:
+        # Release the pooled connection; the stream itself never queries
+        db.session.remove()
+
+    heartbeat = current_app.config['EVENTS_HEARTBEAT_SECONDS']
+    lifetime = current_app.config['EVENTS_STREAM_SECONDS']
+    retry_ms = int(current_app.config['EVENTS_POLL_INTERVAL'] * 1000)
+
+    def generate():
+        yield f'retry: {retry_ms}\n\n'
+        if not complete:
+            # Too much was missed: the client should reload via the REST API
+            yield 'event: reset\ndata: {}\n\n'
+        for stream_event in backlog:
+            subscription.last_id = stream_event.id
+            yield events.format_sse(stream_event)
+
+        # End the stream when the client falls too far behind or after
+        # ``lifetime`` seconds; EventSource reconnects with Last-Event-ID
+        deadline = time.monotonic() + lifetime
+        while not subscription.overflowed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                stream_event = subscription.queue.get(timeout=min(heartbeat, remaining))
+            except queue.Empty:
+                # Comment line: keeps proxies from timing out and detects gone clients
+                yield ': keepalive\n\n'
+                continue
+            if stream_event.id <= subscription.last_id:
+                continue
+            subscription.last_id = stream_event.id
+            yield events.format_sse(stream_event)
+
+    response = current_app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
+@api.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """This worker's metrics in Prometheus text format.
+
+    Protected by ``METRICS_TOKEN`` (sent as a bearer token), since scrapers
+    do not hold user JWTs; without one configured it takes an admin JWT.
+    """
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+    else:
+        verify_jwt_in_request()
+        if current_user.role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+
+    hashing = password_hasher.metrics()
+    gauges = [
+        ('canteen_password_hashes_total', 'Passwords hashed.', hashing['hashes']),
+        ('canteen_password_verifications_total', 'Password checks.', hashing['verifications']),
+        ('canteen_password_rehashes_total', 'Hashes upgraded on login.', hashing['rehashes']),
+        ('canteen_password_hash_shed_total', 'Hash requests rejected as busy.', hashing['shed']),
+        ('canteen_password_hash_seconds_total', 'Time spent hashing.', hashing['hash_seconds_total']),
+        ('canteen_password_hash_pending', 'Hashes queued or running.', hashing['pending']),
+        ('canteen_logins_success_total', 'Successful logins.', hashing['login_success']),
+        ('canteen_logins_failure_total', 'Failed logins.', hashing['login_failure']),
+        ('canteen_event_subscribers', 'Open event streams.', events.broker.subscriber_count()),
+    ]
+    body = metrics.render(db.engine, gauges)
+    return current_app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Health check endpoint
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     try:
         # Test database connection
@@ -285,4 +1127,6 @@ def health_check():
         }), 500
 
 if __name__ == '__main__':
+    app = create_app()
+    start_background_jobs(app)
     app.run(host='0.0.0.0', debug=True)
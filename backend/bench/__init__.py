@@ -0,0 +1,14 @@
+"""Benchmark harness: synthetic data (``bench.seed``) and load scenarios (``bench.run``).
+
+Run from the ``backend`` directory, e.g. ``python -m bench.run --help``.
+"""
+from app import create_app
+
+
+def make_app(database=None, **overrides):
+    """The API app for benchmarking: no access log and no periodic reconcile."""
+    config = {'ACCESS_LOG_ENABLED': False, 'STATS_RECONCILE_INTERVAL': 0}
+    if database:
+        config['SQLALCHEMY_DATABASE_URI'] = database
+    config.update(overrides)
+    return create_app(config)
@@ -0,0 +1,259 @@
+"""Run load scenarios against the API and compare them with stored baselines.
+
+    python -m bench.run --database sqlite:///bench.db                   # in-process test client
+    python -m bench.run --database sqlite:///bench.db --url http://127.0.0.1:5000
+    python -m bench.run --scenario lunch-rush --duration 30 --save-baseline
+
+With ``--url`` requests go over HTTP to a running server (e.g. gunicorn);
+the database is still opened locally to pick users and menu items, and
+tokens are signed with the local ``JWT_SECRET_KEY``, so both must match the
+server's.  Reports throughput and p50/p95/p99 latency per endpoint; when a
+baseline exists, exits with status 1 if any endpoint's p95 latency or
+throughput got worse than ``--tolerance`` allows.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import defaultdict, namedtuple
+from urllib.parse import urlsplit
+
+from flask_jwt_extended import create_access_token
+
+from bench import make_app
+from bench.scenarios import SCENARIOS
+from models import db, MenuItem, User
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+BenchUser = namedtuple('BenchUser', 'id headers')
+
+
+class Response(namedtuple('Response', 'status headers body')):
+    def json(self):
+        return json.loads(self.body) if self.body else {}
+
+
+class TestClientTransport:
+    """Calls the app in-process through Flask's test client (one per thread)."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, payload=None, headers=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=payload, headers=headers)
+        return Response(response.status_code, response.headers, response.get_data())
+
+
+class HttpTransport:
+    """Keep-alive HTTP connection per thread to a running server."""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, payload=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (1, 2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=30)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return Response(response.status, response.headers, response.read())
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt == 2:
+                    raise
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, label, seconds, status):
+        with self._lock:
+            self.latencies[label].append(seconds)
+            if status >= 400:
+                self.errors[label] += 1
+
+
+class Client:
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    def request(self, label, method, path, json=None, headers=None):
+        started = time.perf_counter()
+        response = self.transport.request(method, path, payload=json, headers=headers)
+        self.recorder.record(label, time.perf_counter() - started, response.status)
+        return response
+
+
+class Context:
+    """Users, an admin and menu items the scenarios draw from."""
+
+    def __init__(self, users, admin, menu_item_ids):
+        self.users = users
+        self.admin = admin
+        self.menu_item_ids = menu_item_ids
+
+    def random_user(self, state):
+        return state['rng'].choice(self.users)
+
+
+def build_context(app, user_count):
+    with app.app_context():
+        admin = User.query.filter_by(role='admin').order_by(User.id).first()
+        users = User.query.filter(User.role != 'admin').order_by(User.id).limit(user_count).all()
+        menu_item_ids = [row.id for row in db.session.query(MenuItem.id).filter(MenuItem.is_available)]
+        if admin is None or not users or not menu_item_ids:
+            raise SystemExit('The database needs an admin, users and available menu items; '
+                             'run python -m bench.seed first')
+
+        def bench_user(user):
+            return BenchUser(user.id, {'Authorization': f'Bearer {create_access_token(identity=user)}'})
+
+        return Context([bench_user(user) for user in users], bench_user(admin), menu_item_ids)
+
+
+def run_scenario(scenario, transport, context, duration, concurrency, random_seed):
+    recorder = Recorder()
+    client = Client(transport, recorder)
+    deadline = time.perf_counter() + duration
+    iterations = [0] * concurrency
+    failures = []
+
+    def worker(index):
+        state = {'rng': random.Random(random_seed + index)}
+        try:
+            while time.perf_counter() < deadline:
+                scenario(client, context, state)
+                iterations[index] += 1
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise failures[0]
+
+    results = {}
+    for label, latencies in recorder.latencies.items():
+        latencies.sort()
+        results[label] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[label],
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    return {'iterations_per_second': round(sum(iterations) / elapsed, 1), 'endpoints': results}
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def compare(name, result, baseline, tolerance, min_delta_ms=1.0):
+    """Regressions of ``result`` against the baseline for scenario ``name``."""
+    regressions = []
+    for label, current in result['endpoints'].items():
+        previous = baseline.get(name, {}).get('endpoints', {}).get(label)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance) + min_delta_ms:
+            regressions.append(f"{name}: {label} p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {label} throughput {previous['rps']}/s -> {current['rps']}/s")
+    return regressions
+
+
+def print_report(name, result):
+    print(f"\n{name}: {result['iterations_per_second']} iterations/s")
+    print(f"  {'endpoint':48} {'requests':>8} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, row in sorted(result['endpoints'].items()):
+        print(f"  {label:48} {row['requests']:>8} {row['errors']:>6} {row['rps']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URI (default: DATABASE_URL)')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable; default: all)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--users', type=int, default=200, help='distinct users to act as')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative p95/throughput change before failing')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database)
+    transport = HttpTransport(args.url) if args.url else TestClientTransport(app)
+    context = build_context(app, args.users)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('scenarios', {})
+
+    results, regressions = {}, []
+    for name in args.scenario or sorted(SCENARIOS):
+        results[name] = run_scenario(SCENARIOS[name], transport, context,
+                                     args.duration, args.concurrency, args.seed)
+        print_report(name, results[name])
+        regressions += compare(name, results[name], baseline, args.tolerance)
+
+    if args.save_baseline:
+        stored = {'scenarios': dict(baseline, **results),
+                  'meta': {'duration': args.duration, 'concurrency': args.concurrency,
+                           'target': args.url or 'in-process'}}
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f'\nBaseline written to {args.baseline}')
+    elif regressions:
+        print('\nRegressions against the baseline:')
+        for line in regressions:
+            print(f'  {line}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
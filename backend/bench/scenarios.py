@@ -0,0 +1,75 @@
+"""Load scenarios.
+
+Each scenario is a function ``(client, context, state)`` that runs one
+iteration of a virtual user's behaviour; the runner calls it in a loop from
+every worker thread.  ``client.request(label, ...)`` times each call under
+``label`` (the route, not the concrete path).  ``state`` is a per-thread dict
+for things like a remembered ETag.
+"""
+import uuid
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+
+
+def menu_poll_storm(client, context, state):
+    """Every open app refreshing the menu; most polls revalidate an ETag."""
+    user = context.random_user(state)
+    headers = dict(user.headers)
+    if state.get('menu_etag') and state['rng'].random() < 0.8:
+        headers['If-None-Match'] = state['menu_etag']
+    response = client.request('GET /api/menu', 'GET', '/api/menu', headers=headers)
+    if response.status == 200:
+        state['menu_etag'] = response.headers.get('ETag')
+
+
+def lunch_rush_checkout(client, context, state):
+    """Students buying a few items and checking their order history."""
+    rng = state['rng']
+    user = context.random_user(state)
+    items = [{'menu_item_id': rng.choice(context.menu_item_ids), 'quantity': 1}
+             for _ in range(rng.randint(1, 3))]
+    headers = dict(user.headers)
+    headers['Idempotency-Key'] = str(uuid.uuid4())
+    client.request('POST /api/checkout', 'POST', '/api/checkout',
+                   json={'items': items}, headers=headers)
+    client.request('GET /api/transactions', 'GET', '/api/transactions?per_page=20',
+                   headers=user.headers)
+
+
+def admin_dashboard(client, context, state):
+    """Admins watching the dashboard: counters, the full transaction list and a filter."""
+    headers = context.admin.headers
+    client.request('GET /api/admin/transactions/stats', 'GET', '/api/admin/transactions/stats',
+                   headers=headers)
+    client.request('GET /api/admin/users/stats', 'GET', '/api/admin/users/stats', headers=headers)
+    response = client.request('GET /api/transactions (admin)', 'GET',
+                              '/api/transactions?per_page=50', headers=headers)
+    cursor = response.json().get('pagination', {}).get('next_cursor') if response.status == 200 else None
+    if cursor:
+        client.request('GET /api/transactions (admin, next page)', 'GET',
+                       f'/api/transactions?per_page=50&cursor={cursor}', headers=headers)
+    client.request('GET /api/transactions (admin, filtered)', 'GET',
+                   '/api/transactions?per_page=50&status=completed&type=meal&date_range=week',
+                   headers=headers)
+
+
+def qr_scan_burst(client, context, state):
+    """The counter scanning a queue of students: fetch a QR code, then redeem it."""
+    rng = state['rng']
+    user = context.random_user(state)
+    response = client.request('GET /api/qrcode?format=json', 'GET', '/api/qrcode?format=json',
+                              headers=user.headers)
+    if response.status != 200:
+        return
+    client.request('GET /api/qrcode (png)', 'GET', '/api/qrcode', headers=user.headers)
+    client.request('POST /api/meal/verify', 'POST', '/api/meal/verify',
+                   json={'qr_uuid': response.json()['qr_uuid'], 'meal_type': rng.choice(MEAL_TYPES)},
+                   headers=context.admin.headers)
+
+
+SCENARIOS = {
+    'menu-poll': menu_poll_storm,
+    'lunch-rush': lunch_rush_checkout,
+    'admin-dashboard': admin_dashboard,
+    'qr-burst': qr_scan_burst,
+}
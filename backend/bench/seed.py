@@ -0,0 +1,201 @@
+"""Seed a database with a deterministic synthetic canteen dataset.
+
+    python -m bench.seed --database sqlite:///bench.db --users 5000 --items 200 --transactions 1000000
+
+Rows are written with Core ``executemany`` inserts in batches, bypassing
+the ORM, so the dashboard counters are reconciled once at the end.  All
+seeded users share the password ``password``; about 1% are admins, and
+every user starts with a large wallet balance.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+
+from bench import make_app
+from models import db, LedgerEntry, MealConsumption, MealPlan, MenuItem, Transaction, User, Wallet
+import stats
+
+PASSWORD = 'password'
+CATEGORIES = ('breakfast', 'lunch', 'dinner', 'snacks', 'beverage')
+# (transaction_type, weight, consumptions per transaction)
+TRANSACTION_MIX = (('meal', 60, (1, 1)), ('extra', 30, (1, 3)), ('recharge', 10, (0, 0)))
+STATUS_MIX = (('completed', 90), ('pending', 5), ('failed', 5))
+# Wallet balance every seeded user starts with, in paise, so checkouts in
+# the load scenarios never run dry
+OPENING_BALANCE = 10_000_000
+# Share of orders per hour of day: breakfast, lunch and dinner peaks
+HOUR_WEIGHTS = [0] * 7 + [6, 9, 4, 3, 6, 14, 16, 8, 3, 3, 4, 6, 10, 7, 2] + [0, 0]
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+
+def seed_users(rng, count, password_hash, now, batch_size):
+    first_id = _next_id(User)
+    batch = []
+    for user_id in range(first_id, first_id + count):
+        batch.append({
+            'id': user_id,
+            'username': f'bench{user_id}',
+            'email': f'bench{user_id}@example.com',
+            'name': f'Bench User {user_id}',
+            'password_hash': password_hash,
+            'role': 'admin' if (user_id - first_id) % 100 == 0 else 'user',
+            'token_version': 0,
+            'created_at': now - timedelta(days=rng.randint(0, 365)),
+        })
+        if len(batch) >= batch_size:
+            _insert(User, batch)
+            batch = []
+    _insert(User, batch)
+    return list(range(first_id, first_id + count))
+
+
+def seed_menu_items(rng, count, now):
+    first_id = _next_id(MenuItem)
+    rows = [{
+        'id': item_id,
+        'name': f'Item {item_id}',
+        'description': f'Synthetic {rng.choice(CATEGORIES)} item',
+        'price': round(rng.uniform(0.5, 15.0), 2),
+        'category': rng.choice(CATEGORIES),
+        'is_available': rng.random() > 0.1,
+        'created_at': now,
+        'updated_at': now,
+    } for item_id in range(first_id, first_id + count)]
+    _insert(MenuItem, rows)
+    return {row['id']: row['price'] for row in rows}
+
+
+def seed_meal_plans(rng, user_ids, now):
+    rows = []
+    for user_id in user_ids:
+        if rng.random() < 0.3:
+            start = now - timedelta(days=rng.randint(0, 120))
+            rows.append({
+                'user_id': user_id,
+                'plan_type': rng.choice(('daily', 'weekly', 'monthly')),
+                'start_date': start,
+                'end_date': start + timedelta(days=rng.choice((1, 7, 30, 90))),
+                'created_at': start,
+                'updated_at': start,
+            })
+    _insert(MealPlan, rows)
+    return len(rows)
+
+
+def seed_wallets(user_ids, now, batch_size):
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        _insert(Wallet, [{'user_id': user_id, 'balance_minor': OPENING_BALANCE, 'version': 0,
+                          'updated_at': now} for user_id in batch])
+        _insert(LedgerEntry, [{'user_id': user_id, 'entry_type': 'opening',
+                               'amount_minor': OPENING_BALANCE,
+                               'balance_after_minor': OPENING_BALANCE, 'created_at': now}
+                              for user_id in batch])
+    return len(user_ids)
+
+
+def seed_transactions(rng, count, user_ids, prices, days, now, batch_size):
+    """Insert ``count`` transactions with their meal consumptions, oldest first."""
+    types = [kind for kind, _, _ in TRANSACTION_MIX]
+    type_weights = [weight for _, weight, _ in TRANSACTION_MIX]
+    consumption_range = {kind: span for kind, _, span in TRANSACTION_MIX}
+    statuses = [status for status, _ in STATUS_MIX]
+    status_weights = [weight for _, weight in STATUS_MIX]
+    item_ids = list(prices)
+    start = now - timedelta(days=days)
+
+    transaction_id = _next_id(Transaction)
+    consumption_count = 0
+    transactions, consumptions = [], []
+    for i in range(count):
+        day = start + timedelta(days=days * i / count)
+        hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+        created_at = day.replace(hour=hour, minute=rng.randint(0, 59), second=rng.randint(0, 59))
+        user_id = rng.choice(user_ids)
+        kind = rng.choices(types, type_weights)[0]
+        status = rng.choices(statuses, status_weights)[0]
+
+        items = [rng.choice(item_ids) for _ in range(rng.randint(*consumption_range[kind]))]
+        amount = round(sum(prices[item] for item in items), 2) if items else rng.choice((100, 200, 500))
+        transactions.append({
+            'id': transaction_id,
+            'user_id': user_id,
+            'amount': amount,
+            'transaction_type': kind,
+            'status': status,
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+        if status == 'completed':
+            consumptions.extend({
+                'user_id': user_id,
+                'transaction_id': transaction_id,
+                'menu_item_id': item,
+                'consumed_at': created_at,
+            } for item in items)
+        transaction_id += 1
+
+        if len(transactions) >= batch_size:
+            _insert(Transaction, transactions)
+            _insert(MealConsumption, consumptions)
+            consumption_count += len(consumptions)
+            transactions, consumptions = [], []
+    _insert(Transaction, transactions)
+    _insert(MealConsumption, consumptions)
+    return consumption_count + len(consumptions)
+
+
+def seed(users=1000, items=100, transactions=100000, days=180, random_seed=42,
+         batch_size=10000, password_method=None, log=print):
+    """Add a synthetic dataset to the app's database (inside an app context)."""
+    rng = random.Random(random_seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    db.create_all()
+    started = time.perf_counter()
+
+    options = {'method': password_method} if password_method else {}
+    password_hash = generate_password_hash(PASSWORD, **options)
+    user_ids = seed_users(rng, users, password_hash, now, batch_size)
+    log(f'{len(user_ids)} users')
+    log(f'{seed_wallets(user_ids, now, batch_size)} wallets')
+    prices = seed_menu_items(rng, items, now)
+    log(f'{len(prices)} menu items')
+    log(f'{seed_meal_plans(rng, user_ids, now)} meal plans')
+    consumptions = seed_transactions(rng, transactions, user_ids, prices, days, now, batch_size)
+    log(f'{transactions} transactions, {consumptions} meal consumptions')
+    stats.reconcile()
+    log(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLAlchemy URI (default: DATABASE_URL)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=180, help='history to spread transactions over')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database)
+    with app.app_context():
+        seed(args.users, args.items, args.transactions, args.days, args.seed, args.batch_size,
+             app.config['PASSWORD_HASH_METHOD'])
+
+
+if __name__ == '__main__':
+    main()
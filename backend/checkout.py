@@ -0,0 +1,163 @@
+import hashlib
+import json
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, IdempotencyKey, MealConsumption, MenuItem, StockReservation, Transaction
+from stock import OutOfStock, release, take
+from wallet import InsufficientFunds, WalletConflict, from_minor, post, to_minor
+
+MAX_CART_ITEMS = 50
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status_code, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+
+def parse_cart(data):
+    """Normalize the request body into ``({menu_item_id: quantity}, {menu_item_id: expected_price})``.
+
+    ``items`` may be a list of ids (repeats count as quantity) or of
+    ``{"menu_item_id", "quantity", "price"}`` objects; ``price`` is optional
+    and, when given, must still match the menu.
+    """
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise CheckoutError('items must be a non-empty list', 400)
+
+    quantities = Counter()
+    expected_prices = {}
+    for line in items:
+        if isinstance(line, dict):
+            item_id, quantity = line.get('menu_item_id'), line.get('quantity', 1)
+            if line.get('price') is not None:
+                if isinstance(line['price'], bool) or not isinstance(line['price'], (int, float)):
+                    raise CheckoutError('price must be a number', 400)
+                expected_prices[item_id] = line['price']
+        else:
+            item_id, quantity = line, 1
+        # bool is an int subclass: true must not pass as item 1
+        if (not isinstance(item_id, int) or isinstance(item_id, bool)
+                or not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 1):
+            raise CheckoutError('Each item needs an integer menu_item_id and a positive quantity', 400)
+        quantities[item_id] += quantity
+
+    if sum(quantities.values()) > MAX_CART_ITEMS:
+        raise CheckoutError(f'A cart holds at most {MAX_CART_ITEMS} items', 400)
+    return quantities, expected_prices
+
+
+def request_hash(quantities):
+    normalized = json.dumps(sorted(quantities.items()), separators=(',', ':'))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+def find_replay(user_id, key, cart_hash):
+    """The transaction already created for ``key``, if this request is a retry."""
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.request_hash != cart_hash:
+        raise CheckoutError('Idempotency key was already used for a different cart', 422)
+    return db.session.get(Transaction, record.transaction_id)
+
+
+def checkout(user_id, quantities, expected_prices, idempotency_key=None):
+    """Create an ``extra`` purchase ``Transaction`` and its ``MealConsumption`` rows.
+
+    Returns ``(transaction, replayed)``.  Prices and availability are read
+    with one ``IN (...)`` query; the transaction, its consumptions, the
+    stock taken, the wallet debit and the idempotency record are written in
+    one database transaction with a single commit.  Portions the user had
+    reserved go back to stock first, so the order can claim them.  A retry
+    with the same idempotency key returns the original transaction instead
+    of charging again.
+    """
+    cart_hash = request_hash(quantities)
+    if idempotency_key:
+        existing = find_replay(user_id, idempotency_key, cart_hash)
+        if existing is not None:
+            return existing, True
+
+    try:
+        release(StockReservation.user_id == user_id)
+        rows = (db.session.query(MenuItem.id, MenuItem.price, MenuItem.is_available)
+                .filter(MenuItem.id.in_(list(quantities)))
+                .all())
+        menu = {row.id: row for row in rows}
+
+        missing = sorted(set(quantities) - set(menu))
+        if missing:
+            raise CheckoutError('Unknown menu items', 404, {'menu_item_ids': missing})
+        unavailable = sorted(item_id for item_id in quantities if not menu[item_id].is_available)
+        if unavailable:
+            raise CheckoutError('Menu items not available', 409, {'menu_item_ids': unavailable})
+        changed = {item_id: menu[item_id].price for item_id, price in expected_prices.items()
+                   if abs(menu[item_id].price - price) > 0.005}
+        if changed:
+            raise CheckoutError('Menu prices changed', 409, {'prices': changed})
+        take(quantities)
+
+        now = datetime.utcnow()
+        total_minor = sum(to_minor(menu[item_id].price) * quantity
+                          for item_id, quantity in quantities.items())
+        transaction = Transaction(
+            user_id=user_id,
+            amount=from_minor(total_minor),
+            transaction_type='extra',
+            status='completed',
+            created_at=now,
+            updated_at=now
+        )
+        db.session.add(transaction)
+        db.session.flush()
+        post(user_id, -total_minor, 'purchase', transaction.id, now)
+
+        db.session.bulk_insert_mappings(MealConsumption, [
+            {'user_id': user_id, 'transaction_id': transaction.id,
+             'menu_item_id': item_id, 'consumed_at': now}
+            for item_id, quantity in quantities.items()
+            for _ in range(quantity)
+        ])
+        if idempotency_key:
+            db.session.add(IdempotencyKey(
+                user_id=user_id,
+                key=idempotency_key,
+                request_hash=cart_hash,
+                transaction_id=transaction.id,
+                created_at=now
+            ))
+            db.session.flush()
+        db.session.commit()
+        return transaction, False
+    except CheckoutError:
+        db.session.rollback()
+        raise
+    except OutOfStock as e:
+        db.session.rollback()
+        raise CheckoutError('Not enough stock', 409, {'menu_item_ids': e.menu_item_ids,
+                                                      'remaining': e.remaining})
+    except InsufficientFunds as e:
+        db.session.rollback()
+        raise CheckoutError('Insufficient balance', 402, {'balance': from_minor(e.balance_minor),
+                                                          'required': from_minor(e.required_minor)})
+    except WalletConflict:
+        db.session.rollback()
+        raise CheckoutError('Balance changed during checkout, please retry', 409)
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent retry with the same key committed first
+        if idempotency_key:
+            existing = find_replay(user_id, idempotency_key, cart_hash)
+            if existing is not None:
+                return existing, True
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,45 @@
+import click
+from flask.cli import with_appcontext
+
+import query_plans
+import rollups
+import stats
+
+
+@click.command('reconcile-stats')
+@with_appcontext
+def reconcile_stats_command():
+    """Recompute the admin dashboard counters from the source tables."""
+    counts = stats.reconcile()
+    click.echo(f'Reconciled {len(counts)} counters')
+
+
+@click.command('rollup')
+@click.option('--rebuild', is_flag=True, help='Discard the rollups and recompute all history.')
+@with_appcontext
+def rollup_command(rebuild):
+    """Update the daily sales and transaction rollup tables."""
+    days = rollups.rebuild() if rebuild else rollups.run()
+    click.echo(f"Recomputed {days['item_sales_days']} item sales days and "
+               f"{days['transaction_days']} transaction days")
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if a hot API route's queries scan a large table without an index."""
+    try:
+        problems = query_plans.check()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    for method, path, statement, detail in problems:
+        click.echo(f'{method} {path}: {detail}\n    {" ".join(statement.split())}', err=True)
+    if problems:
+        raise click.ClickException(f'{len(problems)} queries fall back to a full table scan')
+    click.echo(f'{len(query_plans.hot_routes(0))} routes checked, no full table scans')
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_stats_command)
+    app.cli.add_command(rollup_command)
+    app.cli.add_command(check_query_plans_command)
@@ -0,0 +1,103 @@
+import os
+from datetime import timedelta
+
+
+class Config:
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///canteen.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'super-secret-key')
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
+    UPLOAD_FOLDER = 'uploads'
+    # Password hashing: werkzeug method string (changing it rehashes each
+    # user on their next login) and where the KDF runs: 'process' pool,
+    # 'thread' pool or 'inline'.  Past MAX_PENDING queued hashes per worker,
+    # login/register answer 503.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'process')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '16'))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '10'))
+
+    # Authenticated requests resolve the user from a per-worker cache; TTL
+    # bounds how long another worker can act on a changed role
+    USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+
+    # SQLite connection tuning, applied to every new connection.  WAL lets
+    # readers run alongside a writer; busy_timeout makes writers wait for the
+    # lock instead of failing with "database is locked".
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    # One pooled connection per gunicorn thread, plus a little headroom
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', os.environ.get('GUNICORN_THREADS', '4')))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', '2'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+    # Access log: fraction of requests recorded (errors and slow requests are
+    # always kept) and how many body bytes to capture (0 disables capture)
+    ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '1.0'))
+    ACCESS_LOG_BODY_BYTES = int(os.environ.get('ACCESS_LOG_BODY_BYTES', '0'))
+    ACCESS_LOG_SLOW_MS = float(os.environ.get('ACCESS_LOG_SLOW_MS', '500'))
+    ACCESS_LOG_FILE = os.environ.get('ACCESS_LOG_FILE')
+
+    # Meal QR codes: how long an issued token stays valid, and how many
+    # recently redeemed tokens each worker remembers to reject replays
+    QR_TOKEN_TTL_SECONDS = int(os.environ.get('QR_TOKEN_TTL_SECONDS', '300'))
+    QR_REPLAY_CACHE_SIZE = int(os.environ.get('QR_REPLAY_CACHE_SIZE', '10000'))
+
+    # Largest single wallet recharge, in rupees
+    WALLET_MAX_RECHARGE = float(os.environ.get('WALLET_MAX_RECHARGE', '10000'))
+
+    # Meal plan eligibility: seconds before a worker reloads the day's active
+    # plans (picking up plan changes made through other workers), and
+    # whether scanning a meal requires a plan that covers it
+    ELIGIBILITY_CACHE_TTL = float(os.environ.get('ELIGIBILITY_CACHE_TTL', '30'))
+    MEAL_PLAN_REQUIRED = os.environ.get('MEAL_PLAN_REQUIRED', 'false').lower() == 'true'
+    # Rendered QR PNGs kept per worker, and the bounded render pool
+    QR_IMAGE_CACHE_SIZE = int(os.environ.get('QR_IMAGE_CACHE_SIZE', '512'))
+    QR_RENDER_WORKERS = int(os.environ.get('QR_RENDER_WORKERS', '2'))
+    QR_RENDER_MAX_PENDING = int(os.environ.get('QR_RENDER_MAX_PENDING', '16'))
+
+    # Seconds between recomputations of the dashboard counters (0 disables)
+    STATS_RECONCILE_INTERVAL = int(os.environ.get('STATS_RECONCILE_INTERVAL', '3600'))
+
+    # Bearer token required by /api/metrics (unset: an admin JWT is required)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Sales/transaction rollups: seconds between incremental runs (0
+    # disables) and how far the transaction watermark trails the clock
+    ROLLUP_INTERVAL = int(os.environ.get('ROLLUP_INTERVAL', '300'))
+    ROLLUP_LAG_SECONDS = int(os.environ.get('ROLLUP_LAG_SECONDS', '60'))
+
+    # Demand forecast (/api/admin/forecast): days of history behind the
+    # weekday profile, smoothing factor for the level, and how many new
+    # days may be folded in before the model is refit from scratch
+    FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', '56'))
+    FORECAST_SMOOTHING = float(os.environ.get('FORECAST_SMOOTHING', '0.3'))
+    FORECAST_REFIT_DAYS = int(os.environ.get('FORECAST_REFIT_DAYS', '7'))
+
+    # Upper bound on how stale another worker's menu cache can be after an edit
+    MENU_CACHE_TTL = float(os.environ.get('MENU_CACHE_TTL', '30'))
+
+    # Stock reservations for carts in progress: seconds the portions stay
+    # held, and seconds between sweeps returning expired ones (0 disables)
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', '600'))
+    STOCK_SWEEP_INTERVAL = int(os.environ.get('STOCK_SWEEP_INTERVAL', '30'))
+
+    # Live event stream (/api/events), for the admin dashboard only: each
+    # open stream holds a gunicorn thread, so subscribers per worker are
+    # capped at half the thread count and students poll the REST API.
+    # Workers poll the events table every POLL_INTERVAL seconds while anyone
+    # is subscribed; streams end after STREAM_SECONDS and the client
+    # reconnects with Last-Event-ID.
+    EVENTS_MAX_SUBSCRIBERS = int(os.environ.get(
+        'EVENTS_MAX_SUBSCRIBERS', str(max(1, int(os.environ.get('GUNICORN_THREADS', '4')) // 2))))
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', '100'))
+    EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', '1'))
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', '15'))
+    EVENTS_STREAM_SECONDS = float(os.environ.get('EVENTS_STREAM_SECONDS', '300'))
+    EVENTS_RETENTION_SECONDS = int(os.environ.get('EVENTS_RETENTION_SECONDS', '3600'))
+    EVENTS_BACKFILL_LIMIT = int(os.environ.get('EVENTS_BACKFILL_LIMIT', '500'))
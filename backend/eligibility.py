@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, time as day_time, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, MealPlan
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner')
+
+# One plan clipped to the day the index covers
+PlanInterval = namedtuple('PlanInterval', 'plan_id start end meal_types')
+
+
+class EligibilityIndex:
+    """Which users hold a meal plan covering a given moment and meal type.
+
+    For the current UTC day it keeps a map ``user_id -> [PlanInterval]`` of
+    every plan overlapping that day, loaded with one query on the
+    ``ix_meal_plans_user_dates`` index, so a scan is a dict lookup plus a
+    check of the (nearly always single) interval.  Plan writes committed in
+    this worker mark their users stale, and those users alone are reloaded
+    on their next check.  The map is rebuilt when the day rolls over or
+    after ``ttl`` seconds, which bounds how long writes through another
+    worker go unnoticed.
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self._entry = None
+        self._stale = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config['ELIGIBILITY_CACHE_TTL']
+        app.extensions['eligibility'] = self
+
+    def check(self, user_id, meal_type, now=None):
+        """Id of a plan covering ``now`` for ``meal_type``, or ``None``."""
+        now = now or datetime.utcnow()
+        return _covering(self._intervals(now.date()).get(user_id, ()), meal_type, now)
+
+    def check_many(self, user_ids, meal_type, now=None):
+        """``{user_id: plan_id or None}`` for every id in ``user_ids``."""
+        now = now or datetime.utcnow()
+        intervals = (self._intervals(now.date()) if now.date() == datetime.utcnow().date()
+                     else load_day(now.date(), user_ids))
+        return {user_id: _covering(intervals.get(user_id, ()), meal_type, now)
+                for user_id in user_ids}
+
+    def check_each(self, checks):
+        """Plan ids for ``[(user_id, meal_type, at)]``, in order.
+
+        Checks on other days than today cost one query per day, for the
+        users checked on it.
+        """
+        days = {}
+        for user_id, meal_type, at in checks:
+            days.setdefault(at.date(), set()).add(user_id)
+        today = datetime.utcnow().date()
+        intervals = {day: self._intervals(day) if day == today else load_day(day, user_ids)
+                     for day, user_ids in days.items()}
+        return [_covering(intervals[at.date()].get(user_id, ()), meal_type, at)
+                for user_id, meal_type, at in checks]
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            self._stale.update(user_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entry = None
+            self._stale.clear()
+
+    def _intervals(self, day):
+        entry = self._entry
+        if self._fresh(entry, day) and not self._stale:
+            return entry[1]
+
+        with self._lock:
+            entry = self._entry
+            if not self._fresh(entry, day):
+                entry = (day, load_day(day), time.monotonic())
+                self._stale.clear()
+            elif self._stale:
+                stale, self._stale = self._stale, set()
+                # Copy-on-write, so readers without the lock see either map whole
+                intervals = dict(entry[1])
+                for user_id in stale:
+                    intervals.pop(user_id, None)
+                intervals.update(load_day(day, stale))
+                entry = (day, intervals, entry[2])
+            self._entry = entry
+            return entry[1]
+
+    def _fresh(self, entry, day):
+        return (entry is not None
+                and entry[0] == day
+                and time.monotonic() - entry[2] < self.ttl)
+
+
+def load_day(day, user_ids=None):
+    """``{user_id: [PlanInterval]}`` of plans overlapping ``day``, optionally for some users."""
+    start = datetime.combine(day, day_time())
+    end = start + timedelta(days=1)
+    query = (db.session.query(MealPlan.id, MealPlan.user_id, MealPlan.start_date, MealPlan.end_date,
+                              MealPlan.breakfast_allowed, MealPlan.lunch_allowed,
+                              MealPlan.dinner_allowed)
+             .filter(MealPlan.start_date < end, MealPlan.end_date >= start))
+    if user_ids is not None:
+        query = query.filter(MealPlan.user_id.in_(list(user_ids)))
+
+    intervals = {}
+    for row in query:
+        meal_types = frozenset(meal_type for meal_type, allowed in
+                               zip(MEAL_TYPES, (row.breakfast_allowed, row.lunch_allowed,
+                                                row.dinner_allowed))
+                               if allowed)
+        intervals.setdefault(row.user_id, []).append(
+            PlanInterval(row.id, row.start_date, row.end_date, meal_types))
+    return intervals
+
+
+def active_plan(user_id, now=None):
+    """The user's plan covering ``now``, else their latest plan, for ``GET /api/meal-plan``."""
+    now = now or datetime.utcnow()
+    plan = (MealPlan.query
+            .filter(MealPlan.user_id == user_id,
+                    MealPlan.start_date <= now, MealPlan.end_date >= now)
+            .order_by(MealPlan.start_date.desc())
+            .first())
+    if plan is None:
+        plan = (MealPlan.query
+                .filter(MealPlan.user_id == user_id)
+                .order_by(MealPlan.start_date.desc())
+                .first())
+    return plan
+
+
+def _covering(intervals, meal_type, now):
+    for interval in intervals:
+        if interval.start <= now <= interval.end and meal_type in interval.meal_types:
+            return interval.plan_id
+    return None
+
+
+@event.listens_for(MealPlan, 'after_insert')
+@event.listens_for(MealPlan, 'after_update')
+@event.listens_for(MealPlan, 'after_delete')
+def _queue_plan_invalidation(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_plan_user_ids', set()).add(target.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_plans(session):
+    user_ids = session.info.pop('changed_plan_user_ids', None)
+    if user_ids:
+        eligibility.invalidate(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_plan_invalidation(session):
+    session.info.pop('changed_plan_user_ids', None)
+
+
+eligibility = EligibilityIndex()
@@ -0,0 +1,232 @@
+import json
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Event, MenuItem, Transaction
+
+# Immutable copy of an Event row handed to every subscriber queue
+StreamEvent = namedtuple('StreamEvent', 'id kind user_id data')
+
+
+# Writing events
+#
+# Mapper events queue a payload on the session while a flush runs; after_flush
+# inserts them into the events table inside the same database transaction, so
+# a rolled back change never reaches a client.  Bulk writes that bypass the
+# ORM publish nothing.
+
+def _queue_event(target, kind, user_id, data):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('pending_events', []).append(
+            {'kind': kind, 'user_id': user_id, 'payload': json.dumps(data)})
+
+
+def _transaction_event(target):
+    _queue_event(target, 'transaction', target.user_id, {
+        'id': target.id,
+        'status': target.status,
+        'transaction_type': target.transaction_type,
+        'amount': target.amount,
+        'updated_at': target.updated_at.isoformat() if target.updated_at else None,
+    })
+
+
+def _menu_event(target, is_available):
+    _queue_event(target, 'menu', None, {
+        'id': target.id,
+        'name': target.name,
+        'is_available': is_available,
+    })
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _transaction_inserted(mapper, connection, target):
+    _transaction_event(target)
+
+
+@event.listens_for(Transaction, 'after_update')
+def _transaction_updated(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        _transaction_event(target)
+
+
+@event.listens_for(MenuItem, 'after_update')
+def _menu_item_updated(mapper, connection, target):
+    if inspect(target).attrs.is_available.history.has_changes():
+        _menu_event(target, target.is_available)
+
+
+@event.listens_for(MenuItem, 'after_delete')
+def _menu_item_deleted(mapper, connection, target):
+    _menu_event(target, False)
+
+
+def record_menu_events(session, changes):
+    """Write ``menu`` events for ``[(id, name, is_available)]`` changed by Core UPDATEs.
+
+    The mapper events above only see changes made through the ORM.
+    """
+    now = datetime.utcnow()
+    session.execute(Event.__table__.insert(), [
+        {'kind': 'menu', 'user_id': None, 'created_at': now,
+         'payload': json.dumps({'id': item_id, 'name': name, 'is_available': is_available})}
+        for item_id, name, is_available in changes
+    ])
+
+
+@event.listens_for(Session, 'after_flush')
+def _write_events(session, flush_context):
+    pending = session.info.pop('pending_events', None)
+    if pending:
+        now = datetime.utcnow()
+        for row in pending:
+            row['created_at'] = now
+        session.connection().execute(Event.__table__.insert(), pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('pending_events', None)
+
+
+# Fan-out
+
+class Subscription:
+    """One connected admin dashboard: a bounded queue of every event.
+
+    ``last_id`` is the newest event id the client has been sent.  When the
+    client reads too slowly and its queue fills up, the subscription is
+    marked ``overflowed`` and the stream ends; the client reconnects with
+    ``Last-Event-ID`` and catches up from the events table.
+    """
+
+    def __init__(self, last_id, maxsize):
+        self.last_id = last_id
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def offer(self, stream_event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(stream_event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class EventBroker:
+    """In-process pub/sub over the events table.
+
+    Each worker polls for rows newer than the last one it has seen (one
+    indexed query per interval, and only while someone is subscribed) and
+    fans them out to its subscribers' queues.  Event ids therefore double as
+    SSE ids, and any worker can resume a client from ``Last-Event-ID``.
+    """
+
+    def __init__(self):
+        self.queue_size = 100
+        self.max_subscribers = 2
+        self.retention = 3600
+        self.backfill_limit = 500
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last_id = None
+        self._last_prune = 0.0
+
+    def init_app(self, app):
+        self.queue_size = app.config['EVENTS_QUEUE_SIZE']
+        self.max_subscribers = app.config['EVENTS_MAX_SUBSCRIBERS']
+        self.retention = app.config['EVENTS_RETENTION_SECONDS']
+        self.backfill_limit = app.config['EVENTS_BACKFILL_LIMIT']
+        app.extensions['event_broker'] = self
+
+    def subscribe(self, last_id):
+        subscription = Subscription(last_id, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def latest_id(self):
+        return db.session.query(func.max(Event.id)).scalar() or 0
+
+    def publish(self, stream_event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.offer(stream_event)
+
+    def backfill(self, subscription):
+        """Events after ``subscription.last_id`` for a reconnecting client.
+
+        Returns ``(events, complete)``; ``complete`` is False when more than
+        ``backfill_limit`` events (or already pruned ones) were missed and
+        the client should reload its state instead.
+        """
+        after_id = subscription.last_id
+        rows = (Event.query.filter(Event.id > after_id)
+                .order_by(Event.id)
+                .limit(self.backfill_limit + 1)
+                .all())
+        oldest = db.session.query(func.min(Event.id)).scalar()
+        complete = len(rows) <= self.backfill_limit and (oldest is None or oldest <= after_id + 1)
+        return [_stream_event(row) for row in rows[:self.backfill_limit]], complete
+
+    def poll(self):
+        """Publish events committed since the last poll (run by a PeriodicJob)."""
+        self._prune()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            # Nobody listening: skip the query, resume from the subscribers next time
+            self._last_id = None
+            return
+        if self._last_id is None:
+            self._last_id = min(subscription.last_id for subscription in subscribers)
+        rows = (Event.query.filter(Event.id > self._last_id)
+                .order_by(Event.id)
+                .limit(1000)
+                .all())
+        for row in rows:
+            self.publish(_stream_event(row))
+            self._last_id = row.id
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        Event.query.filter(Event.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def _stream_event(row):
+    return StreamEvent(row.id, row.kind, row.user_id, json.loads(row.payload))
+
+
+def format_sse(stream_event):
+    return f'id: {stream_event.id}\nevent: {stream_event.kind}\ndata: {json.dumps(stream_event.data)}\n\n'
+
+
+broker = EventBroker()
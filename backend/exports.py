@@ -0,0 +1,114 @@
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from menu_io import export_csv, export_ndjson
+from models import db, MealConsumption, MenuItem, Transaction
+
+TRANSACTION_FIELDS = ['id', 'user_id', 'transaction_type', 'status', 'amount',
+                      'created_at', 'updated_at']
+CONSUMPTION_FIELDS = ['id', 'user_id', 'transaction_id', 'menu_item_id', 'menu_item_name',
+                      'category', 'consumed_at']
+BATCH_SIZE = 2000
+CHUNK_BYTES = 64 * 1024
+
+
+# Accounting exports
+#
+# Rows are read as plain column tuples with yield_per, so the ORM builds no
+# instances and at most one batch is held in memory, and are written out
+# through a generator as they arrive.  Small per-row strings are coalesced
+# into chunks of about CHUNK_BYTES before reaching the WSGI server (and the
+# gzip compressor), so memory stays flat however many rows the range holds.
+
+def date_range(args):
+    """``(start, end)`` datetimes from ``start``/``end`` (YYYY-MM-DD, both inclusive); either may be omitted."""
+    start = date.fromisoformat(args['start']) if args.get('start') else None
+    end = date.fromisoformat(args['end']) if args.get('end') else None
+    if start and end and start > end:
+        raise ValueError('start must not be after end')
+    return (datetime.combine(start, time()) if start else None,
+            datetime.combine(end + timedelta(days=1), time()) if end else None)
+
+
+def transaction_rows(start=None, end=None):
+    query = db.session.query(Transaction.id, Transaction.user_id, Transaction.transaction_type,
+                             Transaction.status, Transaction.amount, Transaction.created_at,
+                             Transaction.updated_at)
+    query = _between(query, Transaction.created_at, start, end)
+    for row in query.order_by(Transaction.created_at, Transaction.id).yield_per(BATCH_SIZE):
+        yield {
+            'id': row.id,
+            'user_id': row.user_id,
+            'transaction_type': row.transaction_type,
+            'status': row.status,
+            'amount': row.amount,
+            'created_at': _isoformat(row.created_at),
+            'updated_at': _isoformat(row.updated_at),
+        }
+
+
+def consumption_rows(start=None, end=None):
+    query = (db.session.query(MealConsumption.id, MealConsumption.user_id,
+                              MealConsumption.transaction_id, MealConsumption.menu_item_id,
+                              MenuItem.name, MenuItem.category, MealConsumption.consumed_at)
+             .outerjoin(MenuItem, MenuItem.id == MealConsumption.menu_item_id))
+    query = _between(query, MealConsumption.consumed_at, start, end)
+    for row in query.order_by(MealConsumption.consumed_at, MealConsumption.id).yield_per(BATCH_SIZE):
+        yield {
+            'id': row.id,
+            'user_id': row.user_id,
+            'transaction_id': row.transaction_id,
+            'menu_item_id': row.menu_item_id,
+            'menu_item_name': row.name,
+            'category': row.category,
+            'consumed_at': _isoformat(row.consumed_at),
+        }
+
+
+EXPORTS = {
+    'transactions': (transaction_rows, TRANSACTION_FIELDS),
+    'meal-consumptions': (consumption_rows, CONSUMPTION_FIELDS),
+}
+
+
+def export_stream(name, export_format, start=None, end=None, compress=False):
+    """Byte chunks of export ``name`` as CSV or NDJSON, optionally gzipped."""
+    rows_for, fields = EXPORTS[name]
+    rows = rows_for(start, end)
+    lines = export_csv(rows, fields) if export_format == 'csv' else export_ndjson(rows)
+    chunks = _coalesce(line.encode('utf-8') for line in lines)
+    return _gzip(chunks) if compress else chunks
+
+
+def _between(query, column, start, end):
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column < end)
+    return query
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _coalesce(pieces, size=CHUNK_BYTES):
+    buffer, buffered = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzip(chunks):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,167 @@
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func
+
+from models import db, DailyItemSales, MealConsumption, MenuItem, RollupWatermark
+
+UNCATEGORIZED = 'other'
+
+
+class DemandForecaster:
+    """Per-item demand forecasts from the ``daily_item_sales`` rollup.
+
+    The model is seasonal exponential smoothing, computed for every menu
+    item at once as NumPy arrays: a day-of-week factor per item, taken from
+    the last ``FORECAST_HISTORY_DAYS`` days, and a smoothed deseasonalized
+    level.  A day's forecast is ``level * factor[weekday]``.
+
+    Only closed days feed the model, i.e. days before today whose
+    consumptions the rollup has already processed.  When new days close the
+    cached model just folds them into the level; a full refit (new factors,
+    new items) happens every ``FORECAST_REFIT_DAYS`` days or when the menu
+    changes.
+    """
+
+    def __init__(self):
+        self.history_days = 56
+        self.smoothing = 0.3
+        self.refit_days = 7
+        self._model = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.history_days = app.config['FORECAST_HISTORY_DAYS']
+        self.smoothing = app.config['FORECAST_SMOOTHING']
+        self.refit_days = app.config['FORECAST_REFIT_DAYS']
+        app.extensions['forecaster'] = self
+
+    def forecast(self, category=None, today=None):
+        """Next-day and next-week quantities per category, each with its items."""
+        today = today or datetime.utcnow().date()
+        model = self.model(today)
+        tomorrow = today + timedelta(days=1)
+        week = [tomorrow + timedelta(days=offset) for offset in range(7)]
+        next_day = model['level'] * model['season'][:, tomorrow.weekday()]
+        next_week = model['level'] * model['season'][:, [day.weekday() for day in week]].sum(axis=1)
+
+        categories = {}
+        for index, item in enumerate(model['items']):
+            name = item['category'] or UNCATEGORIZED
+            if category is not None and name != category:
+                continue
+            group = categories.setdefault(name, {'category': name, 'next_day': 0.0,
+                                                 'next_week': 0.0, 'items': []})
+            group['items'].append({'menu_item_id': item['id'], 'name': item['name'],
+                                   'next_day': round(float(next_day[index]), 1),
+                                   'next_week': round(float(next_week[index]), 1)})
+            group['next_day'] += float(next_day[index])
+            group['next_week'] += float(next_week[index])
+        for group in categories.values():
+            group['next_day'] = round(group['next_day'], 1)
+            group['next_week'] = round(group['next_week'], 1)
+        return {'date': tomorrow.isoformat(),
+                'week': [week[0].isoformat(), week[-1].isoformat()],
+                'trained_through': model['closed_through'].isoformat(),
+                'categories': sorted(categories.values(), key=lambda group: group['category'])}
+
+    def model(self, today):
+        """The cached model, brought up to the last closed day."""
+        closed_through = closed_through_day(today)
+        items = _menu_items()
+        with self._lock:
+            model = self._model
+            if (model is None
+                    or model['item_ids'] != [item['id'] for item in items]
+                    or (closed_through - model['fitted_through']).days >= self.refit_days):
+                model = self._fit(items, closed_through)
+            elif closed_through > model['closed_through']:
+                model = self._update(model, closed_through)
+            self._model = model
+            return model
+
+    def _fit(self, items, closed_through):
+        first = closed_through - timedelta(days=self.history_days - 1)
+        quantities = _daily_quantities([item['id'] for item in items], first, closed_through)
+        weekdays = np.array([(first + timedelta(days=offset)).weekday()
+                             for offset in range(self.history_days)])
+
+        # Mean per weekday over the item's overall mean; items without
+        # history get a flat profile
+        overall = quantities.mean(axis=1)
+        season = np.ones((len(items), 7))
+        for weekday in range(7):
+            columns = weekdays == weekday
+            if columns.any():
+                season[:, weekday] = quantities[:, columns].mean(axis=1)
+        has_history = overall > 0
+        season[has_history] /= overall[has_history, None]
+        season[~has_history] = 1.0
+        season[season == 0] = 0.05     # never forecast a permanently empty weekday
+
+        level = _smooth(quantities, season[:, weekdays], overall, self.smoothing)
+        return {'items': items, 'item_ids': [item['id'] for item in items],
+                'season': season, 'level': level,
+                'closed_through': closed_through, 'fitted_through': closed_through}
+
+    def _update(self, model, closed_through):
+        first = model['closed_through'] + timedelta(days=1)
+        quantities = _daily_quantities(model['item_ids'], first, closed_through)
+        weekdays = [(first + timedelta(days=offset)).weekday()
+                    for offset in range(quantities.shape[1])]
+        level = _smooth(quantities, model['season'][:, weekdays], model['level'], self.smoothing)
+        return dict(model, level=level, closed_through=closed_through)
+
+
+def closed_through_day(today):
+    """Last day that is over and fully counted in ``daily_item_sales``."""
+    yesterday = today - timedelta(days=1)
+    watermark = db.session.get(RollupWatermark, 'meal_consumptions')
+    if watermark is None or not watermark.last_id:
+        # Nothing rolled up yet: the earliest consumption, one seek on the
+        # consumed_at index
+        first_pending = db.session.query(func.min(MealConsumption.consumed_at)).scalar()
+    else:
+        # Only the rows since the last rollup run.  A bare MIN(consumed_at)
+        # would make SQLite walk the consumed_at index from its oldest entry;
+        # wrapping the column keeps the plan on the primary key range.
+        first_pending = (db.session.query(func.min(func.coalesce(MealConsumption.consumed_at,
+                                                                 MealConsumption.consumed_at)))
+                         .filter(MealConsumption.id > watermark.last_id)
+                         .scalar())
+    if first_pending is None or first_pending.date() > yesterday:
+        return yesterday
+    return first_pending.date() - timedelta(days=1)
+
+
+def _menu_items():
+    return [{'id': item.id, 'name': item.name, 'category': item.category}
+            for item in db.session.query(MenuItem.id, MenuItem.name, MenuItem.category)
+            .order_by(MenuItem.id)]
+
+
+def _daily_quantities(item_ids, first, last):
+    """``items x days`` matrix of quantities from ``first`` to ``last`` inclusive."""
+    days = (last - first).days + 1
+    quantities = np.zeros((len(item_ids), max(days, 0)))
+    if days <= 0 or not item_ids:
+        return quantities
+    rows = {item_id: index for index, item_id in enumerate(item_ids)}
+    for day, item_id, quantity in (db.session.query(DailyItemSales.day, DailyItemSales.menu_item_id,
+                                                    DailyItemSales.quantity)
+                                   .filter(DailyItemSales.day >= first, DailyItemSales.day <= last)):
+        if item_id in rows:
+            quantities[rows[item_id], (day - first).days] = quantity
+    return quantities
+
+
+def _smooth(quantities, factors, level, alpha):
+    """Fold each day's deseasonalized quantity into ``level``, all items at once."""
+    level = np.array(level, dtype=float)
+    for day in range(quantities.shape[1]):
+        level = alpha * quantities[:, day] / factors[:, day] + (1 - alpha) * level
+    return level
+
+
+forecaster = DemandForecaster()
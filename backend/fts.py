@@ -0,0 +1,61 @@
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+def fts_table_ddl(table, content_table, columns, prefix='2 3'):
+    """DDL for an external-content FTS5 table over ``content_table`` plus sync triggers.
+
+    The triggers keep the index in step with every write to the content
+    table, ORM or not.
+    """
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{name}' for name in columns)
+    old_values = ', '.join(f'old.{name}' for name in columns)
+    insert_new = (f"INSERT INTO {table}(rowid, {column_list}) VALUES (new.id, {new_values});")
+    delete_old = (f"INSERT INTO {table}({table}, rowid, {column_list}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        f"{column_list}, content='{content_table}', content_rowid='id', prefix='{prefix}')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {content_table} BEGIN "
+        f"{insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {content_table} BEGIN "
+        f"{delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {column_list} ON {content_table} BEGIN "
+        f"{delete_old} {insert_new} END",
+    ]
+
+
+def ensure_fts_index(connection, table, statements):
+    """Run ``statements`` if ``table`` is missing; False where FTS5 is unavailable."""
+    if connection.dialect.name != 'sqlite':
+        return False
+    created = not has_fts_index(connection, table)
+    try:
+        for statement in statements:
+            connection.execute(text(statement))
+        if created:
+            # Index the rows that predate the table
+            connection.execute(text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+    except OperationalError as e:
+        logger.warning(f"Full-text index {table} unavailable, falling back to LIKE: {e}")
+        return False
+    return True
+
+
+def has_fts_index(connection, table):
+    """Whether the full-text ``table`` exists; the migrations create it."""
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': table}).first() is not None
+
+
+def match_expression(search):
+    """FTS5 query matching every whitespace-separated term as a prefix."""
+    return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in search.split())
@@ -0,0 +1,30 @@
+# gunicorn configuration for the canteen API: gunicorn -c gunicorn.conf.py
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Threaded workers: request handlers mostly wait on SQLite and the network,
+# and WAL mode lets the threads' readers run alongside a single writer.
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# Keep the DB pool sized to the thread count (read by config.Config)
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = 500
+
+# The app is imported in each worker so no SQLite connection is ever
+# shared across a fork.
+preload_app = False
+
+# Requests are already logged by the application's access log
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User
+
+# Immutable snapshot of the fields authorization needs; safe to share across
+# threads and requests, unlike a session-bound User instance.
+CachedUser = namedtuple('CachedUser', 'id username email name role token_version')
+
+
+class UserCache:
+    """Small TTL + LRU cache of :class:`CachedUser` records keyed by user id.
+
+    Entries are dropped as soon as a User row is updated or deleted through
+    this process, after the commit.  Each drop also bumps the user's
+    generation, and a lookup only stores the row it read if the generation
+    is unchanged since before the read, so a reload racing the commit
+    cannot re-cache the old row.  Other workers pick the change up once
+    ``ttl`` expires.
+    """
+
+    def __init__(self, maxsize=10000, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config['USER_CACHE_SIZE']
+        self.ttl = app.config['USER_CACHE_TTL']
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+            generation = self._generations.get(user_id, 0)
+
+        row = (db.session.query(User.id, User.username, User.email, User.name,
+                                User.role, User.token_version)
+               .filter(User.id == user_id)
+               .first())
+        if row is None:
+            return None
+        user = CachedUser(row.id, row.username, row.email, row.name, row.role,
+                          row.token_version or 0)
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return user
+            self._entries[user_id] = (user, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def init_jwt(jwt):
+    """Register the identity callbacks on the ``JWTManager``.
+
+    Tokens carry the user id as a string ``sub`` plus ``role``, ``name`` and
+    ``tv`` (token version) claims.  Every authenticated request resolves the
+    user through :data:`user_cache`; a token whose version no longer matches
+    (the password was changed) is rejected.
+    """
+
+    @jwt.user_identity_loader
+    def user_identity(identity):
+        return str(identity.id if isinstance(identity, User) else identity)
+
+    @jwt.additional_claims_loader
+    def additional_claims(identity):
+        if not isinstance(identity, User):
+            return {}
+        return {'role': identity.role, 'name': identity.name, 'tv': identity.token_version or 0}
+
+    @jwt.user_lookup_loader
+    def user_lookup(jwt_header, jwt_data):
+        user = user_cache.get(int(jwt_data['sub']))
+        if user is None or user.token_version != jwt_data.get('tv', 0):
+            return None
+        return user
+
+
+def current_user_id():
+    """The authenticated user's id as an int (tokens store it as a string)."""
+    return int(get_jwt_identity())
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _queue_user_invalidation(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_invalidation(session):
+    session.info.pop('changed_user_ids', None)
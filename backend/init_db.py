@@ -1,11 +1,14 @@
-from app import app, db
+from flask_migrate import upgrade
+
+from app import create_app, db, MIGRATIONS_DIR
 from models import User, MenuItem, MealPlan, Transaction, MealConsumption
 from datetime import datetime, timedelta
 
-def init_db():
+def init_db(app=None):
+    app = app or create_app()
     with app.app_context():
-        # Create all tables
-        db.create_all()
+        # Create or bring the schema up to date
+        upgrade(directory=MIGRATIONS_DIR)
         
         # Check if admin user exists
         admin = User.query.filter_by(username='admin').first()
@@ -63,10 +66,7 @@ def init_db():
                 }
             ]
             
-            for item_data in sample_items:
-                item = MenuItem(**item_data)
-                db.session.add(item)
-            
+            db.session.bulk_insert_mappings(MenuItem, sample_items)
             db.session.commit()
             print("Added sample menu items")
 
@@ -0,0 +1,54 @@
+import hashlib
+import threading
+import time
+
+from flask import current_app
+
+
+class MenuCache:
+    """Pre-serialized ``GET /api/menu`` payload guarded by a menu version.
+
+    Every write to the menu bumps ``version``; the next read rebuilds the
+    JSON once (other threads wait on the lock instead of all querying
+    SQLite) and every read after that is served from memory.  The ETag is a
+    hash of the body rather than the version, so it is identical across
+    gunicorn workers that each hold their own copy.  ``ttl`` bounds how long
+    a worker can serve a menu that was changed through another worker.
+    """
+
+    def __init__(self, loader, ttl=30):
+        self.loader = loader
+        self.ttl = ttl
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('MENU_CACHE_TTL', self.ttl)
+        app.extensions['menu_cache'] = self
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+    def get(self):
+        """Return ``(body_bytes, etag)`` for the current menu version."""
+        entry = self._entry
+        if self._fresh(entry):
+            return entry[1], entry[2]
+
+        with self._lock:
+            entry = self._entry
+            if self._fresh(entry):
+                return entry[1], entry[2]
+            version = self.version
+            body = current_app.json.dumps(self.loader()).encode('utf-8')
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            self._entry = (version, body, etag, time.monotonic())
+            return body, etag
+
+    def _fresh(self, entry):
+        return (entry is not None
+                and entry[0] == self.version
+                and time.monotonic() - entry[3] < self.ttl)
@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import math
+
+from models import MenuItem
+from stock import parse_stock
+
+EXPORT_FIELDS = ['id', 'name', 'description', 'price', 'category', 'is_available', 'stock',
+                 'created_at', 'updated_at']
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n'}
+
+
+def read_import_rows(request):
+    """Rows to import from a JSON array body, a CSV body or a CSV file upload."""
+    upload = request.files.get('file')
+    if upload is not None:
+        return list(csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig')))
+    if request.mimetype == 'text/csv':
+        return list(csv.DictReader(io.StringIO(request.get_data(as_text=True))))
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of menu items or a CSV upload')
+    return data
+
+
+def validate_row(row):
+    """Return ``(mapping, errors)`` for one imported row."""
+    errors = []
+    if not isinstance(row, dict):
+        return None, ['row must be an object']
+
+    name = row.get('name')
+    if isinstance(name, str):
+        name = name.strip()
+    if not name or not isinstance(name, str):
+        errors.append('name is required')
+    elif len(name) > 100:
+        errors.append('name must be at most 100 characters')
+
+    price = row.get('price')
+    try:
+        if isinstance(price, bool):
+            raise TypeError(price)
+        price = float(price)
+        if not math.isfinite(price) or price <= 0:
+            errors.append('price must be a positive number')
+    except (TypeError, ValueError):
+        errors.append('price must be a number')
+
+    description = row.get('description') or None
+    if description is not None and not isinstance(description, str):
+        errors.append('description must be text')
+
+    category = row.get('category') or None
+    if category is not None and not isinstance(category, str):
+        errors.append('category must be text')
+    elif category is not None and len(category) > 50:
+        errors.append('category must be at most 50 characters')
+
+    is_available = row.get('is_available')
+    if is_available is None or is_available == '':
+        is_available = True
+    elif isinstance(is_available, str):
+        value = is_available.strip().lower()
+        if value in TRUE_VALUES:
+            is_available = True
+        elif value in FALSE_VALUES:
+            is_available = False
+        else:
+            errors.append('is_available must be true or false')
+    elif not isinstance(is_available, bool):
+        errors.append('is_available must be true or false')
+
+    try:
+        stock = parse_stock(row.get('stock'))
+    except ValueError as e:
+        errors.append(str(e))
+
+    if errors:
+        return None, errors
+    return {
+        'name': name,
+        'description': description,
+        'price': price,
+        'category': category,
+        'is_available': is_available and stock != 0,
+        'stock': stock,
+    }, []
+
+
+def export_rows(batch_size=500):
+    query = MenuItem.query.order_by(MenuItem.id).yield_per(batch_size)
+    for item in query:
+        yield item.to_dict()
+
+
+def export_csv(rows, fieldnames=EXPORT_FIELDS):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield _drain(buffer)
+    yield _drain(buffer)
+
+
+def export_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def _drain(buffer):
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
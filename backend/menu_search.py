@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import Float, Integer, column, event, text
+
+from fts import ensure_fts_index, fts_table_ddl, has_fts_index, match_expression
+from models import db, MenuItem
+
+SEARCH_INDEX_DDL = fts_table_ddl('menu_items_fts', 'menu_items', ('name', 'description'))
+# bm25 is lower-is-better; a hit in the name weighs ten times one in the description
+SEARCH_MATCH = text(
+    'SELECT rowid, bm25(menu_items_fts, 10.0, 1.0) AS rank FROM menu_items_fts '
+    'WHERE menu_items_fts MATCH :match'
+).columns(column('rowid', Integer), column('rank', Float))
+MAX_RESULTS = 100
+UNCATEGORIZED = 'other'
+
+
+def ensure_search_index(connection):
+    return ensure_fts_index(connection, 'menu_items_fts', SEARCH_INDEX_DDL)
+
+
+class MenuSearch:
+    """Menu search and per-category browsing.
+
+    Browsing a category (no search text) is served from a grouping built
+    once per menu version: one query splits the catalog by category and
+    each group is serialized up front, together with its ETag, so the menu
+    screen can fetch just the current meal.  Like :class:`MealItemLookup` it
+    follows the app's ``menu_cache`` version and TTL.  Text searches go
+    to the ``menu_items_fts`` index and are ranked by bm25.
+    """
+
+    def __init__(self):
+        self.menu_cache = None
+        self.fts = False
+        self._groups = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.menu_cache = app.extensions['menu_cache']
+        with app.app_context():
+            with db.engine.connect() as connection:
+                self.fts = has_fts_index(connection, 'menu_items_fts')
+        app.extensions['menu_search'] = self
+
+    def category(self, category, available=None):
+        """``(body, etag)`` of one category (``None`` for every item), from the grouping."""
+        groups = self._grouping()
+        key = (category, available)
+        if key not in groups['bodies']:
+            groups['bodies'][key] = _serialize(groups['items'], category, available)
+        return groups['bodies'][key]
+
+    def categories(self):
+        """Item counts per category, for the category tabs."""
+        return [{'category': name,
+                 'items': len(group),
+                 'available': sum(1 for item in group if item['is_available'])}
+                for name, group in self._grouping()['items'].items()]
+
+    def search(self, q, category=None, available=None, limit=50):
+        query = MenuItem.query
+        if category is not None:
+            category_filter = (MenuItem.category.is_(None) if category == UNCATEGORIZED
+                               else MenuItem.category == category)
+            query = query.filter(category_filter)
+        if available is not None:
+            query = query.filter(MenuItem.is_available == available)
+
+        if self.fts:
+            matches = SEARCH_MATCH.bindparams(match=match_expression(q)).subquery('matches')
+            query = (query.join(matches, matches.c.rowid == MenuItem.id)
+                     .order_by(matches.c.rank, MenuItem.id))
+        else:
+            for term in q.split():
+                pattern = '%' + term.replace('%', r'\%').replace('_', r'\_') + '%'
+                query = query.filter(MenuItem.name.like(pattern, escape='\\')
+                                     | MenuItem.description.like(pattern, escape='\\'))
+            query = query.order_by(MenuItem.name, MenuItem.id)
+        return [item.to_dict() for item in query.limit(max(1, min(limit, MAX_RESULTS)))]
+
+    def _grouping(self):
+        version = self.menu_cache.version
+        groups = self._groups
+        if self._fresh(groups, version):
+            return groups
+        with self._lock:
+            groups = self._groups
+            if self._fresh(groups, version):
+                return groups
+            items = OrderedDict()
+            for item in MenuItem.query.order_by(MenuItem.category, MenuItem.name, MenuItem.id):
+                items.setdefault(item.category or UNCATEGORIZED, []).append(item.to_dict())
+            # Serialize every category up front; other filter combinations
+            # are added on first use
+            bodies = {(name, None): _serialize(items, name, None) for name in items}
+            groups = {'version': version, 'built_at': time.monotonic(),
+                      'items': items, 'bodies': bodies}
+            self._groups = groups
+            return groups
+
+    def _fresh(self, groups, version):
+        return (groups is not None
+                and groups['version'] == version
+                and time.monotonic() - groups['built_at'] < self.menu_cache.ttl)
+
+
+def _serialize(grouped_items, category, available):
+    items = [item for name, group in grouped_items.items()
+             if category is None or name == category
+             for item in group
+             if available is None or item['is_available'] == available]
+    body = current_app.json.dumps({'items': items, 'total': len(items)}).encode('utf-8')
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+
+# Migration 0004 creates the index; this covers schemas from ``db.create_all()``
+@event.listens_for(MenuItem.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    menu_search.fts = ensure_search_index(connection)
+
+
+menu_search = MenuSearch()
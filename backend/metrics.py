@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+
+import psutil
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, const=()):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        names = tuple(name for name, _ in const) + self.labelnames
+        values = tuple(value for _, value in const)
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(names, values + labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self, const=()):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = tuple(name for name, _ in const) + self.labelnames
+        values = tuple(value for _, value in const)
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._values.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                le = _labels(names + ('le',), values + labels + (_format_bound(bound),))
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            label_str = _labels(names, values + labels)
+            lines.append(f'{self.name}_sum{label_str} {series[-1]}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+
+class Metrics:
+    """Per-process request, query and connection pool metrics in Prometheus text format.
+
+    Each gunicorn worker keeps its own numbers; every sample carries a
+    ``worker`` label with the pid.  Latency is measured until the response is
+    returned, so a streamed body (exports, event streams) only counts its
+    setup time.  Queries issued outside a request are reported under the
+    ``(background)`` route.
+    """
+
+    def __init__(self):
+        self.requests = Counter(
+            'canteen_http_requests_total', 'HTTP requests by route and status.',
+            ('method', 'route', 'status'))
+        self.latency = Histogram(
+            'canteen_http_request_duration_seconds', 'Time to produce a response.',
+            ('method', 'route'))
+        self.queries_per_request = Histogram(
+            'canteen_db_queries_per_request', 'SQL statements executed per request.',
+            ('method', 'route'), QUERY_COUNT_BUCKETS)
+        self.query_time_per_request = Histogram(
+            'canteen_db_query_duration_per_request_seconds', 'Time spent in SQL per request.',
+            ('method', 'route'))
+        self.query_seconds = Counter(
+            'canteen_db_query_seconds_total', 'Time spent executing SQL statements.',
+            ('route',))
+        self.queries = Counter(
+            'canteen_db_queries_total', 'SQL statements executed.', ('route',))
+        self.pool_wait = Histogram(
+            'canteen_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+            (), POOL_WAIT_BUCKETS)
+        self.pool_timeouts = Counter(
+            'canteen_db_pool_timeouts_total', 'Connection checkouts that timed out.')
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['metrics'] = self
+
+    def init_engine(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+
+    def _after_request(self, response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = _route()
+        self.requests.inc((request.method, route, str(response.status_code)))
+        self.latency.observe((request.method, route), time.perf_counter() - start)
+        self.queries_per_request.observe((request.method, route), g.metrics_queries)
+        self.query_time_per_request.observe((request.method, route), g.metrics_query_seconds)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_query_start'].pop()
+        if has_request_context() and 'metrics_start' in g:
+            g.metrics_queries += 1
+            g.metrics_query_seconds += elapsed
+            route = _route()
+        else:
+            route = '(background)'
+        self.queries.inc((route,))
+        self.query_seconds.inc((route,), elapsed)
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None:
+            starts = context.connection.info.get('metrics_query_start')
+            if starts:
+                starts.pop()
+
+    def render(self, engine=None, gauges=()):
+        """The exposition text; ``gauges`` are extra ``(name, help, value)`` samples."""
+        const = (('worker', str(os.getpid())),)
+        lines = []
+        for metric in (self.requests, self.latency, self.queries_per_request,
+                       self.query_time_per_request, self.queries, self.query_seconds,
+                       self.pool_wait, self.pool_timeouts):
+            lines.extend(metric.render(const))
+
+        samples = list(self._process_samples())
+        if engine is not None and isinstance(engine.pool, QueuePool):
+            pool = engine.pool
+            samples += [
+                ('canteen_db_pool_size', 'Configured pool size.', pool.size()),
+                ('canteen_db_pool_checked_out', 'Connections currently checked out.', pool.checkedout()),
+                ('canteen_db_pool_overflow', 'Connections open beyond the pool size.', max(pool.overflow(), 0)),
+            ]
+        samples += list(gauges)
+        worker = _labels(('worker',), (const[0][1],))
+        for name, help_text, value in samples:
+            kind = 'counter' if name.endswith('_total') else 'gauge'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name}{worker} {value}']
+        return '\n'.join(lines) + '\n'
+
+    def _process_samples(self):
+        process = psutil.Process()
+        with process.oneshot():
+            cpu = process.cpu_times()
+            yield ('process_resident_memory_bytes', 'Resident memory size.', process.memory_info().rss)
+            yield ('process_cpu_seconds_total', 'User and system CPU time.', cpu.user + cpu.system)
+            yield ('process_threads', 'OS threads in the process.', process.num_threads())
+            if hasattr(process, 'num_fds'):
+                yield ('process_open_fds', 'Open file descriptors.', process.num_fds())
+            yield ('process_start_time_seconds', 'Start time since the epoch.', process.create_time())
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            metrics.pool_timeouts.inc()
+            raise
+        finally:
+            metrics.pool_wait.observe((), time.perf_counter() - start)
+
+
+def _route():
+    # The URL rule, not the path, keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule else '(unmatched)'
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return bound if isinstance(bound, str) else repr(float(bound))
+
+
+metrics = Metrics()
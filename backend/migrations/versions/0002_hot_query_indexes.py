@@ -0,0 +1,43 @@
+"""Indexes for the hot queries: per-user history, admin filters, menu categories, foreign keys
+
+Revision ID: 0002_hot_query_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-18 13:20:00
+
+``flask check-query-plans`` runs the hot routes and fails if any of their
+queries scans one of these tables without an index.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_hot_query_indexes'
+down_revision = '0001_initial_schema'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    # (name, table, columns)
+    ('ix_users_created_at', 'users', ['created_at']),
+    ('ix_menu_items_category_available', 'menu_items', ['category', 'is_available']),
+    ('ix_meal_plans_user_dates', 'meal_plans', ['user_id', 'start_date', 'end_date']),
+    ('ix_meal_plans_end_date', 'meal_plans', ['end_date']),
+    ('ix_transactions_user_created', 'transactions', ['user_id', 'created_at']),
+    ('ix_transactions_status_type_created', 'transactions', ['status', 'transaction_type', 'created_at']),
+    ('ix_transactions_created_at', 'transactions', ['created_at']),
+    ('ix_transactions_updated_at', 'transactions', ['updated_at']),
+    ('ix_meal_consumptions_user_consumed', 'meal_consumptions', ['user_id', 'consumed_at']),
+    ('ix_meal_consumptions_consumed_at', 'meal_consumptions', ['consumed_at']),
+    ('ix_meal_consumptions_transaction_id', 'meal_consumptions', ['transaction_id']),
+    ('ix_meal_consumptions_menu_item_id', 'meal_consumptions', ['menu_item_id']),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,170 @@
+"""Tables and columns added since the initial schema
+
+QR tokens, dashboard counters, idempotency keys, the event outbox, the daily
+rollups, the wallet, password token versions and per-meal plan flags.
+
+Revision ID: 0003_feature_tables
+Revises: 0002_hot_query_indexes
+Create Date: 2026-10-18 13:20:00
+
+Like the initial revision it skips whatever ``db.create_all()`` already
+created, so databases from before migrations upgrade cleanly.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_feature_tables'
+down_revision = '0002_hot_query_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    user_columns = {column['name'] for column in inspector.get_columns('users')}
+    if 'token_version' not in user_columns:
+        with op.batch_alter_table('users') as batch_op:
+            batch_op.add_column(sa.Column('token_version', sa.Integer(), nullable=False,
+                                          server_default='0'))
+
+    plan_columns = {column['name'] for column in inspector.get_columns('meal_plans')}
+    missing = [name for name in ('breakfast_allowed', 'lunch_allowed', 'dinner_allowed')
+               if name not in plan_columns]
+    if missing:
+        with op.batch_alter_table('meal_plans') as batch_op:
+            for name in missing:
+                batch_op.add_column(sa.Column(name, sa.Boolean(), nullable=False,
+                                              server_default=sa.true()))
+
+    if 'qr_tokens' not in existing:
+        op.create_table(
+            'qr_tokens',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('token', sa.String(length=36), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('expires_at', sa.DateTime(), nullable=False),
+            sa.Column('used_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('token')
+        )
+        op.create_index('ix_qr_tokens_user_created', 'qr_tokens', ['user_id', 'created_at'])
+
+    if 'stat_counters' not in existing:
+        op.create_table(
+            'stat_counters',
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('value', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+    if 'idempotency_keys' not in existing:
+        op.create_table(
+            'idempotency_keys',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=100), nullable=False),
+            sa.Column('request_hash', sa.String(length=64), nullable=False),
+            sa.Column('transaction_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key')
+        )
+
+    if 'events' not in existing:
+        op.create_table(
+            'events',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=True),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_events_created_at', 'events', ['created_at'])
+
+    if 'daily_item_sales' not in existing:
+        op.create_table(
+            'daily_item_sales',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('menu_item_id', sa.Integer(), nullable=False),
+            sa.Column('category', sa.String(length=50), nullable=True),
+            sa.Column('quantity', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'menu_item_id')
+        )
+        op.create_index('ix_daily_item_sales_category_day', 'daily_item_sales', ['category', 'day'])
+
+    if 'daily_transaction_totals' not in existing:
+        op.create_table(
+            'daily_transaction_totals',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('transaction_type', sa.String(length=20), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('amount', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('day', 'transaction_type', 'status')
+        )
+
+    if 'rollup_watermarks' not in existing:
+        op.create_table(
+            'rollup_watermarks',
+            sa.Column('name', sa.String(length=50), nullable=False),
+            sa.Column('last_id', sa.Integer(), nullable=True),
+            sa.Column('last_time', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('name')
+        )
+
+    if 'wallets' not in existing:
+        op.create_table(
+            'wallets',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('balance_minor', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('user_id')
+        )
+
+    if 'wallet_ledger' not in existing:
+        op.create_table(
+            'wallet_ledger',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('entry_type', sa.String(length=20), nullable=False),
+            sa.Column('amount_minor', sa.Integer(), nullable=False),
+            sa.Column('balance_after_minor', sa.Integer(), nullable=False),
+            sa.Column('transaction_id', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id']),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_wallet_ledger_user_created', 'wallet_ledger', ['user_id', 'created_at'])
+        op.create_index('ix_wallet_ledger_transaction_id', 'wallet_ledger', ['transaction_id'])
+
+
+def downgrade():
+    op.drop_table('wallet_ledger')
+    op.drop_table('wallets')
+    op.drop_table('rollup_watermarks')
+    op.drop_table('daily_transaction_totals')
+    op.drop_table('daily_item_sales')
+    op.drop_table('events')
+    op.drop_table('idempotency_keys')
+    op.drop_table('stat_counters')
+    op.drop_table('qr_tokens')
+    with op.batch_alter_table('meal_plans') as batch_op:
+        batch_op.drop_column('dinner_allowed')
+        batch_op.drop_column('lunch_allowed')
+        batch_op.drop_column('breakfast_allowed')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('token_version')
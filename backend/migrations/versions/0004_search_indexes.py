@@ -0,0 +1,86 @@
+"""Full-text search indexes for the user directory and the menu
+
+Revision ID: 0004_search_indexes
+Revises: 0003_feature_tables
+Create Date: 2026-10-18 13:20:00
+
+The FTS5 tables and their sync triggers are created here only; at startup
+the app just checks whether they exist.  Where FTS5 is unavailable the app
+falls back to LIKE and this revision is a no-op.
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_search_indexes'
+down_revision = '0003_feature_tables'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# External-content FTS5 tables, prefix-indexed for search-as-you-type, and
+# the triggers that keep them in step with every write to the content table
+SEARCH_INDEXES = {
+    'users_fts': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+        "username, name, email, content='users', content_rowid='id', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_fts(rowid, username, name, email) "
+        "VALUES (new.id, new.username, new.name, new.email); END",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, username, name, email) "
+        "VALUES ('delete', old.id, old.username, old.name, old.email); END",
+        "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, name, email ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, username, name, email) "
+        "VALUES ('delete', old.id, old.username, old.name, old.email); "
+        "INSERT INTO users_fts(rowid, username, name, email) "
+        "VALUES (new.id, new.username, new.name, new.email); END",
+    ],
+    'menu_items_fts': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS menu_items_fts USING fts5("
+        "name, description, content='menu_items', content_rowid='id', prefix='2 3')",
+        "CREATE TRIGGER IF NOT EXISTS menu_items_fts_ai AFTER INSERT ON menu_items BEGIN "
+        "INSERT INTO menu_items_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS menu_items_fts_ad AFTER DELETE ON menu_items BEGIN "
+        "INSERT INTO menu_items_fts(menu_items_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS menu_items_fts_au AFTER UPDATE OF name, description ON menu_items BEGIN "
+        "INSERT INTO menu_items_fts(menu_items_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO menu_items_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+    ],
+}
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'sqlite':
+        return
+    existing = set(sa.inspect(connection).get_table_names())
+    for table, statements in SEARCH_INDEXES.items():
+        if table in existing:
+            continue
+        try:
+            # A savepoint, so a missing FTS5 module leaves the migration usable
+            with connection.begin_nested():
+                for statement in statements:
+                    connection.execute(sa.text(statement))
+                # Index the rows that predate the table
+                connection.execute(sa.text(f"INSERT INTO {table}({table}) VALUES ('rebuild')"))
+        except sa.exc.OperationalError as e:
+            logger.warning(f"Full-text index {table} unavailable, search falls back to LIKE: {e}")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in SEARCH_INDEXES:
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+        op.execute(f'DROP TABLE IF EXISTS {table}')
@@ -0,0 +1,26 @@
+"""Record the counter device behind meal consumptions synced from offline scans
+
+Revision ID: 0005_offline_scan_device
+Revises: 0004_search_indexes
+Create Date: 2026-10-18 14:05:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_offline_scan_device'
+down_revision = '0004_search_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('meal_consumptions') as batch_op:
+        batch_op.add_column(sa.Column('device_id', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('meal_consumptions') as batch_op:
+        batch_op.drop_column('device_id')
@@ -0,0 +1,43 @@
+"""Per-item stock counts and cart reservations
+
+Revision ID: 0006_menu_stock
+Revises: 0005_offline_scan_device
+Create Date: 2026-10-18 15:10:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_menu_stock'
+down_revision = '0005_offline_scan_device'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('menu_items') as batch_op:
+        batch_op.add_column(sa.Column('stock', sa.Integer(), nullable=True))
+
+    op.create_table(
+        'stock_reservations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('menu_item_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['menu_item_id'], ['menu_items.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_reservations_user_item', 'stock_reservations',
+                    ['user_id', 'menu_item_id'])
+    op.create_index('ix_stock_reservations_expires_at', 'stock_reservations', ['expires_at'])
+
+
+def downgrade():
+    op.drop_table('stock_reservations')
+    with op.batch_alter_table('menu_items') as batch_op:
+        batch_op.drop_column('stock')
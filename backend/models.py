@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import json
 
 db = SQLAlchemy()
 
@@ -13,15 +14,23 @@ class User(db.Model):
     password_hash = db.Column(db.String(128))
     name = db.Column(db.String(120))
     role = db.Column(db.String(20), default='user')  # 'admin' or 'user'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever the password changes; tokens carrying an older version are rejected
+    token_version = db.Column(db.Integer, nullable=False, default=0)
+    # Admin user directory lists newest users first
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     # Relationships
     meal_plans = db.relationship('MealPlan', backref='user', lazy=True)
     transactions = db.relationship('Transaction', backref='user', lazy=True)
     meal_consumptions = db.relationship('MealConsumption', backref='user', lazy=True)
+    qr_tokens = db.relationship('QRToken', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.set_password_hash(generate_password_hash(password))
+
+    def set_password_hash(self, password_hash):
+        self.password_hash = password_hash
+        self.token_version = (self.token_version or 0) + 1
 
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
@@ -38,6 +47,10 @@ class User(db.Model):
 
 class MenuItem(db.Model):
     __tablename__ = 'menu_items'
+    __table_args__ = (
+        # Category browsing, optionally only what is available
+        db.Index('ix_menu_items_category_available', 'category', 'is_available'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -45,6 +58,8 @@ class MenuItem(db.Model):
     price = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50))  # e.g., 'breakfast', 'lunch', 'dinner'
     is_available = db.Column(db.Boolean, default=True)
+    # Portions left to sell or reserve; NULL when the item is not stock-tracked
+    stock = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -56,18 +71,28 @@ class MenuItem(db.Model):
             'price': self.price,
             'category': self.category,
             'is_available': self.is_available,
+            'stock': self.stock,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 class MealPlan(db.Model):
     __tablename__ = 'meal_plans'
+    __table_args__ = (
+        # Plans of one user covering a point in time
+        db.Index('ix_meal_plans_user_dates', 'user_id', 'start_date', 'end_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     plan_type = db.Column(db.String(50), nullable=False)  # e.g., 'daily', 'weekly', 'monthly'
     start_date = db.Column(db.DateTime, nullable=False)
-    end_date = db.Column(db.DateTime, nullable=False)
+    # Plans still running on a given day, for the eligibility map
+    end_date = db.Column(db.DateTime, nullable=False, index=True)
+    # Which meals the plan covers
+    breakfast_allowed = db.Column(db.Boolean, nullable=False, default=True)
+    lunch_allowed = db.Column(db.Boolean, nullable=False, default=True)
+    dinner_allowed = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -78,20 +103,30 @@ class MealPlan(db.Model):
             'plan_type': self.plan_type,
             'start_date': self.start_date.isoformat(),
             'end_date': self.end_date.isoformat(),
+            'breakfast_allowed': self.breakfast_allowed,
+            'lunch_allowed': self.lunch_allowed,
+            'dinner_allowed': self.dinner_allowed,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Per-user history, newest first
+        db.Index('ix_transactions_user_created', 'user_id', 'created_at'),
+        # Admin listing filtered by status/type, newest first
+        db.Index('ix_transactions_status_type_created', 'status', 'transaction_type', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)  # 'purchase', 'refund', etc.
     status = db.Column(db.String(20), nullable=False)  # 'pending', 'completed', 'failed'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Indexed for the rollup job, which picks up rows changed since its watermark
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     # Relationship with MealConsumption
     meal_consumptions = db.relationship('MealConsumption', backref='transaction', lazy=True)
@@ -109,12 +144,19 @@ class Transaction(db.Model):
 
 class MealConsumption(db.Model):
     __tablename__ = 'meal_consumptions'
+    __table_args__ = (
+        # Per-user meal history, newest first
+        db.Index('ix_meal_consumptions_user_consumed', 'user_id', 'consumed_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
-    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_items.id'), nullable=False)
-    consumed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Foreign keys are indexed for the joins and for deleting a menu item
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False, index=True)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_items.id'), nullable=False, index=True)
+    consumed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Counter device that captured the scan offline; None for live scans
+    device_id = db.Column(db.String(64))
     
     # Relationship with MenuItem
     menu_item = db.relationship('MenuItem', backref='consumptions', lazy=True)
@@ -128,3 +170,152 @@ class MealConsumption(db.Model):
             'menu_item': self.menu_item.to_dict() if self.menu_item else None,
             'consumed_at': self.consumed_at.isoformat()
         }
+
+class QRToken(db.Model):
+    __tablename__ = 'qr_tokens'
+    __table_args__ = (
+        # Latest token for a user
+        db.Index('ix_qr_tokens_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    token = db.Column(db.String(36), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    used_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'qr_uuid': self.token,
+            'created_at': self.created_at.isoformat(),
+            'expires_at': self.expires_at.isoformat(),
+            'used_at': self.used_at.isoformat() if self.used_at else None
+        }
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+
+    # e.g. 'transactions.total', 'transactions.type:meal', 'users.role:admin'
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    # Hash of the request body, to reject a key reused for a different cart
+    request_hash = db.Column(db.String(64), nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Wallet(db.Model):
+    # Materialized balance per user, kept in step with wallet_ledger by
+    # wallet.post(); ``version`` guards it with optimistic concurrency
+    __tablename__ = 'wallets'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    balance_minor = db.Column(db.Integer, nullable=False, default=0)  # paise
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LedgerEntry(db.Model):
+    # Append-only record of every balance change
+    __tablename__ = 'wallet_ledger'
+    __table_args__ = (
+        # Per-user statement, newest first
+        db.Index('ix_wallet_ledger_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    entry_type = db.Column(db.String(20), nullable=False)  # 'recharge', 'purchase', ...
+    amount_minor = db.Column(db.Integer, nullable=False)  # signed: credits are positive
+    balance_after_minor = db.Column(db.Integer, nullable=False)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'entry_type': self.entry_type,
+            'amount': self.amount_minor / 100,
+            'balance_after': self.balance_after_minor / 100,
+            'transaction_id': self.transaction_id,
+            'created_at': self.created_at.isoformat()
+        }
+
+class Event(db.Model):
+    # Outbox for the live event stream: written in the same database
+    # transaction as the change it describes, pruned by events.EventBroker
+    __tablename__ = 'events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'transaction' or 'menu'
+    # Owner of a transaction event; NULL for events every subscriber receives
+    user_id = db.Column(db.Integer)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'data': json.loads(self.payload),
+        }
+
+class DailyItemSales(db.Model):
+    # Meal consumptions per day and menu item, maintained by rollups.run()
+    __tablename__ = 'daily_item_sales'
+    __table_args__ = (
+        db.Index('ix_daily_item_sales_category_day', 'category', 'day'),
+    )
+
+    day = db.Column(db.Date, primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50))
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyTransactionTotal(db.Model):
+    # Transactions per day, type and status, maintained by rollups.run()
+    __tablename__ = 'daily_transaction_totals'
+
+    day = db.Column(db.Date, primary_key=True)
+    transaction_type = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+
+class RollupWatermark(db.Model):
+    # How far each rollup source has been processed: an id for insert-only
+    # tables, an updated_at cutoff for tables whose rows change
+    __tablename__ = 'rollup_watermarks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer)
+    last_time = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StockReservation(db.Model):
+    # Portions of a menu item held for a cart in progress; already taken
+    # out of menu_items.stock and given back when the reservation expires
+    __tablename__ = 'stock_reservations'
+    __table_args__ = (
+        db.Index('ix_stock_reservations_user_item', 'user_id', 'menu_item_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_items.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,103 @@
+import base64
+import json
+import math
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, row_id, direction='next'):
+    """Opaque cursor for the row at ``(sort_value, row_id)``."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            raise ValueError(direction)
+        return datetime.fromisoformat(sort_value), int(row_id), direction
+    except (ValueError, TypeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(str(cursor)) from e
+
+
+def page_args(args):
+    """Read ``page``/``per_page``/``cursor`` from request args, clamped to sane bounds."""
+    page = max(args.get('page', 1, type=int) or 1, 1)
+    per_page = args.get('per_page', DEFAULT_PER_PAGE, type=int) or DEFAULT_PER_PAGE
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    return page, per_page, args.get('cursor') or None
+
+
+def keyset_paginate(query, sort_column, id_column, page, per_page, cursor=None, count=True):
+    """Paginate ``query`` newest-first on ``(sort_column, id_column)``.
+
+    With a cursor the page is found by seeking the index, so page 500 costs
+    the same as page 1.  Without one (a jump straight to a page number from
+    the pager) it falls back to an OFFSET over the same index.  Returns
+    ``(rows, pagination)`` where ``pagination`` carries ``current_page``,
+    ``total_pages`` and the ``next_cursor``/``prev_cursor`` to follow.
+    """
+    total = query.order_by(None).count() if count else None
+
+    if cursor:
+        sort_value, row_id, direction = decode_cursor(cursor)
+        if direction == 'next':
+            seek = or_(sort_column < sort_value,
+                       and_(sort_column == sort_value, id_column < row_id))
+            rows = (query.filter(seek)
+                    .order_by(sort_column.desc(), id_column.desc())
+                    .limit(per_page + 1).all())
+            has_more = len(rows) > per_page
+            rows = rows[:per_page]
+            has_next, has_prev = has_more, True
+        else:
+            seek = or_(sort_column > sort_value,
+                       and_(sort_column == sort_value, id_column > row_id))
+            rows = (query.filter(seek)
+                    .order_by(sort_column.asc(), id_column.asc())
+                    .limit(per_page + 1).all())
+            has_more = len(rows) > per_page
+            rows = list(reversed(rows[:per_page]))
+            has_next, has_prev = True, has_more
+    else:
+        rows = (query.order_by(sort_column.desc(), id_column.desc())
+                .offset((page - 1) * per_page)
+                .limit(per_page + 1).all())
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = page > 1
+
+    pagination = {
+        'current_page': page,
+        'per_page': per_page,
+        'total': total,
+        'total_pages': max(math.ceil(total / per_page), 1) if total is not None else None,
+        'next_cursor': None,
+        'prev_cursor': None,
+    }
+    if rows:
+        first = _key(rows[0], sort_column, id_column)
+        last = _key(rows[-1], sort_column, id_column)
+        if has_next:
+            pagination['next_cursor'] = encode_cursor(*last, direction='next')
+        if has_prev:
+            pagination['prev_cursor'] = encode_cursor(*first, direction='prev')
+    return rows, pagination
+
+
+def _key(row, sort_column, id_column):
+    # Rows are either a model instance or a (model, *extra_columns) row
+    entity = row[0] if hasattr(row, '_fields') else row
+    return getattr(entity, sort_column.key), getattr(entity, id_column.key)
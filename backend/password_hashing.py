@@ -0,0 +1,148 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def hash_password(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def verify_password(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """Runs the deliberately slow password KDF off the request threads.
+
+    With ``PASSWORD_HASH_EXECUTOR = 'process'`` hashes run in a process pool,
+    so a burst of logins neither holds the GIL nor ties up every gunicorn
+    thread.  At most ``max_pending`` hashes may be queued or running per
+    worker; past that :class:`HasherBusy` is raised immediately so the caller
+    can answer 503 instead of letting requests pile up, and a hash that takes
+    longer than ``timeout`` seconds raises it too.  ``'inline'`` hashes
+    on the calling thread (development, scripts).
+    """
+
+    def __init__(self):
+        self.method = 'pbkdf2:sha256:600000'
+        self.executor_kind = 'inline'
+        self.workers = 2
+        self.max_pending = 32
+        self.timeout = 10
+        self._canonical_method = None
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._metrics = {
+            'hashes': 0,
+            'verifications': 0,
+            'rehashes': 0,
+            'shed': 0,
+            'login_success': 0,
+            'login_failure': 0,
+            'hash_seconds_total': 0.0,
+        }
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.executor_kind = app.config['PASSWORD_HASH_EXECUTOR']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._canonical_method = None
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        self._count('hashes')
+        return self._run(hash_password, password, self.method)
+
+    def verify(self, password_hash, password):
+        if not password_hash or password is None:
+            return False
+        self._count('verifications')
+        return self._run(verify_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with other cost parameters than configured."""
+        return password_hash.split('$', 1)[0] != self.canonical_method
+
+    @property
+    def canonical_method(self):
+        # 'scrypt' is stored as 'scrypt:32768:8:1' etc.; hash once to learn
+        # the exact prefix the configured method produces
+        if self._canonical_method is None:
+            self._canonical_method = generate_password_hash('', method=self.method).split('$', 1)[0]
+        return self._canonical_method
+
+    def record_login(self, success):
+        self._count('login_success' if success else 'login_failure')
+
+    def record_rehash(self):
+        self._count('rehashes')
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['pending'] = self._pending
+        return metrics
+
+    def _run(self, func, *args):
+        if self.executor_kind == 'inline':
+            return self._timed(func, *args)
+
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._metrics['shed'] += 1
+                raise HasherBusy()
+            self._pending += 1
+        try:
+            future = executor.submit(func, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        # The slot is held until the hash finishes, not until the caller
+        # gives up on it, so timed-out hashes still count against max_pending
+        future.add_done_callback(self._done)
+        try:
+            return self._timed(future.result, self.timeout)
+        except TimeoutError:
+            future.cancel()
+            self._count('shed')
+            raise HasherBusy()
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._metrics['hash_seconds_total'] += time.perf_counter() - started
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.executor_kind == 'process':
+                    # spawn: never fork a copy of a multi-threaded worker
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='password-hash')
+            return self._executor
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
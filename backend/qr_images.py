@@ -0,0 +1,119 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from io import BytesIO
+
+import qrcode
+from qrcode.constants import ERROR_CORRECT_H, ERROR_CORRECT_L, ERROR_CORRECT_M, ERROR_CORRECT_Q
+
+ERROR_CORRECTION_LEVELS = {
+    'L': ERROR_CORRECT_L,
+    'M': ERROR_CORRECT_M,
+    'Q': ERROR_CORRECT_Q,
+    'H': ERROR_CORRECT_H,
+}
+
+
+class RendererBusy(Exception):
+    pass
+
+
+def render_png(data, box_size, error_correction):
+    qr = qrcode.QRCode(
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=box_size,
+        border=4,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+    buffer = BytesIO()
+    qr.make_image(fill_color='black', back_color='white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def image_etag(token, box_size, error_correction):
+    return hashlib.sha256(f'{token}:{box_size}:{error_correction}'.encode()).hexdigest()[:32]
+
+
+class QRImageCache:
+    """LRU of rendered QR PNGs, rendered on a small bounded thread pool.
+
+    Images are keyed by ``(token, box_size, error_correction)`` and dropped
+    as soon as their token is rotated or redeemed.  At most ``workers``
+    renders run at once and at most ``max_pending`` may be queued or
+    running; beyond that :class:`RendererBusy` is raised so callers can shed
+    load instead of piling up threads behind Pillow, as it is for a caller
+    whose render outlasts ``timeout``.  Concurrent requests for the same
+    image share one render.
+    """
+
+    def __init__(self, maxsize=512, workers=2, max_pending=16):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_pending = max_pending
+        self._images = OrderedDict()
+        self._by_token = {}
+        self._inflight = {}
+        # Re-entrant: a render that finishes before add_done_callback returns
+        # runs _store in the submitting thread, which already holds the lock
+        self._lock = threading.RLock()
+        self._executor = None
+        self._slots = None
+
+    def init_app(self, app):
+        self.maxsize = app.config['QR_IMAGE_CACHE_SIZE']
+        self.workers = app.config['QR_RENDER_WORKERS']
+        self.max_pending = app.config['QR_RENDER_MAX_PENDING']
+        app.extensions['qr_images'] = self
+
+    def get(self, token, box_size, error_correction, timeout=5):
+        key = (token, box_size, error_correction)
+        with self._lock:
+            png = self._images.get(key)
+            if png is not None:
+                self._images.move_to_end(key)
+                return png
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._submit(key)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # The render keeps its slot and is still cached when it finishes
+            raise RendererBusy()
+
+    def evict(self, token):
+        with self._lock:
+            for key in self._by_token.pop(token, ()):
+                self._images.pop(key, None)
+
+    def _submit(self, key):
+        # Called with self._lock held
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='qr-render')
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+        if not self._slots.acquire(blocking=False):
+            raise RendererBusy()
+        future = self._executor.submit(render_png, *key)
+        self._inflight[key] = future
+        future.add_done_callback(lambda f: self._store(key, f))
+        return future
+
+    def _store(self, key, future):
+        self._slots.release()
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.exception() is not None:
+                return
+            token = key[0]
+            self._images[key] = future.result()
+            self._by_token.setdefault(token, set()).add(key)
+            while len(self._images) > self.maxsize:
+                old_key, _ = self._images.popitem(last=False)
+                keys = self._by_token.get(old_key[0])
+                if keys is not None:
+                    keys.discard(old_key)
+                    if not keys:
+                        del self._by_token[old_key[0]]
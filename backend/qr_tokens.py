@@ -0,0 +1,383 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam
+
+from eligibility import MEAL_TYPES
+from models import db, MealConsumption, MenuItem, QRToken, Transaction
+
+
+class ReplayCache:
+    """Bounded set of recently redeemed tokens with a per-entry TTL.
+
+    ``claim`` is an atomic check-and-insert, so two scans of the same token
+    racing through one worker are resolved without touching the database.
+    Entries older than ``ttl`` (the token validity window) are dropped, and
+    the oldest entries are evicted once ``maxsize`` is reached.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key):
+        """Record ``key``; return ``False`` if it was already seen within the TTL."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                return False
+            self._entries[key] = now
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def release(self, key):
+        """Forget ``key`` so a scan that failed after claiming can be retried."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        while self._entries:
+            key, seen_at = next(iter(self._entries.items()))
+            if seen_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+
+class VerificationError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+class MealItemLookup:
+    """Menu item served for each meal type, cached per menu version.
+
+    Like :class:`MenuCache`, an entry also expires after the cache's ``ttl``,
+    which bounds how long a menu edit made through another worker goes
+    unnoticed.
+    """
+
+    def __init__(self, menu_cache):
+        self.menu_cache = menu_cache
+        self._items = {}
+
+    def get(self, meal_type):
+        version = self.menu_cache.version
+        cached = self._items.get(meal_type)
+        if (cached is not None and cached[0] == version
+                and time.monotonic() - cached[2] < self.menu_cache.ttl):
+            return cached[1]
+        item = (MenuItem.query
+                .with_entities(MenuItem.id, MenuItem.price)
+                .filter_by(category=meal_type, is_available=True)
+                .order_by(MenuItem.id)
+                .first())
+        self._items[meal_type] = (version, item, time.monotonic())
+        return item
+
+
+def issue_token(user_id, ttl_seconds):
+    now = datetime.utcnow()
+    token = QRToken(
+        user_id=user_id,
+        token=str(uuid.uuid4()),
+        created_at=now,
+        expires_at=now + timedelta(seconds=ttl_seconds)
+    )
+    db.session.add(token)
+    db.session.commit()
+    return token
+
+
+def current_token(user_id, ttl_seconds, min_remaining_seconds=30):
+    """Latest unused token for ``user_id``, issuing a new one when it is about to expire."""
+    cutoff = datetime.utcnow() + timedelta(seconds=min_remaining_seconds)
+    token = (QRToken.query
+             .filter(QRToken.user_id == user_id)
+             .order_by(QRToken.created_at.desc())
+             .first())
+    if token is None or token.used_at is not None or token.expires_at <= cutoff:
+        token = issue_token(user_id, ttl_seconds)
+    return token
+
+
+def rotate_token(user_id, ttl_seconds):
+    """Expire every outstanding token of ``user_id`` and issue a fresh one.
+
+    Returns ``(new_token, revoked_token_strings)``.
+    """
+    now = datetime.utcnow()
+    outstanding = (QRToken.query
+                   .filter(QRToken.user_id == user_id,
+                           QRToken.used_at.is_(None),
+                           QRToken.expires_at > now)
+                   .all())
+    for token in outstanding:
+        token.expires_at = now
+    revoked = [token.token for token in outstanding]
+    return issue_token(user_id, ttl_seconds), revoked
+
+
+def verify_meal(qr_uuid, meal_type, replay_cache, meal_items, eligibility, require_plan=False):
+    """Redeem ``qr_uuid`` for ``meal_type`` and record the consumption.
+
+    The result names the meal plan covering the scan, if any; with
+    ``require_plan`` a scan without one is rejected.
+
+    The token row is marked used with a conditional UPDATE in the same
+    database transaction as the ``Transaction`` and ``MealConsumption``
+    inserts, so a token redeemed through another worker is still rejected.
+    """
+    if not replay_cache.claim(qr_uuid):
+        raise VerificationError('QR code already used', 409)
+
+    try:
+        now = datetime.utcnow()
+        row = (db.session.query(QRToken.id, QRToken.user_id, QRToken.expires_at, QRToken.used_at)
+               .filter(QRToken.token == qr_uuid)
+               .first())
+        if row is None:
+            raise VerificationError('Unknown QR code', 404)
+        if row.used_at is not None:
+            raise VerificationError('QR code already used', 409)
+        if row.expires_at <= now:
+            raise VerificationError('QR code expired', 410)
+
+        plan_id = eligibility.check(row.user_id, meal_type, now)
+        if plan_id is None and require_plan:
+            raise VerificationError(f'No active meal plan covers {meal_type}', 403)
+
+        item = meal_items.get(meal_type)
+        if item is None:
+            raise VerificationError(f'No {meal_type} item available', 404)
+
+        claimed = (QRToken.query
+                   .filter(QRToken.id == row.id, QRToken.used_at.is_(None))
+                   .update({QRToken.used_at: now}, synchronize_session=False))
+        if not claimed:
+            raise VerificationError('QR code already used', 409)
+
+        transaction = Transaction(
+            user_id=row.user_id,
+            amount=item.price,
+            transaction_type='meal',
+            status='completed',
+            created_at=now,
+            updated_at=now
+        )
+        transaction.meal_consumptions.append(MealConsumption(
+            user_id=row.user_id,
+            menu_item_id=item.id,
+            consumed_at=now
+        ))
+        db.session.add(transaction)
+        db.session.flush()
+        # Capture the result before commit expires the instance, so building
+        # the response does not cost another SELECT
+        result = {
+            'user_id': row.user_id,
+            'transaction_id': transaction.id,
+            'meal_plan_id': plan_id,
+            'consumed_at': now.isoformat()
+        }
+        db.session.commit()
+        return result
+    except VerificationError as e:
+        db.session.rollback()
+        # Only a redeemed token stays in the cache; anything else may be retried
+        if e.status_code != 409:
+            replay_cache.release(qr_uuid)
+        raise
+    except Exception:
+        db.session.rollback()
+        replay_cache.release(qr_uuid)
+        raise
+
+
+# How far ahead of the server clock an offline scanner's clock may run
+SCAN_CLOCK_SKEW = timedelta(seconds=60)
+
+
+def parse_scan(scan):
+    """``(qr_uuid, meal_type, scanned_at, device_id)`` of one offline scan.
+
+    ``scanned_at`` is normalized to naive UTC.  Raises ``ValueError``.
+    """
+    if not isinstance(scan, dict):
+        raise ValueError('each scan must be an object')
+    qr_uuid, meal_type, device_id = scan.get('qr_uuid'), scan.get('meal_type'), scan.get('device_id')
+    if not isinstance(qr_uuid, str) or not qr_uuid:
+        raise ValueError('qr_uuid is required')
+    if meal_type not in MEAL_TYPES:
+        raise ValueError('a valid meal_type is required')
+    if not isinstance(device_id, str) or not 0 < len(device_id) <= 64:
+        raise ValueError('device_id is required (at most 64 characters)')
+    try:
+        scanned_at = datetime.fromisoformat(scan['scanned_at'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('scanned_at must be an ISO 8601 timestamp')
+    if scanned_at.tzinfo is not None:
+        scanned_at = scanned_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return qr_uuid, meal_type, scanned_at, device_id
+
+
+def sync_scans(scans, replay_cache, meal_items, eligibility, require_plan=False):
+    """Redeem a batch of scans captured while a counter was offline.
+
+    Returns one result per scan, in order: ``verified`` with the same fields
+    as :func:`verify_meal`, ``duplicate`` for a scan already recorded (by an
+    earlier sync, or earlier in this batch), or ``rejected`` with the error
+    and the status code a live scan would have got.  A scan is judged at its
+    ``scanned_at``: the token must have been valid and a plan must have
+    covered the meal then.
+
+    Tokens, plans and earlier syncs are each looked up with one query for
+    the whole batch.  The tokens are claimed with a conditional UPDATE, as
+    in :func:`verify_meal`, then the transactions and meal consumptions of
+    every verified scan are inserted in the same database transaction.
+    """
+    now = datetime.utcnow()
+    results = [None] * len(scans)
+    parsed = {}
+    first_index = {}
+    for index, scan in enumerate(scans):
+        try:
+            qr_uuid, meal_type, scanned_at, device_id = parse_scan(scan)
+        except ValueError as e:
+            results[index] = _rejected(scan, str(e), 400)
+            continue
+        if qr_uuid in first_index:
+            results[index] = {'status': 'duplicate', 'qr_uuid': qr_uuid,
+                              'duplicate_of': first_index[qr_uuid]}
+            continue
+        first_index[qr_uuid] = index
+        parsed[index] = (qr_uuid, meal_type, scanned_at, device_id)
+
+    claimed = {qr_uuid for qr_uuid in first_index if replay_cache.claim(qr_uuid)}
+    released = claimed
+    try:
+        tokens = {row.token: row for row in
+                  db.session.query(QRToken.id, QRToken.token, QRToken.user_id, QRToken.created_at,
+                                   QRToken.expires_at, QRToken.used_at)
+                  .filter(QRToken.token.in_(list(first_index)))} if first_index else {}
+
+        candidates, synced_before = [], []
+        for index, (qr_uuid, meal_type, scanned_at, device_id) in parsed.items():
+            row = tokens.get(qr_uuid)
+            if row is None:
+                results[index] = _rejected(scans[index], 'Unknown QR code', 404)
+            elif row.used_at is not None and row.used_at == scanned_at:
+                synced_before.append(index)
+            elif row.used_at is not None or qr_uuid not in claimed:
+                results[index] = _rejected(scans[index], 'QR code already used', 409)
+            elif scanned_at > now + SCAN_CLOCK_SKEW or scanned_at < row.created_at:
+                results[index] = _rejected(scans[index], 'scanned_at is outside the QR code validity', 400)
+            elif row.expires_at <= scanned_at:
+                results[index] = _rejected(scans[index], 'QR code expired', 410)
+            else:
+                candidates.append(index)
+
+        plan_ids = eligibility.check_each([(tokens[parsed[index][0]].user_id, parsed[index][1],
+                                            parsed[index][2]) for index in candidates])
+        accepted = []
+        for index, plan_id in zip(candidates, plan_ids):
+            meal_type = parsed[index][1]
+            item = meal_items.get(meal_type)
+            if plan_id is None and require_plan:
+                results[index] = _rejected(scans[index], f'No active meal plan covers {meal_type}', 403)
+            elif item is None:
+                results[index] = _rejected(scans[index], f'No {meal_type} item available', 404)
+            else:
+                accepted.append((index, plan_id, item))
+
+        if accepted:
+            token_table = QRToken.__table__
+            db.session.execute(
+                token_table.update()
+                .where(token_table.c.id == bindparam('token_id'), token_table.c.used_at.is_(None))
+                .values(used_at=bindparam('scanned_at')),
+                [{'token_id': tokens[parsed[index][0]].id, 'scanned_at': parsed[index][2]}
+                 for index, plan_id, item in accepted])
+            # A token redeemed through another worker meanwhile keeps its own used_at
+            used_at = dict(db.session.query(QRToken.id, QRToken.used_at)
+                           .filter(QRToken.id.in_([tokens[parsed[index][0]].id
+                                                   for index, plan_id, item in accepted])))
+            won = []
+            for index, plan_id, item in accepted:
+                if used_at[tokens[parsed[index][0]].id] == parsed[index][2]:
+                    won.append((index, plan_id, item))
+                else:
+                    results[index] = _rejected(scans[index], 'QR code already used', 409)
+            _record_scans(won, parsed, tokens, results, now)
+        db.session.commit()
+        # As with live scans, only redeemed tokens stay in the cache
+        released = {parsed[index][0] for index in parsed if results[index] is not None
+                    and results[index]['status'] == 'rejected' and results[index]['code'] != 409}
+
+        if synced_before:
+            _find_synced(synced_before, parsed, tokens, results)
+        return results
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        for qr_uuid in claimed & released:
+            replay_cache.release(qr_uuid)
+
+
+def _record_scans(accepted, parsed, tokens, results, now):
+    """Insert the transaction and meal consumption of each accepted scan."""
+    transactions = []
+    for index, plan_id, item in accepted:
+        scanned_at = parsed[index][2]
+        transactions.append(Transaction(
+            user_id=tokens[parsed[index][0]].user_id,
+            amount=item.price,
+            transaction_type='meal',
+            status='completed',
+            created_at=scanned_at,
+            updated_at=now
+        ))
+    # Transactions go through the ORM for the stats counters and event
+    # outbox; their ids come back from the flush
+    db.session.add_all(transactions)
+    db.session.flush()
+    consumptions = []
+    for (index, plan_id, item), transaction in zip(accepted, transactions):
+        qr_uuid, meal_type, scanned_at, device_id = parsed[index]
+        consumptions.append({'user_id': transaction.user_id, 'transaction_id': transaction.id,
+                             'menu_item_id': item.id, 'consumed_at': scanned_at,
+                             'device_id': device_id})
+        results[index] = {'status': 'verified', 'qr_uuid': qr_uuid, 'meal_type': meal_type,
+                          'user_id': transaction.user_id, 'transaction_id': transaction.id,
+                          'meal_plan_id': plan_id, 'consumed_at': scanned_at.isoformat()}
+    db.session.execute(MealConsumption.__table__.insert(), consumptions)
+
+
+def _find_synced(indexes, parsed, tokens, results):
+    """Mark scans recorded by an earlier sync as duplicates, with their transaction."""
+    user_ids = {tokens[parsed[index][0]].user_id for index in indexes}
+    times = {parsed[index][2] for index in indexes}
+    recorded = {(row.user_id, row.consumed_at): row.transaction_id for row in
+                db.session.query(MealConsumption.user_id, MealConsumption.consumed_at,
+                                 MealConsumption.transaction_id)
+                .filter(MealConsumption.user_id.in_(user_ids),
+                        MealConsumption.consumed_at.in_(times))}
+    for index in indexes:
+        qr_uuid, meal_type, scanned_at, device_id = parsed[index]
+        results[index] = {'status': 'duplicate', 'qr_uuid': qr_uuid,
+                          'transaction_id': recorded.get((tokens[qr_uuid].user_id, scanned_at))}
+
+
+def _rejected(scan, message, status_code):
+    qr_uuid = scan.get('qr_uuid') if isinstance(scan, dict) else None
+    return {'status': 'rejected', 'qr_uuid': qr_uuid, 'error': message, 'code': status_code}
@@ -0,0 +1,105 @@
+import re
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+
+from models import db, Transaction, User
+
+# Tables that grow with usage; a plan that walks one of them without an
+# index is a regression.  menu_items, stat_counters and the rollup tables
+# stay small enough to scan.
+LARGE_TABLES = {'users', 'transactions', 'meal_consumptions', 'meal_plans', 'qr_tokens',
+                'idempotency_keys', 'events', 'wallets', 'wallet_ledger', 'stock_reservations'}
+SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+
+
+def hot_routes(user_id):
+    """``(caller, method, path, json)`` of the read-only requests the apps make most."""
+    today = datetime.utcnow().date()
+    week = f'start={(today - timedelta(days=6)).isoformat()}&end={today.isoformat()}'
+    return [
+        ('user', 'GET', '/api/menu', None),
+        ('user', 'GET', '/api/menu/search?q=rice', None),
+        ('user', 'GET', '/api/transactions?per_page=20', None),
+        ('user', 'GET', '/api/meals/history?per_page=20', None),
+        ('user', 'GET', '/api/meal-plan', None),
+        ('user', 'GET', '/api/balance', None),
+        ('user', 'GET', '/api/balance/history', None),
+        ('admin', 'GET', '/api/transactions?per_page=50', None),
+        ('admin', 'GET', '/api/transactions?per_page=50&status=completed&type=meal&date_range=week', None),
+        ('admin', 'GET', '/api/users?status=active', None),
+        ('admin', 'GET', '/api/users?search=a&role=user', None),
+        ('admin', 'GET', f'/api/users/{user_id}', None),
+        ('admin', 'GET', '/api/admin/transactions/stats', None),
+        ('admin', 'GET', '/api/admin/reports/sales', None),
+        ('admin', 'POST', '/api/meal-plans/eligibility', {'user_ids': [user_id], 'meal_type': 'lunch'}),
+        ('admin', 'GET', f'/api/admin/export/transactions?{week}', None),
+        ('admin', 'GET', f'/api/admin/export/meal-consumptions?{week}', None),
+    ]
+
+
+def check(app=None):
+    """Run the hot routes and ``EXPLAIN QUERY PLAN`` every SELECT they issue.
+
+    Returns ``[(method, path, sql, plan_detail)]`` for each statement that
+    scans a table in :data:`LARGE_TABLES` without an index.  Needs an app
+    context, a SQLite database, an admin and a regular user.
+    """
+    app = app or current_app._get_current_object()
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('EXPLAIN QUERY PLAN checks need a SQLite database')
+    admin = User.query.filter_by(role='admin').order_by(User.id).first()
+    user_id = (db.session.query(Transaction.user_id).join(User, User.id == Transaction.user_id)
+               .filter(User.role != 'admin').limit(1).scalar()
+               or db.session.query(User.id).filter(User.role != 'admin').limit(1).scalar())
+    if admin is None or user_id is None:
+        raise RuntimeError('The database needs an admin and a regular user')
+    headers = {'admin': _auth(admin), 'user': _auth(db.session.get(User, user_id))}
+
+    client = app.test_client()
+    problems = []
+    for caller, method, path, payload in hot_routes(user_id):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            response = client.open(path, method=method, json=payload, headers=headers[caller])
+            response.get_data()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        if response.status_code >= 500:
+            raise RuntimeError(f'{method} {path} answered {response.status_code}')
+
+        for statement, parameters in statements:
+            for detail in full_scans(statement, parameters):
+                problems.append((method, path, statement, detail))
+    return problems
+
+
+def full_scans(statement, parameters):
+    """Plan lines of ``statement`` that walk a large table without an index."""
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        details = [row[3] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+    scans = []
+    for detail in details:
+        match = SCAN.match(detail)
+        # SQLAlchemy aliases a table as e.g. users_1
+        if (match and re.sub(r'_\d+$', '', match.group(1)) in LARGE_TABLES
+                and 'INDEX' not in match.group(2)):
+            scans.append(detail)
+    return scans
+
+
+def _auth(user):
+    return {'Authorization': f'Bearer {create_access_token(identity=user)}'}
@@ -0,0 +1,184 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from models import (db, DailyItemSales, DailyTransactionTotal, MealConsumption, MenuItem,
+                    RollupWatermark, Transaction)
+
+GRANULARITIES = ('day', 'week')
+
+
+# Incremental rollup
+#
+# Each run finds the days touched since the stored watermark and recomputes
+# those days in full from the source tables, one short write transaction per
+# day.  Recomputing whole days keeps the job idempotent: overlapping runs
+# from several workers, or a run that dies half way, only redo work.
+#
+# meal_consumptions is insert-only, so its watermark is the last id seen.
+# Transactions change status after insert, so theirs is an updated_at
+# cutoff that trails the clock by ROLLUP_LAG_SECONDS, leaving room for
+# writes that stamped updated_at just before a slower commit.  Deleted rows
+# are only picked up by rebuild().
+
+def run():
+    """Bring the rollup tables up to date; returns how many days were recomputed per table."""
+    consumption_days = _sync_consumption_days()
+    transaction_days = _sync_transaction_days()
+    return {'item_sales_days': consumption_days, 'transaction_days': transaction_days}
+
+
+def rebuild():
+    """Drop every rollup row and watermark and recompute from scratch."""
+    DailyItemSales.query.delete(synchronize_session=False)
+    DailyTransactionTotal.query.delete(synchronize_session=False)
+    RollupWatermark.query.delete(synchronize_session=False)
+    db.session.commit()
+    return run()
+
+
+def _sync_consumption_days():
+    watermark = _watermark('meal_consumptions')
+    last_id = watermark.last_id or 0
+    max_id = db.session.query(func.max(MealConsumption.id)).scalar() or 0
+    if max_id <= last_id:
+        return 0
+
+    days = _days(db.session.query(func.date(MealConsumption.consumed_at))
+                 .filter(MealConsumption.id > last_id, MealConsumption.id <= max_id)
+                 .distinct())
+    for day in days:
+        rollup_item_sales(day)
+    watermark.last_id = max_id
+    db.session.commit()
+    return len(days)
+
+
+def _sync_transaction_days():
+    watermark = _watermark('transactions')
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['ROLLUP_LAG_SECONDS'])
+    query = (db.session.query(func.date(Transaction.created_at))
+             .filter(Transaction.updated_at <= cutoff)
+             .distinct())
+    if watermark.last_time is not None:
+        query = query.filter(Transaction.updated_at > watermark.last_time)
+
+    days = _days(query)
+    for day in days:
+        rollup_transactions(day)
+    watermark.last_time = cutoff
+    db.session.commit()
+    return len(days)
+
+
+def rollup_item_sales(day):
+    start, end = _day_bounds(day)
+    rows = (db.session.query(MealConsumption.menu_item_id, MenuItem.category, func.count())
+            .outerjoin(MenuItem, MenuItem.id == MealConsumption.menu_item_id)
+            .filter(MealConsumption.consumed_at >= start, MealConsumption.consumed_at < end)
+            .group_by(MealConsumption.menu_item_id, MenuItem.category)
+            .all())
+    DailyItemSales.query.filter_by(day=day).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DailyItemSales, [
+        {'day': day, 'menu_item_id': item_id, 'category': category, 'quantity': quantity}
+        for item_id, category, quantity in rows
+    ])
+    db.session.commit()
+
+
+def rollup_transactions(day):
+    start, end = _day_bounds(day)
+    rows = (db.session.query(Transaction.transaction_type, Transaction.status,
+                             func.count(), func.coalesce(func.sum(Transaction.amount), 0.0))
+            .filter(Transaction.created_at >= start, Transaction.created_at < end)
+            .group_by(Transaction.transaction_type, Transaction.status)
+            .all())
+    DailyTransactionTotal.query.filter_by(day=day).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DailyTransactionTotal, [
+        {'day': day, 'transaction_type': kind, 'status': status, 'count': count,
+         'amount': round(amount, 2)}
+        for kind, status, count, amount in rows
+    ])
+    db.session.commit()
+
+
+def _watermark(name):
+    watermark = db.session.get(RollupWatermark, name)
+    if watermark is None:
+        watermark = RollupWatermark(name=name)
+        db.session.add(watermark)
+    return watermark
+
+
+def _days(query):
+    # func.date() comes back as an ISO string on SQLite
+    return sorted(value if isinstance(value, date) else date.fromisoformat(value)
+                  for value, in query if value is not None)
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, time())
+    return start, start + timedelta(days=1)
+
+
+# Reports
+
+def report_bounds(args, default_days=30):
+    """``(start, end)`` dates from ``start``/``end`` query args, both inclusive."""
+    end = date.fromisoformat(args['end']) if args.get('end') else datetime.utcnow().date()
+    start = (date.fromisoformat(args['start']) if args.get('start')
+             else end - timedelta(days=default_days - 1))
+    if start > end:
+        raise ValueError('start must not be after end')
+    return start, end
+
+
+def period_start(day, granularity):
+    return day - timedelta(days=day.weekday()) if granularity == 'week' else day
+
+
+def item_sales_report(start, end, granularity='day', category=None, menu_item_id=None):
+    query = (db.session.query(DailyItemSales.day, DailyItemSales.menu_item_id,
+                              DailyItemSales.category, DailyItemSales.quantity)
+             .filter(DailyItemSales.day >= start, DailyItemSales.day <= end))
+    if category:
+        query = query.filter(DailyItemSales.category == category)
+    if menu_item_id is not None:
+        query = query.filter(DailyItemSales.menu_item_id == menu_item_id)
+
+    totals = defaultdict(int)
+    categories = {}
+    for day, item_id, item_category, quantity in query:
+        totals[(period_start(day, granularity), item_id)] += quantity
+        categories[item_id] = item_category
+    names = dict(db.session.query(MenuItem.id, MenuItem.name)
+                 .filter(MenuItem.id.in_(list(categories))))
+    return [{'period': period.isoformat(), 'menu_item_id': item_id, 'name': names.get(item_id),
+             'category': categories[item_id], 'quantity': quantity}
+            for (period, item_id), quantity in sorted(totals.items())]
+
+
+def transaction_report(start, end, granularity='day', transaction_type=None, status=None):
+    query = (db.session.query(DailyTransactionTotal)
+             .filter(DailyTransactionTotal.day >= start, DailyTransactionTotal.day <= end))
+    if transaction_type:
+        query = query.filter(DailyTransactionTotal.transaction_type == transaction_type)
+    if status:
+        query = query.filter(DailyTransactionTotal.status == status)
+
+    totals = defaultdict(lambda: [0, 0.0])
+    for row in query:
+        bucket = totals[(period_start(row.day, granularity), row.transaction_type, row.status)]
+        bucket[0] += row.count
+        bucket[1] += row.amount
+    return [{'period': period.isoformat(), 'transaction_type': kind, 'status': row_status,
+             'count': count, 'amount': round(amount, 2)}
+            for (period, kind, row_status), (count, amount) in sorted(totals.items())]
+
+
+def freshness():
+    """When each rollup source was last processed."""
+    return {row.name: row.updated_at.isoformat() if row.updated_at else None
+            for row in RollupWatermark.query}
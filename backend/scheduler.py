@@ -0,0 +1,46 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """Run ``func`` inside an app context every ``interval`` seconds on a daemon thread.
+
+    Meant for cheap, idempotent maintenance work (reconciling counters,
+    rolling up new rows).  Every gunicorn worker runs its own copy, so jobs
+    must tolerate running concurrently; anything heavier belongs in the CLI
+    command and cron.  With ``run_at_start`` the first run happens as soon
+    as the thread starts instead of after one interval.
+    """
+
+    def __init__(self, name, interval, func, run_at_start=False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_at_start = run_at_start
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name=f'job-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, app):
+        if self.run_at_start:
+            self._run_once(app)
+        while not self._stop.wait(self.interval):
+            self._run_once(app)
+
+    def _run_once(self, app):
+        with app.app_context():
+            try:
+                self.func()
+            except Exception:
+                logger.exception('Periodic job %s failed', self.name)
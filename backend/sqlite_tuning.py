@@ -0,0 +1,59 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from metrics import TimedQueuePool
+
+
+def is_sqlite_file(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """Engine options for ``SQLALCHEMY_ENGINE_OPTIONS``.
+
+    SQLAlchemy 1.4 gives file-based SQLite a ``NullPool``, so every request
+    would open a fresh connection and lose its page cache and mmap.  Under
+    gthread workers a ``QueuePool`` sized to the thread count keeps warm
+    connections around; ``check_same_thread`` must be off for connections to
+    move between threads.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if not is_sqlite_file(config['SQLALCHEMY_DATABASE_URI']):
+        return options
+    # QueuePool that also records checkout wait times for /api/metrics
+    options.setdefault('poolclass', TimedQueuePool)
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    connect_args = options.setdefault('connect_args', {})
+    connect_args.setdefault('check_same_thread', False)
+    connect_args.setdefault('timeout', config['SQLITE_BUSY_TIMEOUT_MS'] / 1000)
+    return options
+
+
+def configure_sqlite(app, engine):
+    """Apply the ``SQLITE_*`` pragmas to every new connection of ``engine``."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    config = app.config
+    file_backed = is_sqlite_file(config['SQLALCHEMY_DATABASE_URI'])
+    pragmas = [
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        # Negative cache_size is in KiB rather than pages
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+    ]
+    if file_backed:
+        pragmas.insert(0, ('journal_mode', config['SQLITE_JOURNAL_MODE']))
+        pragmas.append(('mmap_size', config['SQLITE_MMAP_SIZE']))
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
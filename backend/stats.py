@@ -0,0 +1,192 @@
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, func, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+from models import db, MealPlan, StatCounter, Transaction, User
+
+COUNTER_UPSERT = text(
+    'INSERT INTO stat_counters (name, value, updated_at) VALUES (:name, :delta, :now) '
+    'ON CONFLICT (name) DO UPDATE SET value = stat_counters.value + excluded.value, '
+    'updated_at = excluded.updated_at'
+)
+
+
+# Counter maintenance
+#
+# Mapper events collect per-counter deltas on the session while a flush runs;
+# after_flush then applies them with a single executemany inside the same
+# database transaction, so a rollback discards them together with the rows.
+# Bulk paths that bypass the ORM (bulk_insert_mappings, Query.update) do not
+# fire these events; the periodic reconcile() corrects any such drift.
+
+def _record(target, deltas):
+    session = object_session(target)
+    if session is None:
+        return
+    pending = session.info.setdefault('stat_deltas', Counter())
+    for name, delta in deltas.items():
+        pending[name] += delta
+
+
+def _old_value(target, attr):
+    history = inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attr)
+
+
+def _plan_active(start_date, end_date, now=None):
+    now = now or datetime.utcnow()
+    return start_date is not None and end_date is not None and start_date <= now <= end_date
+
+
+def _transaction_deltas(transaction_type, status, sign):
+    return {
+        'transactions.total': sign,
+        f'transactions.type:{transaction_type}': sign,
+        f'transactions.status:{status}': sign,
+    }
+
+
+@event.listens_for(Transaction, 'after_insert')
+def _transaction_inserted(mapper, connection, target):
+    _record(target, _transaction_deltas(target.transaction_type, target.status, 1))
+
+
+@event.listens_for(Transaction, 'after_update')
+def _transaction_updated(mapper, connection, target):
+    old_type = _old_value(target, 'transaction_type')
+    old_status = _old_value(target, 'status')
+    if (old_type, old_status) == (target.transaction_type, target.status):
+        return
+    deltas = Counter(_transaction_deltas(old_type, old_status, -1))
+    deltas.update(_transaction_deltas(target.transaction_type, target.status, 1))
+    _record(target, deltas)
+
+
+@event.listens_for(Transaction, 'after_delete')
+def _transaction_deleted(mapper, connection, target):
+    _record(target, _transaction_deltas(target.transaction_type, target.status, -1))
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    _record(target, {'users.total': 1, f'users.role:{target.role}': 1})
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+    old_role = _old_value(target, 'role')
+    if old_role != target.role:
+        _record(target, {f'users.role:{old_role}': -1, f'users.role:{target.role}': 1})
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+    _record(target, {'users.total': -1, f'users.role:{target.role}': -1})
+
+
+@event.listens_for(MealPlan, 'after_insert')
+def _meal_plan_inserted(mapper, connection, target):
+    active = _plan_active(target.start_date, target.end_date)
+    _record(target, {'meal_plans.total': 1, 'meal_plans.active': int(active)})
+
+
+@event.listens_for(MealPlan, 'after_update')
+def _meal_plan_updated(mapper, connection, target):
+    was_active = _plan_active(_old_value(target, 'start_date'), _old_value(target, 'end_date'))
+    is_active = _plan_active(target.start_date, target.end_date)
+    if was_active != is_active:
+        _record(target, {'meal_plans.active': int(is_active) - int(was_active)})
+
+
+@event.listens_for(MealPlan, 'after_delete')
+def _meal_plan_deleted(mapper, connection, target):
+    active = _plan_active(target.start_date, target.end_date)
+    _record(target, {'meal_plans.total': -1, 'meal_plans.active': -int(active)})
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_stat_deltas(session, flush_context):
+    pending = session.info.pop('stat_deltas', None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    rows = [{'name': name, 'delta': delta, 'now': now}
+            for name, delta in pending.items() if delta]
+    if rows:
+        session.connection().execute(COUNTER_UPSERT, rows)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stat_deltas(session):
+    session.info.pop('stat_deltas', None)
+
+
+# Reads and reconciliation
+
+def read_counters():
+    """All counters as a dict; the table holds a few dozen rows at most."""
+    return dict(db.session.query(StatCounter.name, StatCounter.value).all())
+
+
+def reconcile():
+    """Recompute every counter from the source tables.
+
+    Corrects drift from bulk writes and meal plans that started or ended
+    since they were last written.  Clearing the table first takes SQLite's
+    write lock, so no increment can commit between the counts and the
+    rewrite.
+    """
+    now = datetime.utcnow()
+    StatCounter.query.delete(synchronize_session=False)
+
+    counts = {
+        'transactions.total': Transaction.query.count(),
+        'users.total': User.query.count(),
+        'meal_plans.total': MealPlan.query.count(),
+        'meal_plans.active': MealPlan.query.filter(MealPlan.start_date <= now,
+                                                   MealPlan.end_date >= now).count(),
+    }
+    grouped = [
+        ('transactions.type', Transaction.transaction_type),
+        ('transactions.status', Transaction.status),
+        ('users.role', User.role),
+    ]
+    for prefix, column in grouped:
+        for value, count in db.session.query(column, func.count()).group_by(column):
+            counts[f'{prefix}:{value}'] = count
+
+    db.session.bulk_insert_mappings(StatCounter, [
+        {'name': name, 'value': value, 'updated_at': now} for name, value in counts.items()
+    ])
+    db.session.commit()
+    return counts
+
+
+def transaction_stats(counters):
+    by_type = _with_prefix(counters, 'transactions.type:')
+    return {
+        'total_transactions': counters.get('transactions.total', 0),
+        'meal_transactions': by_type.get('meal', 0),
+        'recharge_transactions': by_type.get('recharge', 0),
+        'extra_item_transactions': by_type.get('extra', 0) + by_type.get('extra_item', 0),
+        'by_type': by_type,
+        'by_status': _with_prefix(counters, 'transactions.status:'),
+    }
+
+
+def user_stats(counters):
+    return {
+        'total_users': counters.get('users.total', 0),
+        'active_meal_plans': counters.get('meal_plans.active', 0),
+        'total_meal_plans': counters.get('meal_plans.total', 0),
+        'by_role': _with_prefix(counters, 'users.role:'),
+    }
+
+
+def _with_prefix(counters, prefix):
+    return {name[len(prefix):]: value for name, value in counters.items()
+            if name.startswith(prefix)}
@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, case, event, func
+from sqlalchemy.orm import Session
+
+from events import record_menu_events
+from models import db, MenuItem, StockReservation
+
+
+# Stock
+#
+# menu_items.stock counts the portions still free to sell or reserve; NULL
+# means the item is not tracked.  Portions are taken with a conditional
+# UPDATE ... SET stock = stock - :n WHERE stock >= :n: the database orders
+# concurrent writes to the row and an order that finds too few portions
+# left matches nothing, so the last few portions never oversell and nothing
+# is read and locked ahead of the write.  The write that takes the last
+# portion also clears is_available, and giving portions back to an item at
+# zero sets it again.
+#
+# A reservation holds portions for a cart in progress: they leave stock when
+# reserved and come back when the reservation is released, at checkout or
+# once it expires.  Availability changes are written to the event outbox in
+# the same database transaction and invalidate the menu cache after commit.
+#
+# Only checkout takes stock.  Meal scans redeem a meal plan at the counter
+# and leave the counts alone: plan meals are cooked to the plan roster, not
+# sold from the counted portions.
+
+
+class OutOfStock(Exception):
+    def __init__(self, menu_item_ids, remaining):
+        super().__init__('Not enough stock')
+        self.menu_item_ids = menu_item_ids
+        self.remaining = remaining
+
+
+def parse_stock(value):
+    """A stock count from a request or import row: ``None`` (untracked) or an integer >= 0."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        count = value
+    elif isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        count = int(value)
+    else:
+        raise ValueError('stock must be a whole number')
+    if count < 0:
+        raise ValueError('stock must not be negative')
+    return count
+
+
+def set_stock(item, count):
+    """Set ``item``'s stock to ``count`` portions on hand, reserved ones included.
+
+    Reservations stay held and are subtracted from ``count``, so releasing
+    them later brings the item back to ``count``.  When ``count`` no longer
+    covers them they are dropped instead, and those carts compete for what
+    is left at checkout.  The caller commits.
+    """
+    reservations = StockReservation.query.filter(StockReservation.menu_item_id == item.id)
+    held = 0
+    if count is not None:
+        held = (db.session.query(func.coalesce(func.sum(StockReservation.quantity), 0))
+                .filter(StockReservation.menu_item_id == item.id)
+                .scalar())
+    if count is None or held > count:
+        reservations.delete(synchronize_session=False)
+        held = 0
+    item.stock = None if count is None else count - held
+    if item.stock is not None:
+        item.is_available = item.stock > 0
+
+
+def take(quantities):
+    """Take ``{menu_item_id: quantity}`` portions out of stock; untracked items are skipped.
+
+    Returns the ids of the stock-tracked items.  Raises :class:`OutOfStock`
+    naming every item that is short, after which the caller must roll back
+    the portions taken from the others.
+    """
+    table = MenuItem.__table__
+    tracked = [item_id for item_id, in
+               db.session.query(MenuItem.id)
+               .filter(MenuItem.id.in_(list(quantities)), MenuItem.stock.isnot(None))]
+    short = []
+    # In id order, so concurrent carts sharing items write them in the same order
+    for item_id in sorted(tracked):
+        quantity = quantities[item_id]
+        result = db.session.execute(
+            table.update()
+            .where(table.c.id == item_id, table.c.stock >= quantity)
+            .values(stock=table.c.stock - quantity,
+                    is_available=case((table.c.stock > quantity, table.c.is_available),
+                                      else_=False)))
+        if result.rowcount == 0:
+            short.append(item_id)
+    if short:
+        remaining = dict(db.session.query(MenuItem.id, MenuItem.stock).filter(MenuItem.id.in_(short)))
+        raise OutOfStock(short, remaining)
+
+    sold_out = (db.session.query(MenuItem.id, MenuItem.name)
+                .filter(MenuItem.id.in_(tracked), MenuItem.stock == 0)
+                .all()) if tracked else []
+    _availability_changed([(item_id, name, False) for item_id, name in sold_out])
+    return sorted(tracked)
+
+
+def reserve(user_id, quantities, ttl_seconds, now=None):
+    """Hold ``quantities`` for ``user_id``'s cart, replacing what they held before.
+
+    Only available, stock-tracked items are held.  Returns ``(held,
+    expires_at)`` where ``held`` maps those items to the portions reserved.
+    Raises :class:`OutOfStock`; the caller commits or rolls back.
+    """
+    now = now or datetime.utcnow()
+    release(StockReservation.user_id == user_id)
+    available = {item_id for item_id, in
+                 db.session.query(MenuItem.id)
+                 .filter(MenuItem.id.in_(list(quantities)), MenuItem.is_available.is_(True))}
+    held = {item_id: quantity for item_id, quantity in quantities.items() if item_id in available}
+    held = {item_id: held[item_id] for item_id in take(held)} if held else {}
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    db.session.bulk_insert_mappings(StockReservation, [
+        {'user_id': user_id, 'menu_item_id': item_id, 'quantity': quantity,
+         'created_at': now, 'expires_at': expires_at}
+        for item_id, quantity in held.items()
+    ])
+    return held, expires_at
+
+
+def release(condition):
+    """Give back the portions of every reservation matching ``condition`` and delete them.
+
+    Returns how many portions went back to stock.
+    """
+    held = (db.session.query(StockReservation.menu_item_id, func.sum(StockReservation.quantity))
+            .filter(condition)
+            .group_by(StockReservation.menu_item_id)
+            .all())
+    if not held:
+        return 0
+    item_ids = [item_id for item_id, quantity in held]
+    restocked = (db.session.query(MenuItem.id, MenuItem.name)
+                 .filter(MenuItem.id.in_(item_ids), MenuItem.stock == 0)
+                 .all())
+    table = MenuItem.__table__
+    db.session.execute(
+        table.update()
+        .where(table.c.id == bindparam('item_id'))
+        .values(stock=table.c.stock + bindparam('released'),
+                is_available=case((table.c.stock == 0, True), else_=table.c.is_available)),
+        [{'item_id': item_id, 'released': quantity} for item_id, quantity in held])
+    StockReservation.query.filter(condition).delete(synchronize_session=False)
+    _availability_changed([(item_id, name, True) for item_id, name in restocked])
+    return sum(quantity for item_id, quantity in held)
+
+
+def release_expired():
+    """Return the portions of expired reservations to stock (run by a PeriodicJob)."""
+    released = release(StockReservation.expires_at <= datetime.utcnow())
+    db.session.commit()
+    return released
+
+
+def _availability_changed(changes):
+    if changes:
+        record_menu_events(db.session, changes)
+        db.session.info['menu_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_menu(session):
+    if session.info.pop('menu_changed', False):
+        current_app.extensions['menu_cache'].invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_menu_change(session):
+    session.info.pop('menu_changed', None)
@@ -0,0 +1,50 @@
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from eligibility import eligibility
+from identity import user_cache
+from models import db, User
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'canteen.db'}",
+        'ACCESS_LOG_ENABLED': False,
+        'PASSWORD_HASH_EXECUTOR': 'thread',
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    })
+    # The caches are per process; ids repeat across the test databases
+    user_cache.clear()
+    eligibility.clear()
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(username, role='user'):
+        user = User(username=username, email=f'{username}@example.com', name=username.title(),
+                    role=role)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+    return make_user
+
+
+@pytest.fixture
+def auth(app):
+    def auth(user_id):
+        token = create_access_token(identity=db.session.get(User, user_id))
+        return {'Authorization': f'Bearer {token}'}
+    return auth
@@ -0,0 +1,22 @@
+import json
+
+from flask import request
+
+from access_log import _request_body
+
+BODY = json.dumps({'note': 'x' * 1000})
+
+
+def test_unread_body_is_read_only_up_to_the_limit(app):
+    with app.test_request_context('/api/checkout', method='POST', data=BODY,
+                                  content_type='application/json'):
+        assert _request_body(16) == BODY[:16]
+        assert getattr(request, '_cached_data', None) is None
+
+
+def test_body_the_view_read_is_logged_from_its_cache(app):
+    with app.test_request_context('/api/checkout', method='POST', data=BODY,
+                                  content_type='application/json'):
+        request.get_json()
+        assert _request_body(16) == BODY[:16]
+        assert _request_body(4096) == BODY
@@ -0,0 +1,22 @@
+from werkzeug.security import generate_password_hash
+
+from models import db, User
+from password_hashing import HasherBusy
+
+
+def test_login_succeeds_when_the_rehash_is_shed(app, client, make_user, monkeypatch):
+    user = db.session.get(User, make_user('student'))
+    old_hash = generate_password_hash('secret', method='pbkdf2:sha256:500')
+    user.password_hash = old_hash
+    db.session.commit()
+    hasher = app.extensions['password_hasher']
+
+    def busy(password):
+        raise HasherBusy()
+
+    monkeypatch.setattr(hasher, 'hash', busy)
+    response = client.post('/api/auth/login', json={'username': 'student', 'password': 'secret'})
+    assert response.status_code == 200
+    assert 'access_token' in response.get_json()
+    db.session.expire_all()
+    assert db.session.get(User, user.id).password_hash == old_hash
@@ -0,0 +1,83 @@
+import pytest
+
+import checkout as checkout_module
+import wallet
+from models import db, LedgerEntry, MenuItem, Transaction
+
+
+@pytest.fixture
+def shop(client, make_user, auth):
+    """A student with a ₹100 wallet, their auth headers and two menu item ids."""
+    user_id = make_user('student')
+    items = [MenuItem(name='Samosa', price=15, category='snacks'),
+             MenuItem(name='Tea', price=10, category='beverage')]
+    db.session.add_all(items)
+    db.session.commit()
+    wallet.recharge(user_id, wallet.to_minor(100))
+    return user_id, auth(user_id), [item.id for item in items]
+
+
+def buy(client, headers, items, key=None):
+    if key is not None:
+        headers = dict(headers, **{'Idempotency-Key': key})
+    return client.post('/api/checkout', json={'items': items}, headers=headers)
+
+
+@pytest.mark.parametrize('line', [{'menu_item_id': True, 'quantity': 1},
+                                  {'menu_item_id': 1, 'quantity': True},
+                                  True])
+def test_booleans_are_not_item_ids_or_quantities(client, shop, line):
+    user_id, headers, item_ids = shop
+    response = buy(client, headers, [line])
+    assert response.status_code == 400
+    assert Transaction.query.filter_by(transaction_type='extra').count() == 0
+
+
+def test_retry_with_the_same_key_replays_without_charging_again(client, shop):
+    user_id, headers, item_ids = shop
+    first = buy(client, headers, [item_ids[0], item_ids[0]], key='order-1')
+    assert first.status_code == 201
+    retry = buy(client, headers, [item_ids[0], item_ids[0]], key='order-1')
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json()['id'] == first.get_json()['id']
+    assert wallet.balance(user_id) == wallet.to_minor(70)
+
+
+def test_key_reused_for_a_different_cart_is_rejected(client, shop):
+    user_id, headers, item_ids = shop
+    assert buy(client, headers, [item_ids[0]], key='order-1').status_code == 201
+    response = buy(client, headers, [item_ids[1]], key='order-1')
+    assert response.status_code == 422
+    assert wallet.balance(user_id) == wallet.to_minor(85)
+
+
+def test_changed_price_is_reported_and_nothing_is_charged(client, shop):
+    user_id, headers, item_ids = shop
+    response = buy(client, headers, [{'menu_item_id': item_ids[0], 'quantity': 1, 'price': 12}])
+    assert response.status_code == 409
+    assert response.get_json()['prices'] == {str(item_ids[0]): 15}
+    assert wallet.balance(user_id) == wallet.to_minor(100)
+
+
+def test_concurrent_retry_that_loses_the_key_race_replays(client, shop, monkeypatch):
+    user_id, headers, item_ids = shop
+    first = buy(client, headers, [item_ids[1]], key='order-1')
+    assert first.status_code == 201
+
+    # The retry checks for the key before the first request has committed,
+    # then collides with it on the unique constraint
+    find_replay = checkout_module.find_replay
+    calls = []
+
+    def racing_find_replay(*args):
+        calls.append(args)
+        return None if len(calls) == 1 else find_replay(*args)
+
+    monkeypatch.setattr(checkout_module, 'find_replay', racing_find_replay)
+    retry = buy(client, headers, [item_ids[1]], key='order-1')
+    assert len(calls) == 2
+    assert retry.status_code == 200
+    assert retry.get_json()['id'] == first.get_json()['id']
+    assert wallet.balance(user_id) == wallet.to_minor(90)
+    assert LedgerEntry.query.filter_by(user_id=user_id, entry_type='purchase').count() == 1
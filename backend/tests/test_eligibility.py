@@ -0,0 +1,5 @@
+def test_eligibility_rejects_boolean_user_ids(client, make_user, auth):
+    headers = auth(make_user('admin', role='admin'))
+    response = client.post('/api/meal-plans/eligibility',
+                           json={'user_ids': [True], 'meal_type': 'lunch'}, headers=headers)
+    assert response.status_code == 400
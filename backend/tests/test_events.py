@@ -0,0 +1,48 @@
+import events
+from models import db, Event, Transaction
+
+
+def add_transaction(user_id, status='completed'):
+    transaction = Transaction(user_id=user_id, amount=40, transaction_type='extra', status=status)
+    db.session.add(transaction)
+    db.session.commit()
+    return transaction
+
+
+def test_student_cannot_open_the_event_stream(client, make_user, auth):
+    response = client.get('/api/events', headers=auth(make_user('student')))
+    assert response.status_code == 403
+
+
+def test_events_committed_after_subscribing_are_delivered(app, client, make_user, auth):
+    app.config['EVENTS_STREAM_SECONDS'] = 0.2
+    student_id = make_user('student')
+    headers = auth(make_user('admin', role='admin'))
+    add_transaction(student_id)
+
+    response = client.get('/api/events', headers=headers, buffered=False)
+    assert response.status_code == 200
+    transaction = add_transaction(student_id, status='pending')
+    events.broker.poll()
+
+    body = response.get_data(as_text=True)
+    response.close()
+    assert body.count('event: transaction') == 1
+    assert f'"id": {transaction.id}' in body
+    assert events.broker.subscriber_count() == 0
+
+
+def test_reconnect_with_last_event_id_backfills_what_was_missed(app, client, make_user, auth):
+    app.config['EVENTS_STREAM_SECONDS'] = 0
+    student_id = make_user('student')
+    headers = auth(make_user('admin', role='admin'))
+    add_transaction(student_id)
+    seen = db.session.query(db.func.max(Event.id)).scalar()
+    missed = [add_transaction(student_id).id for _ in range(2)]
+
+    response = client.get('/api/events', headers=dict(headers, **{'Last-Event-ID': str(seen)}))
+    body = response.get_data(as_text=True)
+    assert 'event: reset' not in body
+    assert [f'id: {seen + 1}', f'id: {seen + 2}'] == [line for line in body.splitlines()
+                                                      if line.startswith('id: ')]
+    assert all(f'"id": {transaction_id}' in body for transaction_id in missed)
@@ -0,0 +1,48 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event
+
+from forecasting import closed_through_day
+from models import db, MealConsumption, MenuItem, RollupWatermark, Transaction
+
+TODAY = date(2026, 10, 18)
+
+
+def consume(user_id, days_ago):
+    item = MenuItem.query.first()
+    transaction = Transaction(user_id=user_id, amount=10, transaction_type='meal', status='completed')
+    db.session.add(transaction)
+    db.session.flush()
+    consumption = MealConsumption(user_id=user_id, menu_item_id=item.id, transaction_id=transaction.id,
+                                  consumed_at=datetime.combine(TODAY, datetime.min.time())
+                                  - timedelta(days=days_ago) + timedelta(hours=12))
+    db.session.add(consumption)
+    db.session.commit()
+    return consumption.id
+
+
+def test_closed_through_day_is_computed_in_sql(app, make_user):
+    user_id = make_user('student')
+    db.session.add(MenuItem(name='Thali', price=60, category='lunch'))
+    db.session.commit()
+    assert closed_through_day(TODAY) == TODAY - timedelta(days=1)
+
+    consume(user_id, 10)
+    rolled = consume(user_id, 5)
+    consume(user_id, 3)
+    # Nothing rolled up: the day before the earliest consumption
+    assert closed_through_day(TODAY) == TODAY - timedelta(days=11)
+
+    db.session.add(RollupWatermark(name='meal_consumptions', last_id=rolled))
+    db.session.commit()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        assert closed_through_day(TODAY) == TODAY - timedelta(days=4)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert any('min(' in statement.lower() for statement in statements)
@@ -0,0 +1,22 @@
+from sqlalchemy import event
+
+from identity import user_cache
+from models import db
+
+
+def test_invalidation_during_a_lookup_is_not_overwritten(app, make_user):
+    user_id = make_user('student')
+
+    def invalidate_mid_read(conn, cursor, statement, parameters, context, executemany):
+        # The row has been read for caching when the user is updated elsewhere
+        user_cache.invalidate(user_id)
+
+    event.listen(db.engine, 'before_cursor_execute', invalidate_mid_read)
+    try:
+        assert user_cache.get(user_id).username == 'student'
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', invalidate_mid_read)
+    assert user_id not in user_cache._entries
+
+    user_cache.get(user_id)
+    assert user_id in user_cache._entries
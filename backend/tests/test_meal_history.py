@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import db, MealConsumption, MenuItem, Transaction
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def test_history_page_costs_the_same_statements_at_any_size(client, make_user, auth):
+    user_id = make_user('student')
+    items = [MenuItem(name=f'Item {index}', price=10 + index, category='lunch') for index in range(5)]
+    db.session.add_all(items)
+    db.session.flush()
+    now = datetime.utcnow()
+    for index in range(60):
+        transaction = Transaction(user_id=user_id, amount=10, transaction_type='meal',
+                                  status='completed', created_at=now, updated_at=now)
+        transaction.meal_consumptions.append(MealConsumption(
+            user_id=user_id, menu_item_id=items[index % len(items)].id,
+            consumed_at=now - timedelta(minutes=index)))
+        db.session.add(transaction)
+    db.session.commit()
+    headers = auth(user_id)
+    # Warm the identity cache so both measured requests see it populated
+    client.get('/api/meals/history?per_page=1', headers=headers)
+
+    counts = {}
+    for per_page in (1, 50):
+        with count_statements() as statements:
+            response = client.get(f'/api/meals/history?per_page={per_page}', headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()['meals']) == per_page
+        counts[per_page] = len(statements)
+
+    assert counts[1] == counts[50]
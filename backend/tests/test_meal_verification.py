@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from models import db, MenuItem
+from qr_tokens import MealItemLookup, issue_token
+
+
+def test_student_cannot_redeem_a_meal(client, make_user, auth):
+    student = make_user('student')
+    other = make_user('other')
+    qr_uuid = issue_token(other, 300).token
+
+    response = client.post('/api/meal/verify', json={'qr_uuid': qr_uuid, 'meal_type': 'lunch'},
+                           headers=auth(student))
+    assert response.status_code == 403
+
+
+def test_student_cannot_sync_offline_scans(client, make_user, auth):
+    student = make_user('student')
+    qr_uuid = issue_token(make_user('other'), 300).token
+    scan = {'qr_uuid': qr_uuid, 'meal_type': 'lunch', 'scanned_at': datetime.utcnow().isoformat(),
+            'device_id': 'counter-1'}
+
+    response = client.post('/api/meal/verify/batch', json={'scans': [scan]}, headers=auth(student))
+    assert response.status_code == 403
+
+
+def test_admin_redeems_a_meal_once(client, make_user, auth):
+    admin = make_user('admin', role='admin')
+    student = make_user('student')
+    db.session.add(MenuItem(name='Thali', price=60, category='lunch'))
+    db.session.commit()
+    qr_uuid = issue_token(student, 300).token
+
+    response = client.post('/api/meal/verify', json={'qr_uuid': qr_uuid, 'meal_type': 'lunch'},
+                           headers=auth(admin))
+    assert response.status_code == 200
+    assert response.get_json()['user_id'] == student
+
+    response = client.post('/api/meal/verify', json={'qr_uuid': qr_uuid, 'meal_type': 'lunch'},
+                           headers=auth(admin))
+    assert response.status_code == 409
+
+
+def test_meal_item_lookup_expires_after_the_menu_ttl(app, monkeypatch):
+    menu_cache = app.extensions['menu_cache']
+    lookup = MealItemLookup(menu_cache)
+    item = MenuItem(name='Thali', price=60, category='lunch')
+    db.session.add(item)
+    db.session.commit()
+    assert lookup.get('lunch').price == 60
+
+    # A reprice committed by another worker leaves this worker's version alone
+    db.session.execute(MenuItem.__table__.update().values(price=75))
+    db.session.commit()
+    assert lookup.get('lunch').price == 60
+    monkeypatch.setattr(menu_cache, 'ttl', 0)
+    assert lookup.get('lunch').price == 75
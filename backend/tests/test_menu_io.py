@@ -0,0 +1,26 @@
+import pytest
+
+from menu_io import validate_row
+
+
+def test_valid_row():
+    mapping, errors = validate_row({'name': ' Dosa ', 'price': '45.5', 'category': 'breakfast',
+                                    'description': 'Crisp', 'stock': '10'})
+    assert errors == []
+    assert mapping == {'name': 'Dosa', 'description': 'Crisp', 'price': 45.5,
+                       'category': 'breakfast', 'is_available': True, 'stock': 10}
+
+
+@pytest.mark.parametrize('price', ['nan', 'inf', float('-inf'), 0, '-5', True])
+def test_price_must_be_a_positive_finite_number(price):
+    mapping, errors = validate_row({'name': 'Dosa', 'price': price})
+    assert mapping is None
+    assert len(errors) == 1
+
+
+@pytest.mark.parametrize('field', ['description', 'category'])
+@pytest.mark.parametrize('value', [{'a': 1}, ['x'], 12])
+def test_text_fields_reject_other_types(field, value):
+    mapping, errors = validate_row({'name': 'Dosa', 'price': 10, field: value})
+    assert mapping is None
+    assert errors == [f'{field} must be text']
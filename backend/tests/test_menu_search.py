@@ -0,0 +1,13 @@
+from models import db, MenuItem
+
+
+def test_search_limit_is_clamped(client, make_user, auth):
+    db.session.add_all([MenuItem(name=f'Rice bowl {index}', price=40, category='lunch')
+                        for index in range(120)])
+    db.session.commit()
+    headers = auth(make_user('student'))
+
+    for limit, expected in (('-1', 1), ('1000', 100), ('5', 5)):
+        response = client.get(f'/api/menu/search?q=rice&limit={limit}', headers=headers)
+        assert response.status_code == 200
+        assert response.get_json()['total'] == expected
@@ -0,0 +1,13 @@
+def test_metrics_need_an_admin_without_a_token(client, make_user, auth):
+    assert client.get('/api/metrics').status_code == 401
+    assert client.get('/api/metrics', headers=auth(make_user('student'))).status_code == 403
+    response = client.get('/api/metrics', headers=auth(make_user('admin', role='admin')))
+    assert response.status_code == 200
+    assert 'canteen_event_subscribers' in response.get_data(as_text=True)
+
+
+def test_metrics_token_replaces_the_jwt(app, client):
+    app.config['METRICS_TOKEN'] = 'scrape-secret'
+    assert client.get('/api/metrics').status_code == 401
+    response = client.get('/api/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+
+from password_hashing import HasherBusy, PasswordHasher
+
+
+def thread_hasher(timeout):
+    hasher = PasswordHasher()
+    hasher.executor_kind = 'thread'
+    hasher.workers = 1
+    hasher.timeout = timeout
+    return hasher
+
+
+def wait_idle(hasher, seconds=5):
+    # The done callback may run just after result() returns
+    deadline = time.monotonic() + seconds
+    while hasher.metrics()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return hasher.metrics()['pending'] == 0
+
+
+def test_slow_hash_is_busy_and_keeps_its_slot_until_done():
+    hasher = thread_hasher(timeout=0.05)
+    release = threading.Event()
+
+    with pytest.raises(HasherBusy):
+        hasher._run(release.wait, 5)
+    assert hasher.metrics()['pending'] == 1
+    assert hasher.metrics()['shed'] == 1
+
+    release.set()
+    assert wait_idle(hasher)
+
+
+def test_hash_in_pool_releases_its_slot():
+    hasher = thread_hasher(timeout=5)
+    hasher.method = 'pbkdf2:sha256:1000'
+    password_hash = hasher.hash('secret')
+    assert hasher.verify(password_hash, 'secret')
+    assert wait_idle(hasher)
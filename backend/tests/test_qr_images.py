@@ -0,0 +1,24 @@
+import threading
+
+import pytest
+
+import qr_images
+from qr_images import QRImageCache, RendererBusy
+
+
+def test_render_timeout_is_busy_and_the_image_is_still_cached(monkeypatch):
+    release = threading.Event()
+    render = qr_images.render_png
+
+    def slow_render(*key):
+        release.wait(5)
+        return render(*key)
+
+    monkeypatch.setattr(qr_images, 'render_png', slow_render)
+    cache = QRImageCache(workers=1, max_pending=2)
+
+    with pytest.raises(RendererBusy):
+        cache.get('token', 4, 'M', timeout=0.05)
+
+    release.set()
+    assert cache.get('token', 4, 'M', timeout=5).startswith(b'\x89PNG')
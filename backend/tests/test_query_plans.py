@@ -0,0 +1,42 @@
+import pytest
+from flask_migrate import upgrade
+
+from app import MIGRATIONS_DIR, create_app
+from bench.seed import seed
+from eligibility import eligibility
+from identity import user_cache
+from models import db
+import query_plans
+
+
+@pytest.fixture
+def migrated_app(tmp_path):
+    config = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'canteen.db'}",
+        'ACCESS_LOG_ENABLED': False,
+        'PASSWORD_HASH_EXECUTOR': 'thread',
+    }
+    # Migrate and seed as init_db.py would, then start the app on the result
+    setup = create_app(config)
+    with setup.app_context():
+        upgrade(directory=MIGRATIONS_DIR)
+        # Enough rows that the planner's statistics favour the indexes
+        seed(users=300, items=40, transactions=5000, days=30,
+             password_method='pbkdf2:sha256:1000', log=lambda message: None)
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+
+    app = create_app(config)
+    user_cache.clear()
+    eligibility.clear()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_hot_routes_use_indexes(migrated_app):
+    assert query_plans.check(migrated_app) == []
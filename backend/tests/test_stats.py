@@ -0,0 +1,31 @@
+import time
+
+from app import stats_job
+from scheduler import PeriodicJob
+from models import db, User
+
+
+def test_counters_are_reconciled_when_the_worker_starts(app, client, make_user, auth):
+    headers = auth(make_user('admin', role='admin'))
+    # Rows from before the counters existed: written without the ORM events
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'legacy{index}', 'email': f'legacy{index}@example.com',
+         'name': 'Legacy', 'role': 'user', 'token_version': 0}
+        for index in range(3)])
+    db.session.commit()
+    assert client.get('/api/admin/users/stats', headers=headers).get_json()['total_users'] == 1
+
+    # A copy of the app's job, so stopping it leaves the module's job alone
+    job = PeriodicJob(stats_job.name, 3600, stats_job.func, stats_job.run_at_start)
+    job.start(app)
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            db.session.remove()
+            stats = client.get('/api/admin/users/stats', headers=headers).get_json()
+            if stats['total_users'] == 4:
+                break
+            time.sleep(0.02)
+        assert stats['total_users'] == 4
+    finally:
+        job.stop()
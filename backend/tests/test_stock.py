@@ -0,0 +1,49 @@
+from models import db, MenuItem, StockReservation
+
+
+def add_item(stock):
+    item = MenuItem(name='Biryani', price=90, category='lunch', stock=stock)
+    db.session.add(item)
+    db.session.commit()
+    return item.id
+
+
+def test_student_cannot_set_stock(client, make_user, auth):
+    item_id = add_item(10)
+    headers = auth(make_user('student'))
+
+    response = client.put(f'/api/menu/{item_id}', json={'stock': 500}, headers=headers)
+    assert response.status_code == 403
+    response = client.post('/api/menu', json={'name': 'Vada', 'description': None, 'price': 20,
+                                              'category': 'snacks', 'stock': 5}, headers=headers)
+    assert response.status_code == 403
+    assert db.session.get(MenuItem, item_id).stock == 10
+
+
+def test_setting_stock_keeps_reserved_portions_held(client, make_user, auth):
+    item_id = add_item(10)
+    student = auth(make_user('student'))
+    admin = auth(make_user('admin', role='admin'))
+    response = client.put('/api/cart/reservation', json={'items': [{'menu_item_id': item_id, 'quantity': 3}]},
+                          headers=student)
+    assert response.status_code == 200
+
+    response = client.put(f'/api/menu/{item_id}', json={'stock': 20}, headers=admin)
+    assert response.status_code == 200
+    assert response.get_json()['stock'] == 17
+
+    assert client.delete('/api/cart/reservation', headers=student).status_code == 204
+    db.session.expire_all()
+    assert db.session.get(MenuItem, item_id).stock == 20
+
+
+def test_setting_stock_below_the_holds_drops_them(client, make_user, auth):
+    item_id = add_item(10)
+    student = auth(make_user('student'))
+    admin = auth(make_user('admin', role='admin'))
+    client.put('/api/cart/reservation', json={'items': [{'menu_item_id': item_id, 'quantity': 3}]},
+               headers=student)
+
+    response = client.put(f'/api/menu/{item_id}', json={'stock': 2}, headers=admin)
+    assert response.get_json()['stock'] == 2
+    assert StockReservation.query.count() == 0
@@ -0,0 +1,74 @@
+import pytest
+from sqlalchemy import event
+
+import wallet
+from models import db, LedgerEntry, MenuItem, Wallet
+
+
+def test_debit_beyond_the_balance_is_refused(app, make_user):
+    user_id = make_user('student')
+    wallet.recharge(user_id, 5000)
+
+    with pytest.raises(wallet.InsufficientFunds) as refused:
+        wallet.post(user_id, -5001, 'purchase')
+    db.session.rollback()
+    assert (refused.value.balance_minor, refused.value.required_minor) == (5000, 5001)
+    assert wallet.balance(user_id) == 5000
+
+
+def test_debit_rechecks_the_balance_after_losing_a_concurrent_update(app, make_user):
+    user_id = make_user('student')
+    wallet.recharge(user_id, 10000)
+    raced = []
+
+    def concurrent_debit(conn, cursor, statement, parameters, context, executemany):
+        # Another writer spends 60 between our read of the balance and our update
+        if statement.startswith('UPDATE wallets') and not raced:
+            raced.append(True)
+            cursor.connection.execute('UPDATE wallets SET balance_minor = balance_minor - 6000, '
+                                      'version = version + 1 WHERE user_id = ?', (user_id,))
+
+    event.listen(db.engine, 'before_cursor_execute', concurrent_debit)
+    try:
+        with pytest.raises(wallet.InsufficientFunds) as refused:
+            wallet.post(user_id, -6000, 'purchase')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', concurrent_debit)
+    assert refused.value.balance_minor == 4000
+    db.session.rollback()
+
+
+def test_refused_checkout_keeps_its_idempotency_key_free(client, make_user, auth):
+    user_id = make_user('student')
+    headers = dict(auth(user_id), **{'Idempotency-Key': 'order-1'})
+    item = MenuItem(name='Thali', price=60, category='lunch')
+    db.session.add(item)
+    db.session.commit()
+    wallet.recharge(user_id, wallet.to_minor(50))
+
+    response = client.post('/api/checkout', json={'items': [item.id]}, headers=headers)
+    assert response.status_code == 402
+    assert response.get_json()['balance'] == 50
+
+    wallet.recharge(user_id, wallet.to_minor(50))
+    response = client.post('/api/checkout', json={'items': [item.id]}, headers=headers)
+    assert response.status_code == 201
+    response = client.post('/api/checkout', json={'items': [item.id]}, headers=headers)
+    assert response.status_code == 200
+    assert wallet.balance(user_id) == wallet.to_minor(40)
+    assert LedgerEntry.query.filter_by(user_id=user_id, entry_type='purchase').count() == 1
+
+
+def test_only_admins_recharge(client, make_user, auth):
+    student_id = make_user('student')
+    response = client.post('/api/balance/add', json={'user_id': student_id, 'amount': 500},
+                           headers=auth(student_id))
+    assert response.status_code == 403
+    assert db.session.get(Wallet, student_id) is None
+
+    response = client.post('/api/balance/add', json={'user_id': student_id, 'amount': 500},
+                           headers=auth(make_user('admin', role='admin')))
+    assert response.status_code == 200
+    assert response.get_json()['balance_minor'] == 50000
+    response = client.get('/api/balance', headers=auth(student_id))
+    assert response.get_json()['balance'] == 500
@@ -0,0 +1,147 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import Integer, and_, column, event, exists, or_, text
+from sqlalchemy.exc import OperationalError
+
+from fts import ensure_fts_index, fts_table_ddl, has_fts_index, match_expression
+from models import db, MealPlan, User
+from pagination import keyset_paginate, page_args
+import wallet
+
+SEARCH_INDEX_DDL = fts_table_ddl('users_fts', 'users', ('username', 'name', 'email'))
+SEARCH_MATCH = text('SELECT rowid FROM users_fts WHERE users_fts MATCH :match').columns(
+    column('rowid', Integer))
+
+
+class SearchSuperseded(Exception):
+    pass
+
+
+def ensure_search_index(connection):
+    return ensure_fts_index(connection, 'users_fts', SEARCH_INDEX_DDL)
+
+
+class UserDirectory:
+    """Admin user listing with full-text search.
+
+    Each admin's searches are numbered; a newer search from the same admin
+    supersedes older ones still running in this worker: it is interrupted
+    mid-query through SQLite's progress handler and raises
+    :class:`SearchSuperseded`.  Keystrokes are debounced by the page, not
+    here, so no request thread sits idle waiting for the next one.
+    """
+
+    def __init__(self):
+        self.fts = False
+        self._sequence = itertools.count(1)
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        with app.app_context():
+            with db.engine.connect() as connection:
+                self.fts = has_fts_index(connection, 'users_fts')
+        app.extensions['user_directory'] = self
+
+    def list_users(self, args, requester_id):
+        """``(users, pagination)`` for the admin listing, newest users first."""
+        page, per_page, cursor = page_args(args)
+        search = (args.get('search') or '').strip()
+
+        ticket = self._begin(requester_id) if search else None
+        try:
+            query = self.filtered_query(args, search)
+            with self._interrupt_when_superseded(ticket):
+                users, pagination = keyset_paginate(query, User.created_at, User.id,
+                                                    page, per_page, cursor)
+        except OperationalError:
+            if ticket is not None and not self._is_current(ticket):
+                db.session.rollback()
+                raise SearchSuperseded()
+            raise
+        finally:
+            if ticket is not None:
+                self._end(ticket)
+        return self.entries(users), pagination
+
+    def filtered_query(self, args, search=''):
+        query = User.query
+        role = args.get('role', 'all')
+        if role != 'all':
+            query = query.filter(User.role == role)
+
+        status = args.get('status', 'all')
+        if status in ('active', 'inactive'):
+            has_plan = exists().where(and_(MealPlan.user_id == User.id, *_active_plan()))
+            query = query.filter(has_plan if status == 'active' else ~has_plan)
+
+        if search:
+            if self.fts:
+                query = query.filter(User.id.in_(SEARCH_MATCH.bindparams(match=match_expression(search))))
+            else:
+                for term in search.split():
+                    pattern = term.replace('%', r'\%').replace('_', r'\_') + '%'
+                    query = query.filter(or_(User.username.like(pattern, escape='\\'),
+                                             User.name.like(pattern, escape='\\'),
+                                             User.email.like(pattern, escape='\\')))
+        return query
+
+    def entries(self, users):
+        """Directory rows; ``status`` is 'active' while the user has a current meal plan."""
+        ids = [user.id for user in users]
+        active = set()
+        balances = wallet.balances(ids)
+        if ids:
+            active = {row.user_id for row in
+                      db.session.query(MealPlan.user_id)
+                      .filter(MealPlan.user_id.in_(ids), *_active_plan())
+                      .distinct()}
+        return [dict(user.to_dict(), full_name=user.name,
+                     status='active' if user.id in active else 'inactive',
+                     balance=wallet.from_minor(balances.get(user.id, 0)))
+                for user in users]
+
+    def _begin(self, requester_id):
+        ticket = (requester_id, next(self._sequence))
+        with self._lock:
+            self._latest[requester_id] = ticket[1]
+        return ticket
+
+    def _is_current(self, ticket):
+        # Called from the progress handler: a plain dict read, no lock
+        return self._latest.get(ticket[0]) == ticket[1]
+
+    def _end(self, ticket):
+        with self._lock:
+            if self._latest.get(ticket[0]) == ticket[1]:
+                del self._latest[ticket[0]]
+
+    @contextmanager
+    def _interrupt_when_superseded(self, ticket):
+        if ticket is None or db.engine.dialect.name != 'sqlite':
+            yield
+            return
+        raw = db.session.connection().connection.dbapi_connection
+        # A non-zero return makes SQLite abort the running statement
+        raw.set_progress_handler(lambda: not self._is_current(ticket), 1000)
+        try:
+            yield
+        finally:
+            raw.set_progress_handler(None, 0)
+
+
+def _active_plan(now=None):
+    now = now or datetime.utcnow()
+    return MealPlan.start_date <= now, MealPlan.end_date >= now
+
+
+# Migration 0004 creates the index; this covers schemas from ``db.create_all()``
+@event.listens_for(User.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    user_directory.fts = ensure_search_index(connection)
+
+
+user_directory = UserDirectory()
@@ -0,0 +1,111 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import text
+
+from models import db, LedgerEntry, Transaction, Wallet
+
+MINOR_UNITS = 100
+MAX_ATTEMPTS = 5
+
+WALLET_CREATE = text(
+    'INSERT INTO wallets (user_id, balance_minor, version, updated_at) '
+    'VALUES (:user_id, 0, 0, :now) ON CONFLICT (user_id) DO NOTHING'
+)
+
+
+class InsufficientFunds(Exception):
+    def __init__(self, balance_minor, required_minor):
+        super().__init__('Insufficient balance')
+        self.balance_minor = balance_minor
+        self.required_minor = required_minor
+
+
+class WalletConflict(Exception):
+    """The balance kept changing underneath us; the caller may retry."""
+
+
+def to_minor(amount):
+    """``amount`` in rupees (number or numeric string) as integer paise."""
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError('amount must be a number')
+    if not value.is_finite():
+        raise ValueError('amount must be a number')
+    return int((value * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(amount_minor):
+    return amount_minor / MINOR_UNITS
+
+
+def balance(user_id):
+    """Current balance in paise: one primary-key lookup, 0 without a wallet."""
+    return (db.session.query(Wallet.balance_minor)
+            .filter(Wallet.user_id == user_id)
+            .scalar()) or 0
+
+
+def balances(user_ids):
+    """``{user_id: balance_minor}`` for many users with one ``IN (...)`` query."""
+    if not user_ids:
+        return {}
+    rows = (db.session.query(Wallet.user_id, Wallet.balance_minor)
+            .filter(Wallet.user_id.in_(list(user_ids))))
+    return dict(rows)
+
+
+def post(user_id, amount_minor, entry_type, transaction_id=None, now=None):
+    """Apply a signed ``amount_minor`` to the user's balance and append the ledger entry.
+
+    Runs in the caller's database transaction and does not commit, so the
+    balance, the ledger entry and whatever they pay for land together.
+    The balance row is updated with a compare-and-set on ``version``: if
+    another writer got in between our read and our update the update
+    matches no row, and we re-read and try again.  A debit that would take
+    the balance below zero raises :class:`InsufficientFunds`.
+    """
+    now = now or datetime.utcnow()
+    db.session.execute(WALLET_CREATE, {'user_id': user_id, 'now': now})
+    for _ in range(MAX_ATTEMPTS):
+        current, version = (db.session.query(Wallet.balance_minor, Wallet.version)
+                            .filter(Wallet.user_id == user_id)
+                            .one())
+        new_balance = current + amount_minor
+        if amount_minor < 0 and new_balance < 0:
+            raise InsufficientFunds(current, -amount_minor)
+        updated = (Wallet.query
+                   .filter(Wallet.user_id == user_id, Wallet.version == version)
+                   .update({Wallet.balance_minor: new_balance,
+                            Wallet.version: version + 1,
+                            Wallet.updated_at: now}, synchronize_session=False))
+        if updated:
+            db.session.add(LedgerEntry(user_id=user_id, entry_type=entry_type,
+                                       amount_minor=amount_minor,
+                                       balance_after_minor=new_balance,
+                                       transaction_id=transaction_id, created_at=now))
+            return new_balance
+    raise WalletConflict()
+
+
+def recharge(user_id, amount_minor):
+    """Credit the wallet with a completed ``recharge`` transaction; returns ``(transaction, balance)``."""
+    now = datetime.utcnow()
+    try:
+        transaction = Transaction(
+            user_id=user_id,
+            amount=from_minor(amount_minor),
+            transaction_type='recharge',
+            status='completed',
+            created_at=now,
+            updated_at=now
+        )
+        db.session.add(transaction)
+        db.session.flush()
+        new_balance = post(user_id, amount_minor, 'recharge', transaction.id, now)
+        db.session.commit()
+        return transaction, new_balance
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,4 @@
+from app import create_app, start_background_jobs
+
+app = create_app()
+start_background_jobs(app)